@@ -1,37 +1,110 @@
 from __future__ import annotations
 
-import shutil
-from datetime import datetime
+from itertools import chain
+from typing import Iterator
 
 import pandas as pd
 import streamlit as st
 
-from video_splicer.artifact import build_download_artifact, collect_work_dirs
+from video_splicer.artifact_store import ArtifactStore, get_artifact_store
+from video_splicer.batch_job import BatchJob
 from video_splicer.config import load_config, validate_runtime
-from video_splicer.input_parser import (
-    assign_output_filenames,
-    parse_split_inputs_with_errors,
-)
-from video_splicer.models import ParseFailure, TaskResult
-from video_splicer.runner import process_batch
-
-
-def _failure_to_result(failure: ParseFailure) -> TaskResult:
-    return TaskResult(
-        index=failure.index,
-        pid=failure.pid_raw,
-        output_filename="",
-        status="FAILED",
-        error=failure.error,
-        duration_sec=0.0,
-        output_path=None,
+from video_splicer.download_panel import render_download
+from video_splicer.execution_service import format_queue_status, get_execution_service
+from video_splicer.input_parser import iter_split_inputs
+from video_splicer.models import InputRow, ParseFailure
+from video_splicer.metrics import ensure_metrics_server
+from video_splicer.planner import estimate_batch, load_model
+from video_splicer.warmup import format_startup, record_startup, start_warmup
+
+
+RESULT_TABLE_COLUMNS = [
+    "pid",
+    "output_filename",
+    "status",
+    "error",
+    "duration_sec",
+    "encode_policy",
+]
+
+
+def _results_table(job: BatchJob) -> pd.DataFrame:
+    # 结果行数变化时才重新取视图，轮询刷新时复用上一次的 DataFrame；
+    # 处理中直接引用结果存储的列数组（按完成顺序），结束后按输入顺序排一次
+    cached = st.session_state.get("sp_table_cache")
+    count = job.completed_count()
+    if cached is not None and cached[0] is job and cached[1] == (count, job.done):
+        return cached[2]
+    table = job.result_store.frame(["index", *RESULT_TABLE_COLUMNS])
+    if job.done:
+        table = table.sort_values("index", kind="stable", ignore_index=True)
+    st.session_state["sp_table_cache"] = (job, (count, job.done), table)
+    return table
+
+
+def _render_job(job: BatchJob) -> None:
+    done = job.completed_count()
+    st.progress(1.0 if job.total == 0 else min(done / job.total, 1.0))
+    if job.done:
+        st.caption(f"已完成 {done}/{job.total}")
+    elif job.cancel_requested:
+        st.caption(f"正在取消 {done}/{job.total}，等待进行中的任务停止")
+    else:
+        total_text = f"{job.total}" if job.input_exhausted else f"{job.total}+（仍在读取输入）"
+        st.caption(f"处理中 {done}/{total_text}，已完成的行会实时出现在结果表中")
+        eta_text = job.eta_text()
+        if eta_text:
+            st.caption(eta_text)
+        queue_status = job.queue_status()
+        if queue_status is not None:
+            st.caption(format_queue_status(queue_status))
+
+    st.subheader("结果表")
+    st.dataframe(
+        _results_table(job),
+        use_container_width=True,
+        column_order=RESULT_TABLE_COLUMNS,
+        column_config={"duration_sec": st.column_config.NumberColumn(format="%.3f")},
     )
 
+    st.subheader("实时日志")
+    # 只有总线里出现新日志时才重新拼接文本
+    delta = job.bus.poll(force=job.done)
+    if (delta is not None and delta.new_lines) or "sp_log_text" not in st.session_state:
+        st.session_state["sp_log_text"] = "\n".join(job.bus.lines(last=200))
+    st.code(st.session_state["sp_log_text"] or "(无日志)")
+
+    if not job.done and st.button("取消批次", key="sp_cancel", disabled=job.cancel_requested):
+        job.cancel()
+
+
+def _render_downloads(job: BatchJob, store: ArtifactStore) -> None:
+    # 下载区放在轮询局部之外，只在整页重跑（用户操作或批次结束）时渲染
+    if job.done:
+        # 部分产物在批次结束时已删除，会话里准备好的标记也一并清除
+        st.session_state.pop("sp_partial_prepared", None)
+        if job.artifact_id:
+            render_download(store, job.artifact_id, key="sp_final")
+        return
+
+    # 批次进行中也可以先下载已完成的部分输出
+    if st.button("打包已完成的结果", key="sp_partial_build"):
+        st.session_state["sp_partial_id"] = job.build_partial_artifact()
+    partial_id = st.session_state.get("sp_partial_id")
+    if partial_id and partial_id == job.partial_artifact_id:
+        render_download(store, partial_id, key="sp_partial")
+
 
 st.set_page_config(page_title="视频拼接工具", layout="wide")
 st.title("Python + Streamlit 视频拼接工具")
 
 config = load_config()
+record_startup("first_render")
+# 启动器已经开始预热时这里直接返回；直接 streamlit run 时从首次渲染开始预热
+start_warmup(config)
+artifact_store = get_artifact_store(config)
+ensure_metrics_server(config)
+execution_service = get_execution_service(config)
 
 st.caption(
     "当前配置: "
@@ -39,9 +112,16 @@ st.caption(
     f"max_video_mb={config.max_video_mb} | "
     f"max_workers={config.max_workers} | "
     f"task_timeout_sec={config.task_timeout_sec} | "
-    f"download_retries={config.download_retries}"
+    f"download_retries={config.download_retries} | "
+    f"engine={config.engine} | "
+    f"preset={config.x264_preset}"
+    + (f" | profile={config.profile_path}" if config.profile_path else "")
 )
 
+startup = format_startup()
+if startup:
+    st.caption(startup)
+
 runtime_errors = validate_runtime(config)
 if runtime_errors:
     st.error("运行前置检查未通过：\n- " + "\n- ".join(runtime_errors))
@@ -55,6 +135,8 @@ with st.expander("输入说明", expanded=False):
                 "- 上传 Excel 时自动读取列：`商品id`、`视频链接`（空链接行自动忽略）",
                 "- 仅支持公开 `http/https` 链接",
                 "- 输出文件按输入顺序命名为 `1.mp4`、`2.mp4`、`3.mp4`...",
+                "- 上传文件可选列 `落版`（CSV 为 `endcard`）：填写落版目录中的文件名（不含扩展名），"
+                "留空使用默认落版",
             ]
         )
     )
@@ -83,116 +165,79 @@ uploaded_file = st.file_uploader(
     type=["csv", "xlsx", "xlsm"],
 )
 
-if "sp_results" not in st.session_state:
-    st.session_state["sp_results"] = None
-if "sp_logs" not in st.session_state:
-    st.session_state["sp_logs"] = []
-if "sp_download" not in st.session_state:
-    st.session_state["sp_download"] = None
+if "sp_job" not in st.session_state:
+    st.session_state["sp_job"] = None
 
 
-start_clicked = st.button("开始处理", type="primary")
-
-if start_clicked:
-    st.session_state["sp_results"] = None
-    st.session_state["sp_logs"] = []
-    st.session_state["sp_download"] = None
-
-    progress_box = st.progress(0)
-    log_box = st.empty()
-    logs: list[str] = []
-
-    def log_cb(message: str) -> None:
-        ts = datetime.now().strftime("%H:%M:%S")
-        logs.append(f"[{ts}] {message}")
-        log_box.code("\n".join(logs[-200:]))
-
-    def progress_cb(done: int, total: int) -> None:
-        ratio = 1.0 if total == 0 else done / total
-        progress_box.progress(min(max(ratio, 0.0), 1.0))
-
+def _read_items() -> Iterator[InputRow | ParseFailure]:
     upload_bytes = uploaded_file.getvalue() if uploaded_file else None
     upload_name = uploaded_file.name if uploaded_file else None
-    rows, parse_failures = parse_split_inputs_with_errors(
+    return iter_split_inputs(
         pid_text=pid_input,
         video_url_text=video_url_input,
         upload_file_name=upload_name,
         upload_bytes=upload_bytes,
     )
 
-    if not rows and not parse_failures:
+
+current_job: BatchJob | None = st.session_state["sp_job"]
+start_col, estimate_col = st.columns([1, 1])
+with start_col:
+    start_clicked = st.button(
+        "开始处理",
+        type="primary",
+        disabled=current_job is not None and not current_job.done,
+    )
+with estimate_col:
+    estimate_clicked = st.button("预估耗时")
+
+if estimate_clicked:
+    # 只数出有效行，按本机历史的中位数估算；开始处理后预检拿到大小会再估一次
+    model = load_model(config)
+    rows = sum(1 for item in _read_items() if isinstance(item, InputRow))
+    if model is None:
+        st.info("本机历史任务不足，暂时无法预估；完成几个批次后即可使用。")
+    elif rows == 0:
         st.warning("请输入至少一条有效数据。")
     else:
-        failure_results = [_failure_to_result(item) for item in parse_failures]
-
-        processed_results: list[TaskResult] = []
-        if rows:
-            if runtime_errors:
-                file_map = assign_output_filenames(rows)
-                error_message = "; ".join(runtime_errors)
-                processed_results = [
-                    TaskResult(
-                        index=row.index,
-                        pid=row.pid_raw,
-                        output_filename=file_map[row.index],
-                        status="FAILED",
-                        error=error_message,
-                        duration_sec=0.0,
-                        output_path=None,
-                    )
-                    for row in rows
-                ]
-                log_cb("运行前置检查失败，已跳过处理")
-                progress_cb(len(rows), len(rows))
-            else:
-                processed_results = process_batch(
-                    rows=rows,
-                    config=config,
-                    log_cb=log_cb,
-                    progress_cb=progress_cb,
-                )
-        else:
-            progress_cb(1, 1)
-
-        all_results = sorted(failure_results + processed_results, key=lambda item: item.index)
-        mime, file_name, payload = build_download_artifact(all_results)
-
-        for work_dir in collect_work_dirs(processed_results):
-            shutil.rmtree(work_dir, ignore_errors=True)
-
-        st.session_state["sp_results"] = all_results
-        st.session_state["sp_logs"] = logs
-        st.session_state["sp_download"] = {
-            "mime": mime,
-            "file_name": file_name,
-            "data": payload,
-        }
-
-if st.session_state.get("sp_results") is not None:
-    results: list[TaskResult] = st.session_state["sp_results"]
-    logs = st.session_state.get("sp_logs", [])
-    download_obj = st.session_state.get("sp_download")
+        st.info(estimate_batch(model, [None] * rows, config).describe())
 
-    st.subheader("结果表")
-    table_rows = [
-        {
-            "pid": item.pid,
-            "output_filename": item.output_filename,
-            "status": item.status,
-            "error": item.error,
-            "duration_sec": round(item.duration_sec, 3),
-        }
-        for item in results
-    ]
-    st.dataframe(pd.DataFrame(table_rows), use_container_width=True)
+if start_clicked:
+    # 输入边解析边处理：批次线程按需读取，大文件不必等全部解析完才开始下载
+    items = _read_items()
+    first_item = next(items, None)
 
-    st.subheader("实时日志")
-    st.code("\n".join(logs[-500:]) if logs else "(无日志)")
-
-    if download_obj:
-        st.download_button(
-            label=f"下载结果：{download_obj['file_name']}",
-            data=download_obj["data"],
-            file_name=download_obj["file_name"],
-            mime=download_obj["mime"],
+    if first_item is None:
+        st.warning("请输入至少一条有效数据。")
+    else:
+        # 批次在后台线程运行，页面轮询展示进度；会话里只保存任务对象和产物 ID
+        current_job = BatchJob(
+            rows=chain([first_item], items),
+            failure_results=[],
+            config=config,
+            artifact_store=artifact_store,
+            runtime_errors=runtime_errors,
+            execution_service=execution_service,
         )
+        current_job.start()
+        st.session_state["sp_job"] = current_job
+        st.session_state["sp_partial_id"] = None
+        st.session_state.pop("sp_log_text", None)
+        for prepared_key in ("sp_final_prepared", "sp_partial_prepared"):
+            st.session_state.pop(prepared_key, None)
+
+if current_job is not None:
+    if current_job.done:
+        _render_job(current_job)
+    else:
+
+        @st.fragment(run_every=current_job.bus.flush_interval_sec)
+        def _poll_job() -> None:
+            job: BatchJob = st.session_state["sp_job"]
+            if job.done:
+                # 批次结束后整页重跑一次，停止轮询并展示最终下载
+                st.rerun()
+            _render_job(job)
+
+        _poll_job()
+    _render_downloads(current_job, artifact_store)
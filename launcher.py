@@ -12,9 +12,15 @@ import os
 import sys
 import threading
 import time
+import urllib.request
 import webbrowser
 from pathlib import Path
 
+# 与 video_splicer.warmup.LAUNCH_ENV 一致；启动器主线程不导入本包，以免拖慢 Streamlit 起服务
+LAUNCH_ENV = "SP_LAUNCH_STARTED_AT"
+READY_TIMEOUT_SEC = 60.0
+READY_POLL_SEC = 0.1
+
 
 def _get_base_path() -> Path:
     """获取资源根目录（兼容 PyInstaller 打包环境和开发环境）"""
@@ -34,15 +40,50 @@ def _setup_environment(base_path: Path) -> None:
         os.environ["SP_ENDCARD_PATH"] = str(endcard)
 
 
-def _open_browser_later(url: str, delay: float = 4.0) -> None:
-    """后台线程延迟打开浏览器"""
+def _wait_until_ready(url: str, timeout: float = READY_TIMEOUT_SEC) -> bool:
+    """轮询 Streamlit 健康检查接口，服务可以响应页面请求时返回 True，超时返回 False"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=1.0) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(READY_POLL_SEC)
+    return False
+
+
+def _open_browser_when_ready(url: str, started_at: float) -> None:
+    """后台线程等服务就绪后打开浏览器；超时也照常打开，由页面显示连接错误"""
     def _open():
-        time.sleep(delay)
+        ready = _wait_until_ready(url)
+        elapsed = time.time() - started_at
         webbrowser.open(url)
+        if ready:
+            print(f"服务就绪，用时 {elapsed:.2f} 秒")
+            from video_splicer.warmup import record_startup
+            record_startup("server_ready", elapsed)
+        else:
+            print(f"等待服务就绪超时（{READY_TIMEOUT_SEC:.0f} 秒），已直接打开浏览器")
     threading.Thread(target=_open, daemon=True).start()
 
 
+def _prewarm_later() -> None:
+    """后台线程预热：导入本包及其重量级依赖、运行前置检查、探测落版"""
+    def _prewarm():
+        started_at = time.perf_counter()
+        from video_splicer.warmup import start_warmup
+        print(f"导入 video_splicer 用时 {time.perf_counter() - started_at:.2f} 秒")
+        warmup = start_warmup()
+        warmup.done.wait()
+        print(warmup.describe())
+    threading.Thread(target=_prewarm, daemon=True).start()
+
+
 def main() -> None:
+    started_at = time.time()
+    os.environ[LAUNCH_ENV] = str(started_at)
     base_path = _get_base_path()
     _setup_environment(base_path)
 
@@ -53,8 +94,9 @@ def main() -> None:
 
     port = "8501"
 
-    # 后台打开浏览器
-    _open_browser_later(f"http://localhost:{port}")
+    # 后台预热，并在服务就绪后打开浏览器
+    _prewarm_later()
+    _open_browser_when_ready(f"http://localhost:{port}", started_at)
 
     # 构造 Streamlit CLI 参数（在同一进程内调用，无需 subprocess）
     sys.argv = [
@@ -4,7 +4,7 @@ import re
 import zipfile
 from pathlib import Path
 
-from video_splicer.artifact import build_download_artifact
+from video_splicer.artifact import build_download_artifact, write_download_artifact
 from video_splicer.models import TaskResult
 
 
@@ -89,3 +89,38 @@ def test_multiple_rows_return_zip_with_mp4_and_result_csv(tmp_path: Path) -> Non
         assert names == ["a.mp4", "result.csv"]
         assert archive.read("a.mp4") == b"video"
         assert b"download error" in archive.read("result.csv")
+
+
+def test_write_download_artifact_streams_zip_to_disk(tmp_path: Path) -> None:
+    output_path = tmp_path / "a.mp4"
+    output_path.write_bytes(b"video")
+
+    results = [
+        TaskResult(
+            index=0,
+            pid="a",
+            output_filename="1.mp4",
+            status="SUCCESS",
+            error="",
+            duration_sec=1.0,
+            output_path=output_path,
+        ),
+        TaskResult(
+            index=1,
+            pid="b",
+            output_filename="2.mp4",
+            status="FAILED",
+            error="download error",
+            duration_sec=0.2,
+            output_path=None,
+        ),
+    ]
+
+    mime, name, path = write_download_artifact(results, tmp_path / "staging")
+
+    assert mime == "application/zip"
+    assert re.fullmatch(r"results-\d{2}-\d{2}-\d{2}-\d{2}\.zip", name)
+    with zipfile.ZipFile(path) as archive:
+        assert sorted(archive.namelist()) == ["1.mp4", "result.csv"]
+        assert archive.read("1.mp4") == b"video"
+    assert output_path.exists()
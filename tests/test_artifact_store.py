@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from video_splicer.artifact_store import ArtifactStore
+
+
+def _put(store: ArtifactStore, tmp_path: Path, name: str, size: int) -> str:
+    source = tmp_path / f"{name}.src"
+    source.write_bytes(b"x" * size)
+    return store.put_file(source, mime="video/mp4", file_name=f"{name}.mp4")
+
+
+def test_put_moves_file_and_reads_back_by_id(tmp_path: Path) -> None:
+    store = ArtifactStore(root=tmp_path / "store", ttl_sec=60, max_total_bytes=0)
+    source = tmp_path / "a.zip"
+    source.write_bytes(b"payload")
+
+    artifact_id = store.put_file(source, mime="application/zip", file_name="results.zip")
+
+    assert not source.exists()
+    stored = store.get(artifact_id)
+    assert stored is not None
+    assert stored.file_name == "results.zip"
+    assert stored.size_bytes == 7
+    assert store.read_bytes(artifact_id) == b"payload"
+
+
+def test_expired_artifacts_are_removed(tmp_path: Path) -> None:
+    now = [1000.0]
+    store = ArtifactStore(
+        root=tmp_path / "store", ttl_sec=60, max_total_bytes=0, clock=lambda: now[0]
+    )
+    artifact_id = _put(store, tmp_path, "a", 10)
+
+    now[0] += 61
+
+    assert store.get(artifact_id) is None
+    assert list((tmp_path / "store").glob("*.bin")) == []
+
+
+def test_size_cap_evicts_least_recently_used(tmp_path: Path) -> None:
+    now = [1000.0]
+    store = ArtifactStore(
+        root=tmp_path / "store", ttl_sec=0, max_total_bytes=250, clock=lambda: now[0]
+    )
+    first = _put(store, tmp_path, "a", 100)
+    now[0] += 1
+    second = _put(store, tmp_path, "b", 100)
+    now[0] += 1
+    assert store.get(first) is not None
+
+    now[0] += 1
+    third = _put(store, tmp_path, "c", 100)
+
+    assert store.get(second) is None
+    assert store.get(first) is not None
+    assert store.get(third) is not None
+
+
+def test_unknown_or_malformed_ids_return_none(tmp_path: Path) -> None:
+    store = ArtifactStore(root=tmp_path / "store", ttl_sec=60, max_total_bytes=0)
+
+    assert store.get("missing") is None
+    assert store.get("../etc/passwd") is None
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import pytest
+
+from video_splicer import async_runner, endcard_pool, runner
+from video_splicer.async_runner import process_batch_async
+from video_splicer.execution_service import ExecutionService
+from video_splicer.ffmpeg_pipeline import EncodePolicy, VideoProbe
+from video_splicer.models import Config, InputRow, TaskResult
+
+ENDCARD_PROBE = VideoProbe(
+    width=720,
+    height=1280,
+    duration_sec=3.0,
+    has_audio=True,
+    video_bitrate=1_000_000,
+    audio_bitrate=128_000,
+    format_bitrate=1_200_000,
+    frame_rate=30.0,
+)
+
+
+class _VideoServer(ThreadingHTTPServer):
+    # /<n>.mp4 返回内容 "video <n>"，其它路径 404；记录同时在途的请求数峰值
+    daemon_threads = True
+
+    def __init__(self, delay_sec: float) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.delay_sec = delay_sec
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _VideoServer
+
+    def do_GET(self) -> None:  # noqa: N802
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            time.sleep(server.delay_sec)
+            name = self.path.lstrip("/")
+            if not name.removesuffix(".mp4").isdigit():
+                self.send_error(404)
+                return
+            body = f"video {name.removesuffix('.mp4')}".encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+class _Encoder:
+    # 代替 ffmpeg：输出 = 源文件内容 + 落版名，记录同时在编码的任务数峰值
+    def __init__(self, delay_sec: float = 0.0) -> None:
+        self.delay_sec = delay_sec
+        self.active = 0
+        self.peak = 0
+        self.timeouts: list[float] = []
+
+    def _write(self, source_video: Path, endcard_video: Path, output_video: Path) -> EncodePolicy:
+        output_video.write_bytes(source_video.read_bytes() + b"|" + endcard_video.name.encode())
+        return EncodePolicy(
+            rate_control="bitrate",
+            video_bitrate=726_000,
+            audio_bitrate=128_000,
+            output_duration_sec=7.0,
+            source_duration_sec=4.0,
+            output_width=720,
+            output_height=1280,
+        )
+
+    def encode(
+        self, source_video: Path, endcard_video: Path, output_video: Path, **kwargs: object
+    ) -> EncodePolicy:
+        self.timeouts.append(kwargs["timeout_sec"])
+        return self._write(source_video, endcard_video, output_video)
+
+    async def encode_async(
+        self, source_video: Path, endcard_video: Path, output_video: Path, **kwargs: object
+    ) -> EncodePolicy:
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay_sec)
+            return self._write(source_video, endcard_video, output_video)
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def serve() -> Iterator:
+    servers: list[_VideoServer] = []
+
+    def start(delay_sec: float = 0.0) -> _VideoServer:
+        server = _VideoServer(delay_sec)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def encoder(monkeypatch: pytest.MonkeyPatch) -> _Encoder:
+    stub = _Encoder()
+    monkeypatch.setattr(runner, "encode_with_endcard", stub.encode)
+    monkeypatch.setattr(async_runner, "encode_with_endcard_async", stub.encode_async)
+    monkeypatch.setattr(endcard_pool, "probe_video", lambda path, cancel_token=None: ENDCARD_PROBE)
+    monkeypatch.setattr(endcard_pool, "_probe_cache", {})
+    return stub
+
+
+def _rows(server: _VideoServer, names: list[str]) -> list[InputRow]:
+    port = server.server_address[1]
+    return [
+        InputRow(
+            index=i,
+            pid_raw=f"p{i}",
+            pid_sanitized=f"p{i}",
+            video_url=f"http://127.0.0.1:{port}/{name}",
+        )
+        for i, name in enumerate(names)
+    ]
+
+
+def _config(tmp_path: Path, **overrides: object) -> Config:
+    tmp_path.mkdir(exist_ok=True)
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"endcard")
+    return Config(
+        endcard_path=endcard,
+        spool_dir=tmp_path / "spool",
+        download_retries=0,
+        **{"max_workers": 2, "max_downloads": 3, **overrides},
+    )
+
+
+def _summary(results: Iterable[TaskResult]) -> list[tuple]:
+    # 错误信息来自各自的 HTTP 客户端（requests / aiohttp），措辞不同，不参与比较
+    return [
+        (
+            item.index,
+            item.pid,
+            item.output_filename,
+            item.status,
+            item.encode_policy,
+            item.output_duration_sec,
+            item.output_path.read_bytes() if item.status == "SUCCESS" else None,
+        )
+        for item in results
+    ]
+
+
+def test_async_engine_matches_the_thread_engine(
+    tmp_path: Path, serve, encoder: _Encoder  # noqa: ANN001
+) -> None:
+    server = serve()
+    rows = _rows(server, ["0.mp4", "1.mp4", "missing", "3.mp4", "4.mp4"])
+
+    threaded_log: list[str] = []
+    threaded = runner.process_batch(rows, _config(tmp_path / "thread"), log_cb=threaded_log.append)
+    async_log: list[str] = []
+    pipelined = process_batch_async(
+        rows, _config(tmp_path / "asyncio", engine="asyncio"), log_cb=async_log.append
+    )
+
+    assert _summary(pipelined.iter_results()) == _summary(threaded.iter_results())
+    assert [item.status for item in pipelined.iter_results()] == ["SUCCESS"] * 2 + ["FAILED"] + ["SUCCESS"] * 2
+    assert pipelined.get(0).output_path.read_bytes() == b"video 0|endcard.mp4"
+    assert "404" in pipelined.get(2).error and "404" in threaded.get(2).error
+    # 两个引擎每行各报告一次，完成顺序可能不同
+    for log in (threaded_log, async_log):
+        per_row = [line for line in log if line.startswith("[")]
+        per_row = sorted(line.split(" -> ")[0].split("] ")[1] for line in per_row)
+        assert per_row == [f"pid=p{i} {'失败' if i == 2 else '成功'}" for i in range(5)]
+    assert async_log[0].startswith("批次开始（asyncio）")
+    assert threaded_log[-1] == async_log[-1] == "批次处理完成"
+
+
+def test_async_engine_reports_every_row_through_the_callbacks(
+    tmp_path: Path, serve, encoder: _Encoder  # noqa: ANN001
+) -> None:
+    server = serve()
+    rows = _rows(server, ["0.mp4", "missing", "2.mp4", "3.mp4"])
+    logs: list[str] = []
+    progress: list[tuple[int, int]] = []
+    reported: list[TaskResult] = []
+
+    results = process_batch_async(
+        rows,
+        _config(tmp_path, engine="asyncio"),
+        log_cb=logs.append,
+        progress_cb=lambda done, total: progress.append((done, total)),
+        result_cb=reported.append,
+    )
+
+    assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    assert sorted(item.index for item in reported) == [0, 1, 2, 3]
+    assert _summary(sorted(reported, key=lambda item: item.index)) == _summary(
+        results.iter_results()
+    )
+    assert logs[0].startswith("批次开始（asyncio），")
+    assert logs[-1] == "批次处理完成"
+    per_row = [line for line in logs if line.startswith("[")]
+    assert [line.split("]")[0] for line in per_row] == ["[1/4", "[2/4", "[3/4", "[4/4"]
+    assert "pid=p1 失败 -> 404" in "\n".join(per_row)
+
+
+def test_async_engine_respects_download_and_encode_limits(
+    tmp_path: Path, serve, encoder: _Encoder  # noqa: ANN001
+) -> None:
+    # 下载比编码快：下载槽位先占满，之后编码槽位成为瓶颈
+    server = serve(delay_sec=0.1)
+    encoder.delay_sec = 0.3
+    rows = _rows(server, [f"{i}.mp4" for i in range(8)])
+
+    results = process_batch_async(
+        rows, _config(tmp_path, engine="asyncio", max_downloads=3, max_workers=2)
+    )
+
+    assert [item.status for item in results.iter_results()] == ["SUCCESS"] * 8
+    assert server.peak == 3
+    assert encoder.peak == 2
+
+
+def test_thread_engine_does_not_count_shared_slot_wait_against_the_timeout(
+    tmp_path: Path, serve, encoder: _Encoder  # noqa: ANN001
+) -> None:
+    # 另一个会话占着唯一的编码槽位，超过本任务的超时时间才释放
+    service = ExecutionService(limit=1)
+    other = service.open_session("other")
+    assert other.acquire()
+    threading.Timer(1.5, other.release).start()
+    session = service.open_session("batch")
+    server = serve()
+
+    results = runner.process_batch(
+        _rows(server, ["0.mp4"]), _config(tmp_path, task_timeout_sec=1), session=session
+    )
+
+    assert [item.status for item in results.iter_results()] == ["SUCCESS"]
+    assert len(encoder.timeouts) == 1 and encoder.timeouts[0] > 0.5
+
+
+def test_async_engine_turns_an_escaped_task_error_into_a_failed_row(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def flaky_single(row, output_filename, **kwargs):  # noqa: ANN001, ANN003
+        if row.index == 1:
+            raise RuntimeError("boom")
+        return TaskResult(
+            index=row.index,
+            pid=row.pid_raw,
+            output_filename=output_filename,
+            status="SUCCESS",
+            error="",
+            duration_sec=0.0,
+            output_path=None,
+        )
+
+    monkeypatch.setattr(async_runner, "_process_single_async", flaky_single)
+    rows = [
+        InputRow(index=i, pid_raw=f"p{i}", pid_sanitized=f"p{i}", video_url=f"https://e.com/{i}")
+        for i in range(3)
+    ]
+
+    # 输入以生成器传入，逐行在线程里读取
+    results = process_batch_async(iter(rows), _config(tmp_path, engine="asyncio"))
+
+    assert [item.status for item in results.iter_results()] == ["SUCCESS", "FAILED", "SUCCESS"]
+    assert results.get(1).error == "内部错误: boom"
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import threading
+import zipfile
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from video_splicer import batch_job
+from video_splicer.artifact_store import ArtifactStore
+from video_splicer.batch_job import BatchJob
+from video_splicer.execution_service import ExecutionService
+from video_splicer.input_parser import iter_output_filenames
+from video_splicer.models import Config, InputRow, ParseFailure, TaskResult
+from video_splicer.result_store import ResultStore
+
+
+def _rows(count: int) -> list[InputRow]:
+    return [
+        InputRow(index=i, pid_raw=f"p{i}", pid_sanitized=f"p{i}", video_url=f"https://e.com/{i}.mp4")
+        for i in range(count)
+    ]
+
+
+def _report(
+    store: ResultStore, result_cb: Callable[[TaskResult], None], result: TaskResult
+) -> None:
+    # 与调度器一致：先写入批次传入的结果存储，再回调
+    store.add(result)
+    result_cb(result)
+
+
+def test_results_appear_while_batch_is_running_and_partial_artifact_is_downloadable(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    first_done = threading.Event()
+    release = threading.Event()
+
+    def fake_process_batch(  # noqa: ANN001
+        rows, config, log_cb, progress_cb, result_cb, cancel_token, tracer, session, eta, store
+    ):
+        output = tmp_path / "1.mp4"
+        output.write_bytes(b"first")
+        _report(
+            store,
+            result_cb,
+            TaskResult(
+                index=0,
+                pid="p0",
+                output_filename="1.mp4",
+                status="SUCCESS",
+                error="",
+                duration_sec=1.0,
+                output_path=output,
+            ),
+        )
+        progress_cb(1, len(rows))
+        first_done.set()
+        release.wait(5)
+        _report(
+            store,
+            result_cb,
+            TaskResult(
+                index=1,
+                pid="p1",
+                output_filename="2.mp4",
+                status="FAILED",
+                error="boom",
+                duration_sec=1.0,
+                output_path=None,
+            ),
+        )
+        progress_cb(2, len(rows))
+        return store
+
+    monkeypatch.setattr(batch_job, "process_batch", fake_process_batch)
+    store = ArtifactStore(root=tmp_path / "store", ttl_sec=60, max_total_bytes=0)
+    job = BatchJob(
+        rows=_rows(2),
+        failure_results=[],
+        config=Config(endcard_path=tmp_path / "endcard.mp4"),
+        artifact_store=store,
+    )
+
+    job.start()
+    assert first_done.wait(5)
+
+    assert [item.index for item in job.results()] == [0]
+    assert job.first_output_sec is not None
+    partial_id = job.build_partial_artifact()
+    assert partial_id is not None
+    partial = store.get(partial_id)
+    assert partial is not None
+    assert partial.mime == "video/mp4"
+    assert store.read_bytes(partial_id) == b"first"
+
+    release.set()
+    job._thread.join(5)
+
+    assert job.done
+    assert [item.status for item in job.results()] == ["SUCCESS", "FAILED"]
+    final = store.get(job.artifact_id or "")
+    assert final is not None
+    with zipfile.ZipFile(final.path) as archive:
+        assert sorted(archive.namelist()) == ["1.mp4", "result.csv"]
+    assert store.get(partial_id) is None
+
+
+def test_runtime_errors_fail_every_row_without_running(tmp_path: Path) -> None:
+    store = ArtifactStore(root=tmp_path / "store", ttl_sec=60, max_total_bytes=0)
+    job = BatchJob(
+        rows=_rows(2),
+        failure_results=[],
+        config=Config(endcard_path=tmp_path / "endcard.mp4"),
+        artifact_store=store,
+        runtime_errors=["未找到 ffmpeg 可执行文件"],
+    )
+
+    job.start()
+    job._thread.join(5)
+
+    assert job.done
+    assert [item.output_filename for item in job.results()] == ["1.mp4", "2.mp4"]
+    assert all(item.error == "未找到 ffmpeg 可执行文件" for item in job.results())
+
+
+def test_batch_finishes_without_pyarrow_when_parquet_is_requested(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(batch_job.importlib.util, "find_spec", lambda name: None)
+    store = ArtifactStore(root=tmp_path / "store", ttl_sec=60, max_total_bytes=0)
+    job = BatchJob(
+        rows=_rows(2),
+        failure_results=[],
+        config=Config(endcard_path=tmp_path / "endcard.mp4", result_parquet=True),
+        artifact_store=store,
+        runtime_errors=["已启用 SP_RESULT_PARQUET，但未安装 pyarrow"],
+    )
+
+    job.start()
+    job._thread.join(5)
+
+    assert job.done
+    assert job.artifact_id is not None
+    with zipfile.ZipFile(store.get(job.artifact_id).path) as archive:
+        assert archive.namelist() == ["result.csv"]
+    notice = "未安装 pyarrow，结果不附带 result.parquet"
+    assert any(line.endswith(notice) for line in job.bus.lines())
+
+
+def test_batch_is_marked_done_when_packaging_fails(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def broken_artifact(*args, **kwargs):  # noqa: ANN002, ANN003, ANN202
+        raise RuntimeError("parquet schema mismatch")
+
+    monkeypatch.setattr(batch_job, "write_download_artifact", broken_artifact)
+    store = ArtifactStore(root=tmp_path / "store", ttl_sec=60, max_total_bytes=0)
+    job = BatchJob(
+        rows=_rows(1),
+        failure_results=[],
+        config=Config(endcard_path=tmp_path / "endcard.mp4"),
+        artifact_store=store,
+        runtime_errors=["未找到 ffmpeg 可执行文件"],
+    )
+
+    job.start()
+    job._thread.join(5)
+
+    assert job.done and job.artifact_id is None
+    assert job.bus.lines()[-1].endswith("结果打包失败: parquet schema mismatch")
+
+
+def test_streamed_input_is_read_by_the_batch_thread(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    seen: list[tuple[int, str]] = []
+
+    def fake_process_batch(  # noqa: ANN001
+        rows, config, log_cb, progress_cb, result_cb, cancel_token, tracer, session, eta, store
+    ):
+        assert not isinstance(rows, list)
+        for row, output_filename in iter_output_filenames(rows):
+            seen.append((row.index, output_filename))
+            _report(
+                store,
+                result_cb,
+                TaskResult(
+                    index=row.index,
+                    pid=row.pid_raw,
+                    output_filename=output_filename,
+                    status="FAILED",
+                    error="boom",
+                    duration_sec=0.0,
+                    output_path=None,
+                ),
+            )
+        return store
+
+    def items():  # noqa: ANN202
+        yield from _rows(2)
+        yield ParseFailure(index=2, pid_raw="bad", error="pid 不能为空")
+        yield InputRow(index=3, pid_raw="p3", pid_sanitized="p3", video_url="https://e.com/3")
+
+    monkeypatch.setattr(batch_job, "process_batch", fake_process_batch)
+    store = ArtifactStore(root=tmp_path / "store", ttl_sec=60, max_total_bytes=0)
+    job = BatchJob(
+        rows=items(),
+        failure_results=[],
+        config=Config(endcard_path=tmp_path / "endcard.mp4"),
+        artifact_store=store,
+        execution_service=ExecutionService(limit=2),
+    )
+    assert not job.input_exhausted
+
+    job.start()
+    job._thread.join(5)
+
+    assert job.done and job.input_exhausted
+    assert job.total == 4
+    assert seen == [(0, "1.mp4"), (1, "2.mp4"), (3, "3.mp4")]
+    assert [item.error for item in job.results()][2] == "pid 不能为空"
@@ -1,9 +1,12 @@
 from video_splicer.ffmpeg_pipeline import (
     DEFAULT_AUDIO_BITRATE,
     MIN_VIDEO_BITRATE,
+    EncodeSettings,
     VideoProbe,
     _select_audio_bitrate,
     _select_video_bitrate,
+    _video_rate_args,
+    select_encode_policy,
 )
 
 
@@ -37,3 +40,63 @@ def test_video_bitrate_has_min_floor() -> None:
 def test_audio_bitrate_default_when_missing() -> None:
     probe = _probe(video_bitrate=2_000_000, audio_bitrate=0, format_bitrate=2_100_000)
     assert _select_audio_bitrate(probe) == DEFAULT_AUDIO_BITRATE
+
+
+def test_policy_caps_inflated_source_bitrate_by_resolution() -> None:
+    probe = _probe(video_bitrate=25_000_000, audio_bitrate=128_000, format_bitrate=25_200_000)
+    policy = select_encode_policy(probe, EncodeSettings(), output_width=1080, output_height=1920)
+
+    assert policy.video_bitrate == 6_000_000
+    assert policy.capped
+    assert policy.describe() == "bitrate=6000k capped"
+    assert _video_rate_args(policy)[:2] == ["-b:v", "6000000"]
+
+
+def test_policy_keeps_source_bitrate_below_ceiling() -> None:
+    probe = _probe(video_bitrate=2_000_000, audio_bitrate=128_000, format_bitrate=2_100_000)
+    policy = select_encode_policy(probe, EncodeSettings(), output_width=720, output_height=1280)
+
+    assert policy.video_bitrate == 2_000_000
+    assert not policy.capped
+
+
+def test_policy_uses_top_rung_above_ladder_and_no_cap_without_ladder() -> None:
+    probe = _probe(video_bitrate=40_000_000, audio_bitrate=0, format_bitrate=40_000_000)
+    capped = select_encode_policy(probe, EncodeSettings(), output_width=4320, output_height=7680)
+    uncapped = select_encode_policy(
+        probe, EncodeSettings(bitrate_ladder=()), output_width=4320, output_height=7680
+    )
+
+    assert capped.video_bitrate == 20_000_000
+    assert uncapped.video_bitrate == 40_000_000
+
+
+def test_crf_mode_uses_vbv_cap() -> None:
+    probe = _probe(video_bitrate=25_000_000, audio_bitrate=128_000, format_bitrate=25_200_000)
+    policy = select_encode_policy(
+        probe, EncodeSettings(rate_control="crf", crf=24), output_width=1080, output_height=1920
+    )
+
+    assert _video_rate_args(policy) == [
+        "-crf",
+        "24",
+        "-maxrate",
+        "6000000",
+        "-bufsize",
+        "12000000",
+    ]
+    assert policy.describe() == "crf=24 maxrate=6000k"
+
+
+def test_bitrate_ladder_env_parsing(monkeypatch) -> None:  # noqa: ANN001
+    from video_splicer.config import DEFAULT_BITRATE_LADDER, _read_bitrate_ladder
+
+    monkeypatch.setenv("SP_BITRATE_LADDER", "1080:5000,720:2500")
+    assert _read_bitrate_ladder("SP_BITRATE_LADDER", DEFAULT_BITRATE_LADDER) == (
+        (720, 2_500_000),
+        (1080, 5_000_000),
+    )
+    monkeypatch.setenv("SP_BITRATE_LADDER", "off")
+    assert _read_bitrate_ladder("SP_BITRATE_LADDER", DEFAULT_BITRATE_LADDER) == ()
+    monkeypatch.setenv("SP_BITRATE_LADDER", "720-2500")
+    assert _read_bitrate_ladder("SP_BITRATE_LADDER", DEFAULT_BITRATE_LADDER) == DEFAULT_BITRATE_LADDER
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from video_splicer import calibration
+from video_splicer.calibration import (
+    CalibrationPoint,
+    choose_profile,
+    measure_ssim,
+    parse_ssim,
+    write_profile,
+)
+from video_splicer.config import load_config
+from video_splicer.ffmpeg_pipeline import EncodePolicy, VideoProbe, _build_concat_command
+
+
+def _point(preset: str, workers: int, rows_per_min: float, ssim: float) -> CalibrationPoint:
+    return CalibrationPoint(
+        preset=preset,
+        workers=workers,
+        rows=workers * 2,
+        wall_sec=1.0,
+        rows_per_min=rows_per_min,
+        mean_output_bytes=1000,
+        ssim=ssim,
+    )
+
+
+def test_choose_profile_takes_fastest_acceptable_and_breaks_near_ties_by_quality() -> None:
+    points = [
+        _point("ultrafast", 4, 120.0, 0.93),
+        _point("superfast", 4, 100.0, 0.960),
+        _point("veryfast", 4, 98.5, 0.970),
+        _point("veryfast", 8, 98.0, 0.970),
+        _point("medium", 4, 60.0, 0.985),
+    ]
+
+    chosen = choose_profile(points, min_ssim=0.95)
+
+    assert (chosen.preset, chosen.workers) == ("veryfast", 4)
+    assert choose_profile(points, min_ssim=0.99) is None
+
+
+def test_written_profile_is_picked_up_by_load_config_unless_env_overrides(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = tmp_path / "profile.json"
+    chosen = _point("faster", 3, 80.0, 0.97)
+    write_profile(path, chosen, [chosen], min_ssim=0.95)
+    monkeypatch.setenv("SP_PROFILE_PATH", str(path))
+    monkeypatch.delenv("SP_X264_PRESET", raising=False)
+    monkeypatch.delenv("SP_MAX_WORKERS", raising=False)
+
+    config = load_config()
+    assert (config.x264_preset, config.max_workers, config.profile_path) == ("faster", 3, path)
+
+    monkeypatch.setenv("SP_MAX_WORKERS", "5")
+    config = load_config()
+    assert (config.x264_preset, config.max_workers) == ("faster", 5)
+
+
+def test_broken_profile_is_ignored(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = tmp_path / "profile.json"
+    path.write_text('{"settings": {"x264_preset": "warp", "max_workers": 0}}', encoding="utf-8")
+    monkeypatch.setenv("SP_PROFILE_PATH", str(path))
+    monkeypatch.delenv("SP_X264_PRESET", raising=False)
+
+    config = load_config()
+
+    assert config.x264_preset == "medium"
+    assert config.profile_path is None
+
+
+def test_preset_is_passed_to_the_concat_encode() -> None:
+    probe = VideoProbe(
+        width=720,
+        height=1280,
+        duration_sec=5.0,
+        has_audio=True,
+        video_bitrate=0,
+        audio_bitrate=0,
+        format_bitrate=0,
+    )
+    policy = EncodePolicy(
+        rate_control="bitrate", video_bitrate=2_000_000, audio_bitrate=128_000, preset="veryfast"
+    )
+
+    cmd = _build_concat_command(
+        Path("in.mp4"), Path("end.mp4"), Path("out.mp4"), probe, probe, policy
+    )
+
+    assert cmd[cmd.index("-preset") + 1] == "veryfast"
+    assert policy.describe() == "bitrate=2000k preset=veryfast"
+
+
+def test_parse_ssim_reads_the_summary_line() -> None:
+    stderr = "[Parsed_ssim_4 @ 0x1] SSIM Y:0.990 (20.0) U:0.995 (23.0) All:0.9923 (21.1)"
+    assert parse_ssim(stderr) == pytest.approx(0.9923)
+
+
+def test_ssim_reference_is_scaled_to_a_capped_output(monkeypatch: pytest.MonkeyPatch) -> None:
+    # SP_MAX_OUTPUT_LONG_EDGE 把 1080x1920 的源缩到 540x960，参考源也要缩到同样尺寸
+    commands: list[list[str]] = []
+
+    class _Completed:
+        stderr = "[Parsed_ssim_5 @ 0x1] SSIM Y:0.990 (20.0) All:0.9812 (17.3)"
+
+    def fake_run_child(cmd: list[str], **kwargs: object) -> _Completed:
+        commands.append(cmd)
+        return _Completed()
+
+    monkeypatch.setattr(calibration, "run_child", fake_run_child)
+    monkeypatch.setattr(
+        calibration,
+        "probe_video",
+        lambda path: VideoProbe(
+            width=540,
+            height=960,
+            duration_sec=7.0,
+            has_audio=True,
+            video_bitrate=0,
+            audio_bitrate=0,
+            format_bitrate=0,
+        ),
+    )
+
+    assert measure_ssim(Path("out.mp4"), Path("source.mp4"), 4.0) == pytest.approx(0.9812)
+    lavfi = commands[0][commands[0].index("-lavfi") + 1]
+    assert "scale=540:960" in lavfi.split("[ref]")[0]
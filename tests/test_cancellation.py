@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from video_splicer import endcard_pool, runner
+from video_splicer.async_runner import process_batch_async
+from video_splicer.cancellation import BatchCancelled, CancelToken
+from video_splicer.child_process import run_child
+from video_splicer.models import Config, InputRow
+
+
+def test_callbacks_run_once_and_late_callbacks_run_immediately() -> None:
+    token = CancelToken()
+    calls: list[str] = []
+
+    token.add_callback(lambda: calls.append("a"))
+    removed = token.add_callback(lambda: calls.append("removed"))
+    token.remove_callback(removed)
+
+    token.cancel()
+    token.cancel()
+    token.add_callback(lambda: calls.append("late"))
+
+    assert calls == ["a", "late"]
+    with pytest.raises(BatchCancelled):
+        token.raise_if_cancelled()
+
+
+def test_run_child_terminates_process_on_cancel() -> None:
+    token = CancelToken()
+    threading.Timer(0.3, token.cancel).start()
+
+    started_at = time.monotonic()
+    with pytest.raises(BatchCancelled):
+        run_child([sys.executable, "-c", "import time; time.sleep(30)"], cancel_token=token)
+
+    assert time.monotonic() - started_at < 5
+
+
+def test_cancelled_batch_marks_rows_and_removes_work_dir(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def unexpected_download(**kwargs):  # noqa: ANN003
+        raise AssertionError("取消后不应再下载")
+
+    monkeypatch.setattr(runner, "download_video", unexpected_download)
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"endcard")
+    spool = tmp_path / "spool"
+    rows = [
+        InputRow(index=i, pid_raw=f"p{i}", pid_sanitized=f"p{i}", video_url=f"https://e.com/{i}.mp4")
+        for i in range(3)
+    ]
+    token = CancelToken()
+    token.cancel()
+
+    results = runner.process_batch(
+        rows, Config(endcard_path=endcard, spool_dir=spool), cancel_token=token
+    )
+
+    assert [item.status for item in results.iter_results()] == ["CANCELLED"] * 3
+    assert list(spool.iterdir()) == []
+
+
+class _StalledHead(BaseHTTPRequestHandler):
+    stall_sec = 5.0
+
+    def do_HEAD(self) -> None:  # noqa: N802
+        time.sleep(self.stall_sec)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def test_async_cancel_interrupts_preflight(tmp_path: Path) -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StalledHead)
+    server.daemon_threads = True
+    server.block_on_close = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"endcard")
+    port = server.server_address[1]
+    rows = [
+        InputRow(
+            index=i,
+            pid_raw=f"p{i}",
+            pid_sanitized=f"p{i}",
+            video_url=f"http://127.0.0.1:{port}/{i}.mp4",
+        )
+        for i in range(3)
+    ]
+    token = CancelToken()
+    threading.Timer(0.3, token.cancel).start()
+
+    started_at = time.monotonic()
+    try:
+        results = process_batch_async(
+            rows,
+            Config(endcard_path=endcard, engine="asyncio", preflight=True),
+            cancel_token=token,
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert time.monotonic() - started_at < 3
+    assert [item.status for item in results.iter_results()] == ["CANCELLED"] * 3
+
+
+class _SlowHead(_StalledHead):
+    stall_sec = 1.0
+
+
+def test_thread_cancel_while_waiting_for_a_host_slot_in_preflight(tmp_path: Path) -> None:
+    # 每个主机只允许一个连接：第一行的 HEAD 占着槽位，其余行在等待槽位时被取消
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowHead)
+    server.daemon_threads = True
+    server.block_on_close = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"endcard")
+    spool = tmp_path / "spool"
+    port = server.server_address[1]
+    rows = [
+        InputRow(
+            index=i,
+            pid_raw=f"p{i}",
+            pid_sanitized=f"p{i}",
+            video_url=f"http://127.0.0.1:{port}/{i}.mp4",
+        )
+        for i in range(3)
+    ]
+    token = CancelToken()
+    threading.Timer(0.3, token.cancel).start()
+
+    started_at = time.monotonic()
+    try:
+        results = runner.process_batch(
+            rows,
+            Config(
+                endcard_path=endcard,
+                spool_dir=spool,
+                preflight=True,
+                per_host_connections=1,
+            ),
+            cancel_token=token,
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert time.monotonic() - started_at < 3
+    assert [item.status for item in results.iter_results()] == ["CANCELLED"] * 3
+    assert list(spool.iterdir()) == []
+
+
+def test_async_cancel_reaches_endcard_probe(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    tokens: list[CancelToken | None] = []
+
+    def slow_probe(path, cancel_token=None):  # noqa: ANN001
+        tokens.append(cancel_token)
+        if cancel_token is not None and cancel_token.wait(5):
+            raise BatchCancelled("已取消")
+        raise AssertionError("取消信号没有传到落版探测")
+
+    monkeypatch.setattr(endcard_pool, "probe_video", slow_probe)
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"unprobed endcard")
+    rows = [
+        InputRow(index=0, pid_raw="p0", pid_sanitized="p0", video_url="https://e.com/0.mp4")
+    ]
+    token = CancelToken()
+    threading.Timer(0.3, token.cancel).start()
+
+    started_at = time.monotonic()
+    results = process_batch_async(
+        rows, Config(endcard_path=endcard, engine="asyncio"), cancel_token=token
+    )
+
+    assert time.monotonic() - started_at < 3
+    assert tokens == [token]
+    assert [item.status for item in results.iter_results()] == ["CANCELLED"]
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+import pytest
+import requests
+
+from video_splicer.cdn_simulator import CdnSimulator, FaultProfile
+from video_splicer.download_bench import percentile, run_download_benchmark
+from video_splicer.downloader import download_video
+
+PAYLOAD = bytes(range(256)) * 2048
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    # 429 / 503 带的 Retry-After 也一并跳过
+    monkeypatch.setattr("video_splicer.downloader.backoff_delay", lambda *args: 0.01)
+
+
+@pytest.mark.parametrize(
+    ("fault", "requests_made"),
+    [
+        ("redirect_rate", 2),
+        ("throttle_rate", 2),
+        ("unavailable_rate", 2),
+        ("missing_length_rate", 1),
+        ("disconnect_rate", 2),
+    ],
+)
+def test_downloader_recovers_from_each_injected_fault(
+    fault: str, requests_made: int, tmp_path: Path
+) -> None:
+    profile = FaultProfile(max_faults_per_path=1, seed=1, **{fault: 1.0})
+    target = tmp_path / "video.mp4"
+
+    with CdnSimulator({"video.mp4": PAYLOAD}, profile) as simulator:
+        download_video(
+            simulator.url("video.mp4"), target, max_bytes=10**7, retries=2, total_timeout_sec=30
+        )
+        stats = simulator.snapshot()
+
+    assert target.read_bytes() == PAYLOAD
+    assert stats[fault.removesuffix("_rate")] == 1
+    assert stats["requests"] == requests_made
+    if fault == "disconnect_rate":
+        assert stats["range_requests"] == 1
+
+
+def test_bandwidth_is_limited_per_connection(tmp_path: Path) -> None:
+    payload = PAYLOAD[: 128 * 1024]
+    target = tmp_path / "video.mp4"
+
+    with CdnSimulator({"video.mp4": payload}, FaultProfile(bandwidth_kbps=512)) as simulator:
+        started_at = time.monotonic()
+        download_video(
+            simulator.url("video.mp4"), target, max_bytes=10**7, retries=0, total_timeout_sec=30
+        )
+
+    assert time.monotonic() - started_at >= 0.2
+    assert target.read_bytes() == payload
+
+
+def test_ranges_beyond_the_file_are_unsatisfiable() -> None:
+    with CdnSimulator({"video.mp4": PAYLOAD}) as simulator:
+        url = simulator.url("video.mp4")
+        tail = requests.get(url, headers={"Range": "bytes=-10"}, timeout=5)
+        beyond = requests.get(url, headers={"Range": f"bytes={len(PAYLOAD)}-"}, timeout=5)
+
+    assert tail.status_code == 206
+    assert tail.content == PAYLOAD[-10:]
+    assert beyond.status_code == 416
+    assert beyond.headers["Content-Range"] == f"bytes */{len(PAYLOAD)}"
+
+
+def test_benchmark_reports_retries_and_latency(tmp_path: Path) -> None:
+    names = [f"video-{i}.mp4" for i in range(8)]
+    profile = FaultProfile(disconnect_rate=0.5, max_faults_per_path=1, seed=7)
+
+    with CdnSimulator(dict.fromkeys(names, PAYLOAD), profile) as simulator:
+        report = run_download_benchmark(simulator, names, tmp_path, concurrency=4, retries=2)
+
+    assert (report.succeeded, report.failed) == (8, 0)
+    assert report.server["disconnect"] > 0
+    assert report.retries == report.server["disconnect"]
+    assert report.resumes == report.server["range_requests"]
+    assert report.downloaded_bytes >= 8 * len(PAYLOAD)
+    assert report.latency_p50 <= report.latency_p90 <= report.latency_p99 <= report.latency_max
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_percentile_uses_nearest_rank() -> None:
+    values = [float(i) for i in range(1, 11)]
+    assert percentile(values, 0.5) == 5.0
+    assert percentile(values, 0.9) == 9.0
+    assert percentile(values, 0.99) == 10.0
+    assert percentile([], 0.5) == 0.0
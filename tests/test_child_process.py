@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from video_splicer import child_process
+from video_splicer.child_process import collect_usage, run_child, run_child_async
+from video_splicer.models import ResourceUsage
+from video_splicer.trace import propagate
+
+# 子进程自己消耗一点 CPU、分配一点内存，确认拿到的是子进程而不是本进程的占用
+BUSY = [
+    sys.executable,
+    "-c",
+    "buf = bytearray(64 * 1024 * 1024)\nx = 0\nfor i in range(2_000_000): x += i\nprint(x)",
+]
+
+
+@pytest.mark.skipif(not hasattr(os, "wait4"), reason="需要 os.wait4")
+def test_run_child_reports_child_cpu_and_peak_memory() -> None:
+    result = run_child(BUSY, timeout_sec=30)
+
+    assert result.returncode == 0
+    assert result.usage.children == 1
+    assert result.usage.cpu_sec > 0
+    assert result.usage.max_rss_bytes >= 64 * 1024 * 1024
+    assert result.usage.wall_sec > 0
+
+
+def test_collect_usage_sums_children_across_threads_and_async() -> None:
+    quick = [sys.executable, "-c", "pass"]
+    with collect_usage() as usage:
+        run_child(quick)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(propagate(lambda: run_child(quick))) for _ in range(2)]
+            for future in futures:
+                future.result()
+        asyncio.run(run_child_async(quick))
+    run_child(quick)
+
+    assert usage.total.children == 4
+
+
+def test_resource_usage_combine_sums_time_and_keeps_peak_memory() -> None:
+    a = ResourceUsage(user_sec=1.0, sys_sec=0.5, max_rss_bytes=100, wall_sec=2.0, children=1)
+    b = ResourceUsage(user_sec=2.0, sys_sec=0.25, max_rss_bytes=300, wall_sec=1.0, children=2)
+
+    total = a.combine(b)
+
+    assert total == ResourceUsage(
+        user_sec=3.0, sys_sec=0.75, max_rss_bytes=300, wall_sec=3.0, children=3
+    )
+    assert total.cpu_sec == 3.75
+
+
+@pytest.mark.skipif(not hasattr(os, "wait4"), reason="需要 os.wait4")
+def test_async_children_run_on_the_event_loop_without_worker_threads() -> None:
+    sleeper = [sys.executable, "-c", "import time; time.sleep(0.5); print('ok')"]
+
+    async def main() -> list:
+        loop = asyncio.get_running_loop()
+        # 默认执行器只有一个线程；若子进程占用线程，6 个并发会串行到 3 秒
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+        started = loop.time()
+        results = await asyncio.gather(*(run_child_async(sleeper) for _ in range(6)))
+        return [loop.time() - started, results]
+
+    elapsed, results = asyncio.run(main())
+
+    assert elapsed < 2.0
+    assert [item.stdout for item in results] == ["ok\n"] * 6
+    assert all(item.returncode == 0 and item.usage.cpu_sec > 0 for item in results)
+
+
+def test_async_child_timeout_terminates_the_process() -> None:
+    sleeper = [sys.executable, "-c", "import time; time.sleep(30)"]
+    started = time.monotonic()
+    with collect_usage() as usage:
+        with pytest.raises(subprocess.TimeoutExpired):
+            asyncio.run(run_child_async(sleeper, timeout_sec=0.3))
+
+    assert time.monotonic() - started < 10
+    assert usage.total.children == 1
+
+
+def test_run_child_terminates_the_process_when_waiting_fails(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    started: list[subprocess.Popen] = []
+
+    def broken_wait(proc, *args):  # noqa: ANN001, ANN002
+        started.append(proc)
+        raise RuntimeError("pipe reader failed")
+
+    monkeypatch.setattr(child_process, "_wait_output", broken_wait)
+    with pytest.raises(RuntimeError):
+        run_child([sys.executable, "-c", "import time; time.sleep(30)"])
+
+    assert started[0].poll() is not None
+
+
+def test_async_child_is_terminated_when_its_task_is_cancelled() -> None:
+    sleeper = [sys.executable, "-c", "import time; time.sleep(30)"]
+    started: list[subprocess.Popen] = []
+    real_popen = subprocess.Popen
+
+    def tracking_popen(*args, **kwargs):  # noqa: ANN002, ANN003
+        proc = real_popen(*args, **kwargs)
+        started.append(proc)
+        return proc
+
+    async def main() -> None:
+        task = asyncio.create_task(run_child_async(sleeper))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(child_process.subprocess, "Popen", tracking_popen)
+        asyncio.run(main())
+
+    assert started[0].poll() is not None
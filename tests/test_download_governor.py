@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+
+import aiohttp
+import pytest
+import requests
+
+from video_splicer.cancellation import BatchCancelled, CancelToken
+from video_splicer.download_governor import (
+    BACKOFF_CAP_SEC,
+    MAX_RETRY_AFTER_SEC,
+    DownloadGovernor,
+    TokenBucket,
+    backoff_delay,
+    parse_retry_after,
+)
+from video_splicer.downloader import DownloadError, DownloadTimeout, classify_download_error
+
+
+def _http_error(status: int, headers: dict[str, str] | None = None) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def test_parse_retry_after_accepts_seconds_and_http_date() -> None:
+    now = datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after("Mon, 01 Jan 2024 12:00:30 GMT", now=now) == 30.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_client_errors_are_not_retried() -> None:
+    assert classify_download_error(_http_error(404)).retryable is False
+    assert classify_download_error(_http_error(403)).retryable is False
+    assert classify_download_error(DownloadError("源视频超过大小限制")).retryable is False
+    assert classify_download_error(DownloadTimeout("下载超时")).retryable is False
+
+
+def test_throttling_and_network_errors_are_retried() -> None:
+    decision = classify_download_error(_http_error(429, {"Retry-After": "7"}))
+    assert decision.retryable is True
+    assert decision.retry_after_sec == 7.0
+
+    assert classify_download_error(_http_error(503)).retryable is True
+    assert classify_download_error(requests.ConnectionError("reset")).retryable is True
+    assert classify_download_error(requests.ReadTimeout("read timed out")).retryable is True
+
+
+def test_transport_timeouts_are_retried_even_though_they_are_timeout_errors() -> None:
+    # aiohttp 的读超时继承自 TimeoutError，不能与下载总时间耗尽混为一谈
+    for exc in (aiohttp.ServerTimeoutError("read"), aiohttp.SocketTimeoutError("read")):
+        assert isinstance(exc, TimeoutError)
+        assert classify_download_error(exc).retryable is True
+
+
+def test_backoff_grows_exponentially_and_respects_retry_after() -> None:
+    upper = lambda low, high: high  # noqa: E731
+
+    assert backoff_delay(1, rand=upper) == 0.5
+    assert backoff_delay(3, rand=upper) == 2.0
+    assert backoff_delay(30, rand=upper) == BACKOFF_CAP_SEC
+    assert backoff_delay(1, retry_after_sec=10.0, rand=upper) == 10.0
+    assert backoff_delay(1, retry_after_sec=3600.0, rand=upper) == MAX_RETRY_AFTER_SEC
+
+
+def test_token_bucket_delays_after_burst() -> None:
+    now = [0.0]
+    bucket = TokenBucket(rate_bytes_per_sec=1000, clock=lambda: now[0])
+
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(500) == 0.5
+
+    now[0] = 2.0
+    assert bucket.reserve(500) == 0.0
+
+
+def test_per_host_limit_is_shared_by_every_batch_in_the_process() -> None:
+    # 两个批次各自创建调度器，对同一主机仍只能有 per_host_limit 个连接
+    first = DownloadGovernor(per_host_limit=1)
+    second = DownloadGovernor(per_host_limit=1)
+    url = "https://shared-cdn.example/video.mp4"
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel).start()
+
+    with first.host_slot(url):
+        with pytest.raises(BatchCancelled):
+            with second.host_slot(url, cancel_token=token):
+                pass
+
+        async def probe_async() -> None:
+            async with second.host_slot_async(url):
+                pass
+
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(asyncio.wait_for(probe_async(), timeout=0.2))
+
+    with second.host_slot(url):
+        pass
+    with DownloadGovernor(per_host_limit=1).host_slot("https://other-cdn.example/a.mp4"):
+        with second.host_slot(url):
+            pass
+
+
+def test_throttle_wait_stops_when_the_batch_is_cancelled() -> None:
+    governor = DownloadGovernor(bandwidth_limit_kbps=3)
+    token = CancelToken()
+    governor.throttle(3 * 1024)
+    threading.Timer(0.2, token.cancel).start()
+
+    started_at = time.monotonic()
+    with pytest.raises(BatchCancelled):
+        governor.throttle(30 * 1024, cancel_token=token)
+
+    assert time.monotonic() - started_at < 2
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest
+
+from video_splicer.artifact_store import ArtifactStore
+
+
+def _download_page(root: str, artifact_id: str) -> None:
+    from pathlib import Path
+
+    from video_splicer.artifact_store import ArtifactStore
+    from video_splicer.download_panel import render_download
+
+    store = ArtifactStore(root=Path(root), ttl_sec=60, max_total_bytes=0)
+    render_download(store, artifact_id, key="sp_final")
+
+
+def _store_artifact(tmp_path: Path) -> tuple[Path, str]:
+    root = tmp_path / "store"
+    store = ArtifactStore(root=root, ttl_sec=60, max_total_bytes=0)
+    source = tmp_path / "results.zip"
+    source.write_bytes(b"z" * 4096)
+    return root, store.put_file(source, mime="application/zip", file_name="results.zip")
+
+
+def test_prepared_download_keeps_only_artifact_id_in_session(tmp_path: Path) -> None:
+    root, artifact_id = _store_artifact(tmp_path)
+    app = AppTest.from_function(_download_page, args=(str(root), artifact_id))
+    app.run()
+    assert app.get("download_button") == []
+
+    app.button(key="sp_final_prepare").click().run()
+    assert not app.exception
+    assert len(app.get("download_button")) == 1
+    assert app.session_state["sp_final_prepared"] == artifact_id
+
+    # 之后的重跑仍显示下载按钮，但会话里始终没有产物字节
+    app.run()
+    assert len(app.get("download_button")) == 1
+    state = app.session_state.to_dict()
+    assert [key for key, value in state.items() if isinstance(value, (bytes, bytearray))] == []
+    assert all(not isinstance(value, tuple) for value in state.values())
+
+
+def test_expired_artifact_clears_prepared_flag(tmp_path: Path) -> None:
+    root, artifact_id = _store_artifact(tmp_path)
+    app = AppTest.from_function(_download_page, args=(str(root), artifact_id))
+    app.run()
+    app.button(key="sp_final_prepare").click().run()
+
+    ArtifactStore(root=root, ttl_sec=60, max_total_bytes=0).delete(artifact_id)
+    app.run()
+
+    assert "sp_final_prepared" not in app.session_state
+    assert app.get("download_button") == []
+    assert len(app.info) == 1
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from video_splicer import endcard_pool
+from video_splicer.endcard_pool import EndcardError, EndcardPool, load_endcard_registry
+from video_splicer.ffmpeg_pipeline import VideoProbe
+from video_splicer.models import Config
+
+
+def _probe() -> VideoProbe:
+    return VideoProbe(
+        width=1080,
+        height=1920,
+        duration_sec=3.0,
+        has_audio=False,
+        video_bitrate=0,
+        audio_bitrate=0,
+        format_bitrate=0,
+    )
+
+
+def test_each_endcard_is_probed_once_and_unknown_names_fail(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    probed: list[Path] = []
+
+    def fake_probe(path, cancel_token=None):  # noqa: ANN001
+        probed.append(path)
+        return _probe()
+
+    monkeypatch.setattr(endcard_pool, "probe_video", fake_probe)
+    registry_dir = tmp_path / "endcards"
+    registry_dir.mkdir()
+    (registry_dir / "spring.mp4").write_bytes(b"spring")
+    (registry_dir / "notes.txt").write_text("x")
+    default = tmp_path / "default.mp4"
+    default.write_bytes(b"default")
+
+    registry = load_endcard_registry(Config(endcard_path=default, endcard_dir=registry_dir))
+    pool = EndcardPool(default, registry, tmp_path / "pieces")
+    pool.prepare(["", "spring", "spring", "", "missing"])
+
+    assert list(registry) == ["spring"]
+    assert probed == [default, registry_dir / "spring.mp4"]
+    assert pool.get("spring").size_bytes == 6
+    with pytest.raises(EndcardError, match="未知落版: missing"):
+        pool.get("missing")
+
+
+def test_piece_cache_builds_once(tmp_path: Path) -> None:
+    pool = EndcardPool(tmp_path / "default.mp4", {}, tmp_path / "pieces")
+    builds: list[Path] = []
+
+    def build(target: Path) -> None:
+        builds.append(target)
+        target.write_bytes(b"piece")
+
+    first = pool.piece("k", build)
+    second = pool.piece("k", build)
+
+    assert first == second
+    assert first.read_bytes() == b"piece"
+    assert len(builds) == 1
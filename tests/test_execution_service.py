@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from video_splicer.cancellation import BatchCancelled, CancelToken
+from video_splicer.execution_service import ExecutionService, format_queue_status
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _acquire_in_thread(session, order: list[str], name: str) -> threading.Thread:  # noqa: ANN001
+    def run() -> None:
+        session.acquire()
+        order.append(name)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_for_waiters(service: ExecutionService, count: int) -> None:
+    for _ in range(500):
+        with service._lock:
+            if sum(len(item.waiters) for item in service._sessions) == count:
+                return
+        threading.Event().wait(0.01)
+    raise AssertionError("等待者数量不符")
+
+
+def test_free_slot_goes_to_session_with_fewest_running_tasks() -> None:
+    service = ExecutionService(limit=1)
+    big = service.open_session("big")
+    small = service.open_session("small")
+    assert big.acquire()
+
+    order: list[str] = []
+    big_threads = []
+    for i in range(3):
+        big_threads.append(_acquire_in_thread(big, order, f"big{i}"))
+        _wait_for_waiters(service, i + 1)
+    small_thread = _acquire_in_thread(small, order, "small")
+    _wait_for_waiters(service, 4)
+
+    # 大批次已占着槽位，空出的槽位先给小批次，而不是排在大批次全部任务之后
+    assert small.status().position == 0
+    assert big.status().position == 1
+
+    for _ in range(4):
+        count = len(order)
+        (big if order[-1:] != ["small"] else small).release()
+        for _ in range(500):
+            if len(order) > count:
+                break
+            threading.Event().wait(0.01)
+    for thread in [*big_threads, small_thread]:
+        thread.join(1)
+    assert order == ["small", "big0", "big1", "big2"]
+
+
+def test_non_blocking_acquire_does_not_jump_the_queue() -> None:
+    service = ExecutionService(limit=1)
+    first = service.open_session("a")
+    second = service.open_session("b")
+    assert first.acquire(blocking=False)
+    assert not second.acquire(blocking=False)
+    assert not second.acquire(timeout=0.05)
+    first.release()
+    assert second.acquire(blocking=False)
+
+
+def test_capped_session_never_exceeds_its_max_parallel() -> None:
+    service = ExecutionService(limit=4)
+    capped = service.open_session("capped", max_parallel=2)
+    other = service.open_session("other")
+    assert capped.acquire()
+    assert capped.acquire()
+
+    order: list[str] = []
+    capped_thread = _acquire_in_thread(capped, order, "capped")
+    _wait_for_waiters(service, 1)
+    # 槽位还有空闲，但本批次已到上限：继续排队，非阻塞获取也拿不到
+    threading.Event().wait(0.05)
+    assert order == []
+    assert capped.status().running == 2
+    assert not capped.acquire(blocking=False)
+
+    # 受限批次的等待者不挡其他批次使用空闲槽位
+    assert other.acquire(blocking=False)
+    assert other.acquire(timeout=0.5)
+    assert order == []
+
+    capped.release()
+    capped_thread.join(1)
+    assert order == ["capped"]
+    assert capped.status().running == 2
+
+
+def test_cancelled_waiter_leaves_queue() -> None:
+    service = ExecutionService(limit=1)
+    holder = service.open_session("holder")
+    token = CancelToken()
+    waiting = service.open_session("waiting", cancel_token=token)
+    assert holder.acquire()
+
+    errors: list[BaseException] = []
+
+    def run() -> None:
+        try:
+            waiting.acquire()
+        except BatchCancelled as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    _wait_for_waiters(service, 1)
+    token.cancel()
+    thread.join(2)
+
+    assert len(errors) == 1
+    assert waiting.status().position is None
+    holder.release()
+    assert holder.acquire(blocking=False)
+
+
+def test_status_estimates_wait_from_observed_hold_time() -> None:
+    clock = _Clock()
+    service = ExecutionService(limit=2, clock=clock)
+    session = service.open_session("a", max_parallel=2)
+    session.expect(4)
+    assert session.status().finish_sec is None
+
+    assert session.acquire()
+    clock.now = 10.0
+    session.release()
+    session.task_done()
+
+    status = session.status()
+    assert status.remaining == 3
+    assert status.finish_sec == pytest.approx(15.0)
+    assert "未完成 3 条" in format_queue_status(status)
+
+    other = service.open_session("b", max_parallel=2)
+    other.expect(1)
+    # 两个批次平分槽位，每个批次只能拿到一个
+    assert session.status().finish_sec == pytest.approx(30.0)
+    other.close()
+    session.close()
+    assert service.active_sessions() == 0
+
+
+def test_async_view_shares_slots_with_thread_sessions() -> None:
+    service = ExecutionService(limit=1)
+    thread_session = service.open_session("thread")
+    async_slots = service.open_session("async").as_async()
+    assert thread_session.acquire()
+
+    async def scenario() -> None:
+        assert async_slots.locked()
+        waiter = asyncio.create_task(async_slots.acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        thread_session.release()
+        await asyncio.wait_for(waiter, 1)
+        assert not thread_session.acquire(blocking=False)
+        async_slots.release()
+
+        # 等待中被取消的协程不会占着槽位
+        assert thread_session.acquire()
+        cancelled = asyncio.create_task(async_slots.acquire())
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        thread_session.release()
+        assert not async_slots.locked()
+
+    asyncio.run(scenario())
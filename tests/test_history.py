@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from video_splicer import history, runner
+from video_splicer.history import HistoryRecorder, HistorySample, ThroughputHistory
+from video_splicer.models import Config, InputRow, TaskResult, TaskStats
+
+
+def _sample(host: str = "mac-1", preset: str = "medium", recorded_at: float = 1.0) -> HistorySample:
+    return HistorySample(
+        host=host,
+        engine="thread",
+        preset=preset,
+        max_workers=2,
+        source_bytes=4_000_000,
+        media_duration_sec=20.0,
+        width=1080,
+        height=1920,
+        download_sec=2.0,
+        encode_sec=10.0,
+        wall_sec=12.5,
+        cpu_sec=18.0,
+        recorded_at=recorded_at,
+    )
+
+
+def _config(**overrides: object) -> Config:
+    return Config(endcard_path=Path("endcard.mp4"), **overrides)
+
+
+def _result(index: int, status: str = "SUCCESS") -> TaskResult:
+    return TaskResult(
+        index=index,
+        pid=f"p{index}",
+        output_filename=f"{index + 1}.mp4",
+        status=status,
+        error="",
+        duration_sec=1.0,
+        output_path=None,
+        stats=TaskStats(
+            source_bytes=1_000_000,
+            media_duration_sec=5.0,
+            width=720,
+            height=1280,
+            download_sec=0.5,
+            encode_sec=0.4,
+        ),
+    )
+
+
+def test_history_keeps_the_newest_rows_per_host(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(history, "MAX_ROWS_PER_HOST", 3)
+    store = ThroughputHistory(tmp_path / "nested" / "history.sqlite3")
+    store.record([_sample(recorded_at=float(i)) for i in range(1, 6)])
+    store.record([_sample(host="mac-2", preset="fast", recorded_at=9.0)])
+
+    newest = store.recent("mac-1")
+    assert [item.recorded_at for item in newest] == [5.0, 4.0, 3.0]
+    assert newest[0] == _sample(recorded_at=5.0)
+    assert store.recent("mac-1", preset="fast") == []
+    assert len(store.recent("mac-2")) == 1
+
+
+def test_recorder_keeps_only_successful_tasks_and_survives_write_errors(tmp_path: Path) -> None:
+    config = _config(history_path=tmp_path / "history.sqlite3")
+    recorder = HistoryRecorder(ThroughputHistory(config.history_path), config)
+    recorder.add(_result(0))
+    recorder.add(_result(1, status="FAILED"))
+    recorder.flush()
+    assert recorder.recorded == 1
+
+    blocked = tmp_path / "blocked"
+    blocked.write_text("not a directory")
+    broken = HistoryRecorder(ThroughputHistory(blocked / "history.sqlite3"), config)
+    broken.add(_result(0))
+    broken.flush()
+    assert broken.recorded == 0 and broken.error
+
+
+def test_process_batch_records_history_and_plans_the_next_batch(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def fake_single(row, output_filename, config, ctx, cancel_token):  # noqa: ANN001
+        return _result(row.index)
+
+    monkeypatch.setattr(runner, "_process_single", fake_single)
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"e")
+    config = Config(
+        endcard_path=endcard, max_workers=2, history_path=tmp_path / "history.sqlite3"
+    )
+    rows = [
+        InputRow(index=i, pid_raw=f"p{i}", pid_sanitized=f"p{i}", video_url=f"https://e.com/{i}")
+        for i in range(6)
+    ]
+
+    first: list[str] = []
+    runner.process_batch(rows, config, log_cb=first.append)
+    assert not any(line.startswith("批次预估") for line in first)
+    assert f"已记录 6 条任务统计到 {config.history_path}" in first
+
+    second: list[str] = []
+    runner.process_batch(rows, config, log_cb=second.append)
+    assert any(line.startswith("批次预估：预计耗时约") for line in second)
+    assert len(ThroughputHistory(config.history_path).recent(history.current_host())) == 12
@@ -152,3 +152,22 @@ def test_excel_requires_product_id_and_video_link_columns() -> None:
     assert rows == []
     assert len(failures) == 1
     assert failures[0].error == "Excel 缺少必需列: 商品id,视频链接"
+
+
+def test_optional_endcard_column_is_read_from_csv_and_excel() -> None:
+    csv_bytes = b"pid,video_url,endcard\na,https://example.com/a.mp4,spring\nb,https://example.com/b.mp4,\n"
+    rows, failures = parse_inputs_with_errors(text="", csv_bytes=csv_bytes)
+
+    assert failures == []
+    assert [item.endcard for item in rows] == ["spring", ""]
+
+    buffer = BytesIO()
+    pd.DataFrame(
+        {"商品id": ["a"], "视频链接": ["https://example.com/a.mp4"], "落版": ["summer"]}
+    ).to_excel(buffer, index=False)
+    rows, failures = parse_split_inputs_with_errors(
+        pid_text="", video_url_text="", upload_file_name="in.xlsx", upload_bytes=buffer.getvalue()
+    )
+
+    assert failures == []
+    assert rows[0].endcard == "summer"
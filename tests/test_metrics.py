@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import urllib.request
+
+from video_splicer.metrics import MetricsRegistry, observe_duration, start_metrics_server
+
+
+def test_render_counter_and_gauge_with_labels() -> None:
+    registry = MetricsRegistry()
+    tasks = registry.counter("t_tasks_total", "tasks", ("status",))
+    depth = registry.gauge("t_queue_depth", "depth")
+
+    tasks.inc(status="SUCCESS")
+    tasks.inc(2, status="FAILED")
+    depth.inc(3)
+    depth.dec()
+
+    text = registry.render()
+
+    assert "# TYPE t_tasks_total counter" in text
+    assert 't_tasks_total{status="FAILED"} 2' in text
+    assert 't_tasks_total{status="SUCCESS"} 1' in text
+    assert "t_queue_depth 2" in text
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    registry = MetricsRegistry()
+    hist = registry.histogram("t_seconds", "seconds", ("outcome",), buckets=(1.0, 5.0))
+
+    hist.observe(0.5, outcome="success")
+    hist.observe(3.0, outcome="success")
+    hist.observe(9.0, outcome="success")
+
+    lines = registry.render().splitlines()
+
+    assert 't_seconds_bucket{outcome="success",le="1"} 1' in lines
+    assert 't_seconds_bucket{outcome="success",le="5"} 2' in lines
+    assert 't_seconds_bucket{outcome="success",le="+Inf"} 3' in lines
+    assert 't_seconds_sum{outcome="success"} 12.5' in lines
+    assert 't_seconds_count{outcome="success"} 3' in lines
+
+
+def test_observe_duration_labels_outcome_by_exception() -> None:
+    registry = MetricsRegistry()
+    hist = registry.histogram("t_encode_seconds", "encode", ("mode", "outcome"))
+
+    with observe_duration(hist, mode="single"):
+        pass
+    try:
+        with observe_duration(hist, mode="single"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    assert hist.count(mode="single", outcome="success") == 1
+    assert hist.count(mode="single", outcome="error") == 1
+
+
+def test_server_exposes_process_registry() -> None:
+    server = start_metrics_server(0)
+    port = server.server_address[1]
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+            content_type = response.headers["Content-Type"]
+    finally:
+        server.shutdown()
+
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert "# TYPE sp_tasks_total counter" in body
+    assert "# TYPE sp_encode_duration_seconds histogram" in body
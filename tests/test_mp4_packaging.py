@@ -0,0 +1,71 @@
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from video_splicer.ffmpeg_pipeline import (
+    EncodeSettings,
+    FFmpegError,
+    VideoProbe,
+    _build_concat_command,
+    check_output_probe,
+    select_encode_policy,
+)
+from video_splicer.segment_encoder import _join_command
+
+
+def _probe(duration_sec: float = 10.0, has_audio: bool = True) -> VideoProbe:
+    return VideoProbe(
+        width=1280,
+        height=720,
+        duration_sec=duration_sec,
+        has_audio=has_audio,
+        video_bitrate=2_000_000,
+        audio_bitrate=128_000,
+        format_bitrate=2_200_000,
+    )
+
+
+def _concat_command(packaging: str) -> list[str]:
+    source = _probe()
+    policy = select_encode_policy(source, EncodeSettings(packaging=packaging), 1280, 720)
+    return _build_concat_command(
+        source_video=Path("src.mp4"),
+        endcard_video=Path("end.mp4"),
+        output_video=Path("out.mp4"),
+        source_probe=source,
+        endcard_probe=_probe(3.0),
+        policy=policy,
+    )
+
+
+def test_fragmented_packaging_writes_in_one_pass() -> None:
+    default_cmd = _concat_command("faststart")
+    fragmented_cmd = _concat_command("fragmented")
+
+    assert default_cmd[default_cmd.index("-movflags") + 1] == "+faststart"
+    flags = fragmented_cmd[fragmented_cmd.index("-movflags") + 1]
+    assert "faststart" not in flags
+    assert "+empty_moov" in flags and "+frag_keyframe" in flags
+    assert fragmented_cmd[-1] == "out.mp4"
+
+    join_cmd = _join_command(Path("list.txt"), Path("a.m4a"), Path("out.mp4"), "fragmented")
+    assert join_cmd[join_cmd.index("-movflags") + 1] == flags
+
+
+def test_fragmented_policy_is_marked_in_description() -> None:
+    policy = select_encode_policy(_probe(), EncodeSettings(packaging="fragmented"), 1280, 720)
+    assert policy.describe() == "bitrate=2000k fmp4"
+
+
+def test_output_probe_check_rejects_truncated_or_silent_output() -> None:
+    policy = replace(
+        select_encode_policy(_probe(), EncodeSettings(packaging="fragmented"), 1280, 720),
+        output_duration_sec=13.0,
+    )
+    check_output_probe(_probe(13.4), policy)
+
+    with pytest.raises(FFmpegError, match="时长"):
+        check_output_probe(_probe(9.0), policy)
+    with pytest.raises(FFmpegError, match="音轨"):
+        check_output_probe(_probe(13.0, has_audio=False), policy)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import struct
+from pathlib import Path
+
+import pytest
+
+from video_splicer import ffmpeg_pipeline
+from video_splicer.child_process import ChildResult
+from video_splicer.ffmpeg_pipeline import probe_video
+from video_splicer.models import ResourceUsage
+from video_splicer.mp4_probe import probe_mp4, probe_mp4_buffer
+
+
+def _box(kind: bytes, *payload: bytes) -> bytes:
+    body = b"".join(payload)
+    return struct.pack(">I4s", len(body) + 8, kind) + body
+
+
+def _full(kind: bytes, body: bytes, version: int = 0) -> bytes:
+    return _box(kind, struct.pack(">I", version << 24), body)
+
+
+def _track(handler: bytes, timescale: int, duration: int, sizes: list[int], entry: bytes) -> bytes:
+    tkhd = _full(b"tkhd", bytes(72) + struct.pack(">II", 320 << 16, 180 << 16))
+    mdhd = _full(b"mdhd", struct.pack(">IIIIHH", 0, 0, timescale, duration, 0, 0))
+    hdlr = _full(b"hdlr", b"\0\0\0\0" + handler + bytes(12) + b"\0")
+    stsd = _full(b"stsd", struct.pack(">I", 1) + entry)
+    stsz = _full(b"stsz", struct.pack(f">II{len(sizes)}I", 0, len(sizes), *sizes))
+    stbl = _box(b"stbl", stsd, stsz)
+    return _box(b"trak", tkhd, _box(b"mdia", mdhd, hdlr, _box(b"minf", stbl)))
+
+
+def _mp4(audio: bool = True, moov_first: bool = True, extra: bytes = b"") -> bytes:
+    avc1 = _box(b"avc1", bytes(24), struct.pack(">HH", 1280, 720), bytes(50))
+    video = _track(b"vide", 12800, 25600, [5000] * 50, avc1)
+    tracks = [video]
+    if audio:
+        tracks.append(_track(b"soun", 48000, 96000, [400] * 94, _box(b"mp4a", bytes(28))))
+    mvhd = _full(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 2000) + bytes(80))
+    moov = _box(b"moov", mvhd, *tracks, extra)
+    ftyp = _box(b"ftyp", b"isom", struct.pack(">I", 512), b"isomavc1")
+    mdat = _box(b"mdat", bytes(250_000 + (37_600 if audio else 0)))
+    return ftyp + moov + mdat if moov_first else ftyp + mdat + moov
+
+
+def test_reads_dimensions_duration_bitrates_and_frame_rate() -> None:
+    data = _mp4()
+
+    probe = probe_mp4_buffer(data)
+
+    assert (probe.width, probe.height) == (1280, 720)
+    assert probe.duration_sec == pytest.approx(2.0)
+    assert probe.has_audio
+    assert probe.video_bitrate == 50 * 5000 * 8 // 2
+    assert probe.audio_bitrate == 94 * 400 * 8 // 2
+    assert probe.format_bitrate == len(data) * 8 // 2
+    assert probe.frame_rate == pytest.approx(25.0)
+
+
+def test_partial_download_is_enough_when_moov_comes_first() -> None:
+    data = _mp4(audio=False)
+    head = data[: data.index(b"mdat") + 100]
+
+    probe = probe_mp4_buffer(head, total_size=len(data))
+
+    assert probe is not None and not probe.has_audio
+    assert probe.format_bitrate == len(data) * 8 // 2
+    assert probe_mp4_buffer(_mp4(moov_first=False)[:1000]) is None
+
+
+def test_unsupported_containers_are_left_to_ffprobe() -> None:
+    assert probe_mp4_buffer(b"\x1aE\xdf\xa3" + bytes(100)) is None
+    assert probe_mp4_buffer(_mp4(extra=_box(b"mvex", bytes(8)))) is None
+
+
+@pytest.mark.parametrize("kind", [b"mvhd", b"tkhd", b"mdhd", b"hdlr", b"stsd", b"stsz"])
+@pytest.mark.parametrize("payload", [b"", b"\1" + bytes(5)])
+def test_truncated_header_boxes_are_left_to_ffprobe(kind: bytes, payload: bytes) -> None:
+    truncated = _box(kind, payload)
+    extra = truncated if kind == b"mvhd" else _box(b"trak", _box(b"mdia", truncated))
+
+    # moov 在文件末尾时截断的盒子正好读到缓冲区尽头；在开头时后面紧跟 mdat 的数据
+    assert probe_mp4_buffer(_mp4(moov_first=False, extra=extra)) is None
+    assert probe_mp4_buffer(_mp4(extra=extra)) is None
+
+
+def test_probe_video_uses_ffprobe_only_as_fallback(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls: list[list[str]] = []
+
+    def fake_run_child(cmd: list[str], **kwargs: object) -> ChildResult:
+        calls.append(cmd)
+        stdout = (
+            '{"streams": [{"codec_type": "video", "width": 64, "height": 48}],'
+            ' "format": {"duration": "1.5"}}'
+        )
+        return ChildResult(returncode=0, stdout=stdout, stderr="", usage=ResourceUsage())
+
+    monkeypatch.setattr(ffmpeg_pipeline, "run_child", fake_run_child)
+    native = tmp_path / "native.mp4"
+    native.write_bytes(_mp4())
+    other = tmp_path / "other.webm"
+    other.write_bytes(b"\x1aE\xdf\xa3" + bytes(100))
+
+    assert probe_video(native).width == 1280
+    assert calls == []
+    assert probe_mp4(other) is None
+    assert probe_video(other).width == 64
+    assert calls[0][0] == "ffprobe"
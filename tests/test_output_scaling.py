@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from video_splicer.ffmpeg_pipeline import (
+    EncodeSettings,
+    VideoProbe,
+    _build_concat_command,
+    output_size,
+    select_encode_policy,
+)
+
+
+def _probe(width: int, height: int) -> VideoProbe:
+    return VideoProbe(
+        width=width,
+        height=height,
+        duration_sec=10.0,
+        has_audio=True,
+        video_bitrate=30_000_000,
+        audio_bitrate=128_000,
+        format_bitrate=30_200_000,
+    )
+
+
+def test_output_size_caps_long_edge_and_height_with_even_dimensions() -> None:
+    assert output_size(3840, 2160, EncodeSettings(max_long_edge=1920)) == (1920, 1080)
+    assert output_size(2160, 3840, EncodeSettings(max_long_edge=1280)) == (720, 1280)
+    assert output_size(1918, 1080, EncodeSettings(max_height=719)) == (1276, 718)
+    assert output_size(1280, 720, EncodeSettings(max_long_edge=1920)) == (1280, 720)
+    assert output_size(1281, 721, EncodeSettings()) == (1281, 721)
+
+
+def test_concat_command_downscales_source_and_fits_endcard_to_capped_size() -> None:
+    source = _probe(3840, 2160)
+    settings = EncodeSettings(max_long_edge=1920)
+    width, height = output_size(source.width, source.height, settings)
+    policy = select_encode_policy(source, settings, width, height)
+
+    cmd = _build_concat_command(
+        source_video=Path("src.mp4"),
+        endcard_video=Path("end.mp4"),
+        output_video=Path("out.mp4"),
+        source_probe=source,
+        endcard_probe=_probe(1080, 1920),
+        policy=policy,
+        output_width=width,
+        output_height=height,
+    )
+    graph = cmd[cmd.index("-filter_complex") + 1]
+
+    assert "[0:v]scale=1920:1080,setsar=1[v0]" in graph
+    assert "[1:v]scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:" in graph
+    assert policy.describe() == "bitrate=6000k capped scale=1920x1080"
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from video_splicer.history import HistorySample, ThroughputHistory, current_host
+from video_splicer.models import Config
+from video_splicer.planner import (
+    EtaTracker,
+    build_model,
+    estimate_batch,
+    format_duration,
+    load_model,
+)
+
+
+def _sample(**overrides: object) -> HistorySample:
+    sample = HistorySample(
+        host=current_host(),
+        engine="thread",
+        preset="medium",
+        max_workers=2,
+        source_bytes=10_000_000,
+        media_duration_sec=30.0,
+        width=1080,
+        height=1920,
+        download_sec=4.0,
+        encode_sec=16.0,
+        wall_sec=20.0,
+        cpu_sec=30.0,
+    )
+    return replace(sample, **overrides)
+
+
+def _config(**overrides: object) -> Config:
+    return Config(endcard_path=Path("endcard.mp4"), **overrides)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_model_uses_medians_and_scales_by_size() -> None:
+    samples = [_sample() for _ in range(4)] + [_sample(download_sec=400.0, encode_sec=900.0)]
+    model = build_model(samples)
+    assert model is not None and model.samples == 5
+    assert model.download_sec == 4.0 and model.encode_sec == 16.0
+
+    # 大小翻倍：下载、编码、CPU 都按比例翻倍；大小未知时用中位数
+    assert model.task_estimate(20_000_000) == pytest.approx((8.0, 32.0, 60.0))
+    assert model.task_estimate(None) == (4.0, 16.0, 30.0)
+    assert build_model(samples[:4]) is None
+
+
+def test_batch_estimate_follows_the_engine() -> None:
+    model = build_model([_sample() for _ in range(5)])
+    assert model is not None
+    sizes = [None] * 10
+
+    threaded = estimate_batch(model, sizes, _config(max_workers=2))
+    assert threaded.wall_sec == pytest.approx(10 * 20.0 / 2)
+    assert threaded.cpu_sec == pytest.approx(300.0)
+
+    # 下载与编码分开限流时，较慢的编码决定整批耗时
+    pipelined = estimate_batch(
+        model, sizes, _config(engine="asyncio", max_workers=2, max_downloads=8)
+    )
+    assert pipelined.wall_sec == pytest.approx(10 * 16.0 / 2)
+
+    single = estimate_batch(model, [None], _config(max_workers=8))
+    assert single.wall_sec == pytest.approx(20.0)
+    assert "1 条" in single.describe()
+
+
+def test_load_model_prefers_the_same_preset(tmp_path: Path) -> None:
+    path = tmp_path / "history.sqlite3"
+    assert load_model(_config(history_path=None)) is None
+    assert load_model(_config(history_path=path)) is None
+
+    store = ThroughputHistory(path)
+    store.record([_sample(preset="fast", encode_sec=8.0) for _ in range(5)])
+    store.record([_sample(preset="slow", encode_sec=40.0) for _ in range(5)])
+
+    fast = load_model(_config(history_path=path, x264_preset="fast"))
+    assert fast is not None and fast.encode_sec == 8.0
+    # 同预设历史不足时放宽到本机全部历史
+    other = load_model(_config(history_path=path, x264_preset="veryfast"))
+    assert other is not None and other.samples == 10
+
+
+def test_eta_blends_prior_with_observed_throughput() -> None:
+    model = build_model([_sample() for _ in range(5)])
+    clock = _Clock()
+    eta = EtaTracker(model, _config(max_workers=2), clock=clock)
+    assert eta.remaining_sec() is None
+
+    # 还没有任务完成时完全依据历史：每条 10 秒（20 秒 / 2 并发）
+    eta.total = 10
+    assert eta.remaining_sec() == pytest.approx(100.0)
+
+    clock.now = 10.0
+    eta.observe(10)
+    eta.observe(10)
+    # 实测每条 5 秒，已执行 2 条、并发 2，实测与历史各占一半
+    assert eta.remaining_sec() == pytest.approx(0.5 * 40.0 + 0.5 * 80.0)
+    assert eta.describe() == "预计剩余 1 分 0 秒（已完成 2/10）"
+
+    # 预检拒绝的行不计入实测吞吐
+    eta.observe(10, worked=False)
+    assert eta.worked == 2 and eta.completed == 3
+
+    assert eta.due() is True
+    assert eta.due() is False
+    clock.now = 50.0
+    assert eta.due() is True
+
+
+def test_eta_without_history_waits_for_the_first_result() -> None:
+    clock = _Clock()
+    eta = EtaTracker(None, _config(max_workers=4), clock=clock)
+    eta.total = 5
+    assert eta.describe() == ""
+    clock.now = 8.0
+    eta.observe(5)
+    assert eta.remaining_sec() == pytest.approx(32.0)
+
+
+def test_format_duration() -> None:
+    assert format_duration(42.4) == "42 秒"
+    assert format_duration(125) == "2 分 5 秒"
+    assert format_duration(3 * 3600 + 20 * 60) == "3 小时 20 分"
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from video_splicer import runner
+from video_splicer.downloader import HeadProbe
+from video_splicer.models import Config, InputRow, TaskResult
+from video_splicer.preflight import PreflightOutcome, _outcome, order_rows
+from video_splicer.result_store import ResultStore
+
+
+def _rows(count: int) -> list[InputRow]:
+    return [
+        InputRow(index=i, pid_raw=f"p{i}", pid_sanitized=f"p{i}", video_url=f"https://e.com/{i}.mp4")
+        for i in range(count)
+    ]
+
+
+def test_order_rows_by_expected_size_with_unknown_as_limit() -> None:
+    rows = _rows(4)
+    outcomes = {
+        0: PreflightOutcome(index=0, content_length=10),
+        1: PreflightOutcome(index=1, content_length=None),
+        2: PreflightOutcome(index=2, content_length=30),
+        3: PreflightOutcome(index=3, content_length=10),
+    }
+
+    largest = order_rows(rows, outcomes, "largest_first", max_bytes=100)
+    smallest = order_rows(rows, outcomes, "smallest_first", max_bytes=100)
+
+    assert [row.index for row in largest] == [1, 2, 0, 3]
+    assert [row.index for row in smallest] == [0, 3, 2, 1]
+    assert order_rows(rows, outcomes, "input", max_bytes=100) == rows
+
+
+def test_outcome_rejects_gone_and_oversized_sources() -> None:
+    gone = _outcome(0, HeadProbe(content_length=None, status=404, unreachable=True, error="x"), 100)
+    oversized = _outcome(1, HeadProbe(content_length=101, status=200), 100)
+    head_not_allowed = _outcome(2, HeadProbe(content_length=None, status=405), 100)
+
+    assert gone.error == "x"
+    assert oversized.error == "源视频超过大小限制"
+    assert head_not_allowed.error == ""
+
+
+def test_batch_runs_largest_first_but_names_follow_input_order(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    sizes = {0: 10, 1: 50, 2: 30}
+    started: list[int] = []
+
+    def fake_preflight(rows, **kwargs):  # noqa: ANN001, ANN003
+        outcomes = {i: PreflightOutcome(index=i, content_length=size) for i, size in sizes.items()}
+        outcomes[3] = PreflightOutcome(index=3, content_length=None, error="视频链接不可用（HTTP 404）")
+        return outcomes
+
+    def fake_single(row, output_filename, config, ctx, cancel_token):  # noqa: ANN001
+        started.append(row.index)
+        return TaskResult(
+            index=row.index,
+            pid=row.pid_raw,
+            output_filename=output_filename,
+            status="SUCCESS",
+            error="",
+            duration_sec=0.0,
+            output_path=None,
+        )
+
+    monkeypatch.setattr(runner, "run_preflight", fake_preflight)
+    monkeypatch.setattr(runner, "_process_single", fake_single)
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"e")
+    config = Config(endcard_path=endcard, max_workers=1, task_order="largest_first")
+
+    store = ResultStore()
+    results = runner.process_batch(_rows(4), config, store=store)
+
+    # 调度器直接写入调用方的结果存储，不另外复制一份
+    assert results is store
+
+    assert started == [1, 2, 0]
+    assert [item.output_filename for item in results.iter_results()] == [
+        "1.mp4",
+        "2.mp4",
+        "3.mp4",
+        "4.mp4",
+    ]
+    assert results.get(3).status == "FAILED"
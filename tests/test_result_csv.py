@@ -3,7 +3,7 @@ from __future__ import annotations
 import codecs
 
 from video_splicer.artifact import build_result_csv
-from video_splicer.models import TaskResult
+from video_splicer.models import ResourceUsage, TaskResult
 
 
 def test_result_csv_uses_utf8_bom_and_fixed_columns() -> None:
@@ -16,6 +16,10 @@ def test_result_csv_uses_utf8_bom_and_fixed_columns() -> None:
             error="",
             duration_sec=2.3456,
             output_path=None,
+            output_duration_sec=12.5,
+            usage=ResourceUsage(
+                user_sec=3.25, sys_sec=0.5, max_rss_bytes=150 * 1024 * 1024, wall_sec=2.0
+            ),
         ),
         TaskResult(
             index=0,
@@ -33,6 +37,10 @@ def test_result_csv_uses_utf8_bom_and_fixed_columns() -> None:
     assert payload.startswith(codecs.BOM_UTF8)
 
     text = payload.decode("utf-8-sig").strip().splitlines()
-    assert text[0] == "pid,output_filename,status,error,duration_sec"
+    assert text[0] == (
+        "pid,output_filename,status,error,duration_sec,encode_policy,"
+        "output_duration_sec,cpu_user_sec,cpu_sys_sec,max_rss_mb,child_wall_sec"
+    )
     assert text[1].startswith("a,,FAILED,bad url,")
     assert text[2].startswith("b,b.mp4,SUCCESS,,")
+    assert text[2].endswith(",12.500,3.250,0.500,150.0,2.000")
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from video_splicer.artifact import build_result_csv, write_download_artifact
+from video_splicer.models import ResourceUsage, TaskResult
+from video_splicer.result_store import ResultStore
+
+
+def _result(index: int, status: str = "SUCCESS", output_path: Path | None = None) -> TaskResult:
+    return TaskResult(
+        index=index,
+        pid=f"p{index}",
+        output_filename=f"{index + 1}.mp4",
+        status=status,
+        error="" if status == "SUCCESS" else "boom",
+        duration_sec=1.5,
+        output_path=output_path,
+        output_duration_sec=10.0,
+        usage=ResourceUsage(user_sec=2.0, sys_sec=0.5, max_rss_bytes=index * 1024, wall_sec=1.0),
+    )
+
+
+def test_store_grows_upserts_and_returns_results_in_input_order() -> None:
+    store = ResultStore(capacity=2)
+    for index in [4, 0, 3, 1, 2]:
+        store.add(_result(index, status="FAILED"))
+    store.add(_result(3))
+
+    assert len(store) == 5
+    assert 3 in store and 7 not in store
+    assert [item.index for item in store.results()] == [0, 1, 2, 3, 4]
+    assert store.get(3) == _result(3)
+    assert store.has_success()
+    assert store.usage_total().max_rss_bytes == 4 * 1024
+    assert store.usage_total().cpu_sec == pytest.approx(12.5)
+    assert store.output_duration_sec() == pytest.approx(50.0)
+
+
+def test_frame_is_a_view_over_the_store_columns() -> None:
+    store = ResultStore()
+    for index in range(3):
+        store.add(_result(index))
+
+    frame = store.frame(["index", "status", "duration_sec"])
+
+    assert frame["status"].tolist() == ["SUCCESS"] * 3
+    assert np.shares_memory(frame["duration_sec"].to_numpy(), store._columns["duration_sec"])
+    assert np.shares_memory(frame["status"].to_numpy(), store._columns["status"])
+
+
+def test_csv_from_store_matches_csv_from_result_list() -> None:
+    results = [_result(1), _result(0, status="FAILED")]
+
+    assert build_result_csv(ResultStore.from_results(results)) == build_result_csv(results)
+
+
+def test_zip_artifact_streams_csv_and_optionally_adds_parquet(tmp_path: Path) -> None:
+    pq = pytest.importorskip("pyarrow.parquet")
+    output = tmp_path / "1.mp4"
+    output.write_bytes(b"video")
+    store = ResultStore.from_results([_result(1, status="FAILED"), _result(0, output_path=output)])
+
+    _, _, target = write_download_artifact(store, tmp_path / "out", parquet=True)
+
+    with zipfile.ZipFile(target) as archive:
+        assert sorted(archive.namelist()) == ["1.mp4", "result.csv", "result.parquet"]
+        assert archive.read("result.csv") == build_result_csv(store)
+        archive.extract("result.parquet", tmp_path)
+    table = pq.read_table(tmp_path / "result.parquet")
+    assert table.column("index").to_pylist() == [0, 1]
+    assert table.column("status").to_pylist() == ["SUCCESS", "FAILED"]
+    assert not list((tmp_path / "out").glob("*.parquet"))
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+
+import aiohttp
+import pytest
+
+from video_splicer.downloader import _Partial, download_video, download_video_async
+
+PAYLOAD = bytes(range(256)) * 4096
+# 同步下载按 256 KiB 分块读取，断开时未读完的那一块丢弃，从最后一个完整分块处续传
+CHUNK = 256 * 1024
+
+
+class _FlakyServer(ThreadingHTTPServer):
+    # 第一次请求发到一半就断开；支持 Range，replaced=True 时重试前源文件已被替换（ETag 变化）；
+    # stall_sec 大于 0 时断开前先停顿这么久，用来触发客户端的读超时；gzip=True 时按 gzip 编码发送
+    def __init__(
+        self,
+        cut_at: int,
+        ranges: bool = True,
+        replaced: bool = False,
+        stall_sec: float = 0.0,
+        gzip: bool = False,
+    ) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.cut_at = cut_at
+        self.ranges = ranges
+        self.replaced = replaced
+        self.stall_sec = stall_sec
+        self.gzip = gzip
+        self.requests: list[str | None] = []
+        self.sent = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _FlakyServer
+
+    def do_GET(self) -> None:  # noqa: N802
+        server = self.server
+        requested = self.headers.get("Range")
+        server.requests.append(requested)
+        etag = '"v2"' if server.replaced and len(server.requests) > 1 else '"v1"'
+        start = 0
+        if requested and server.ranges and self.headers.get("If-Range") == etag:
+            start = int(requested.removeprefix("bytes=").rstrip("-"))
+        body = PAYLOAD[start:]
+        if server.gzip:
+            body = gzip.compress(body)
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        if server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        if server.gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if len(server.requests) == 1:
+            body = body[: server.cut_at]
+        # 先计数再发送：客户端可能在处理线程写完之后、计数之前就已返回
+        server.sent += len(body)
+        self.wfile.write(body)
+        if len(server.requests) == 1 and server.stall_sec:
+            self.wfile.flush()
+            time.sleep(server.stall_sec)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def serve() -> Iterator:
+    servers: list[_FlakyServer] = []
+
+    def start(
+        cut_at: int,
+        ranges: bool = True,
+        replaced: bool = False,
+        stall_sec: float = 0.0,
+        gzip: bool = False,
+    ) -> _FlakyServer:
+        server = _FlakyServer(cut_at, ranges, replaced, stall_sec, gzip)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("video_splicer.downloader.backoff_delay", lambda *args: 0.01)
+
+
+def _url(server: _FlakyServer) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/video.mp4"
+
+
+def test_retry_continues_from_the_last_byte(serve, tmp_path: Path) -> None:  # noqa: ANN001
+    server = serve(cut_at=2 * CHUNK + 1000)
+    target = tmp_path / "video.mp4"
+
+    download_video(_url(server), target, max_bytes=10**7, retries=2, total_timeout_sec=30)
+
+    assert target.read_bytes() == PAYLOAD
+    assert server.requests == [None, f"bytes={2 * CHUNK}-"]
+    assert server.sent == len(PAYLOAD) + 1000
+
+
+def test_changed_source_restarts_from_zero(serve, tmp_path: Path) -> None:  # noqa: ANN001
+    server = serve(cut_at=CHUNK + 1000, replaced=True)
+    target = tmp_path / "video.mp4"
+
+    download_video(_url(server), target, max_bytes=10**7, retries=2, total_timeout_sec=30)
+
+    assert target.read_bytes() == PAYLOAD
+    assert server.requests == [None, f"bytes={CHUNK}-"]
+    assert server.sent == CHUNK + 1000 + len(PAYLOAD)
+
+
+def test_servers_without_ranges_restart_without_range_header(
+    serve, tmp_path: Path  # noqa: ANN001
+) -> None:
+    server = serve(cut_at=CHUNK + 1000, ranges=False)
+    target = tmp_path / "video.mp4"
+
+    download_video(_url(server), target, max_bytes=10**7, retries=1, total_timeout_sec=30)
+
+    assert target.read_bytes() == PAYLOAD
+    assert server.requests == [None, None]
+
+
+def test_async_download_resumes(serve, tmp_path: Path) -> None:  # noqa: ANN001
+    server = serve(cut_at=CHUNK + 1000)
+    target = tmp_path / "video.mp4"
+
+    async def run() -> None:
+        async with aiohttp.ClientSession() as session:
+            await download_video_async(
+                session, _url(server), target, 10**7, retries=2, total_timeout_sec=30
+            )
+
+    asyncio.run(run())
+
+    assert target.read_bytes() == PAYLOAD
+    assert server.requests[0] is None
+    assert server.requests[1] is not None and server.requests[1] != "bytes=0-"
+    assert len(server.requests) == 2
+
+
+def test_async_download_resumes_after_a_read_timeout(serve, tmp_path: Path) -> None:  # noqa: ANN001
+    # 源站发到一半停住：aiohttp 的读超时是 TimeoutError 的子类，仍应重试并从断点继续
+    server = serve(cut_at=CHUNK + 1000, stall_sec=1.0)
+    target = tmp_path / "video.mp4"
+
+    async def run() -> None:
+        timeout = aiohttp.ClientTimeout(sock_read=0.3)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await download_video_async(
+                session, _url(server), target, 10**7, retries=2, total_timeout_sec=30
+            )
+
+    asyncio.run(run())
+
+    assert target.read_bytes() == PAYLOAD
+    assert len(server.requests) == 2
+    assert server.requests[1] is not None and server.requests[1] != "bytes=0-"
+
+
+def test_gzip_encoded_responses_complete_without_retrying(
+    serve, tmp_path: Path  # noqa: ANN001
+) -> None:
+    # Content-Length 是压缩后的长度，写入的是解压后的字节，不能据此判定为截断
+    server = serve(cut_at=len(PAYLOAD), gzip=True)
+    target = tmp_path / "video.mp4"
+
+    download_video(_url(server), target, max_bytes=10**7, retries=0, total_timeout_sec=30)
+
+    assert target.read_bytes() == PAYLOAD
+    assert server.requests == [None]
+
+    async def run() -> None:
+        async with aiohttp.ClientSession() as session:
+            await download_video_async(
+                session, _url(server), target, 10**7, retries=0, total_timeout_sec=30
+            )
+
+    target.unlink()
+    asyncio.run(run())
+
+    assert target.read_bytes() == PAYLOAD
+    assert server.requests == [None, None]
+
+
+def test_partial_rejects_ranges_that_do_not_continue_the_same_file() -> None:
+    partial = _Partial()
+    headers = {"Content-Length": "1000", "ETag": '"a"', "Accept-Ranges": "bytes"}
+    assert partial.begin(200, headers) == 0
+    partial.size = 400
+
+    assert partial.request_headers() == {"Range": "bytes=400-", "If-Range": '"a"'}
+    assert partial.begin(206, {"Content-Range": "bytes 300-999/1000"}) is None
+    assert partial.begin(206, {"Content-Range": "bytes 400-1999/2000"}) is None
+    assert partial.begin(206, {"Content-Range": "bytes 400-999/1000", "ETag": '"b"'}) is None
+    assert partial.begin(416, {}) is None
+    assert partial.begin(206, {"Content-Range": "bytes 400-999/1000", "ETag": '"a"'}) == 400
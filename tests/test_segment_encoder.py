@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from video_splicer import segment_encoder
+from video_splicer.cancellation import BatchCancelled, CancelToken
+from video_splicer.execution_service import AsyncSessionSlots, ExecutionService, ExecutionSession
+from video_splicer.ffmpeg_pipeline import EncodeSettings, FFmpegError, VideoProbe
+from video_splicer.segment_encoder import (
+    _run_parallel,
+    _run_step,
+    _step,
+    concat_segmented,
+    encode_with_endcard,
+    encode_with_endcard_async,
+    plan_segment_workers,
+)
+
+SLOW = [sys.executable, "-c", "import time; time.sleep(30)"]
+
+
+def _probe(duration_sec: float) -> VideoProbe:
+    return VideoProbe(
+        width=1280,
+        height=720,
+        duration_sec=duration_sec,
+        has_audio=True,
+        video_bitrate=2_000_000,
+        audio_bitrate=128_000,
+        format_bitrate=2_100_000,
+        frame_rate=30.0,
+    )
+
+
+def test_plan_segment_workers_respects_threshold_and_min_segment_length() -> None:
+    settings = EncodeSettings(segment_threshold_sec=120)
+
+    assert plan_segment_workers(_probe(300), EncodeSettings()) == 1
+    assert plan_segment_workers(_probe(90), settings) == 1
+    assert plan_segment_workers(_probe(125), settings) == 12
+
+
+def test_failed_segment_cancels_siblings_and_reports_real_error(tmp_path: Path) -> None:
+    broken = [sys.executable, "-c", "import sys; sys.stderr.write('bad segment'); sys.exit(1)"]
+    token = CancelToken()
+
+    tasks = [_step(cmd, deadline=float("inf"), token=token) for cmd in (SLOW, broken)]
+    with pytest.raises(FFmpegError, match="bad segment"):
+        _run_parallel(tasks, workers=2, token=token)
+
+    assert token.cancelled
+
+
+def test_batch_cancel_stops_every_segment() -> None:
+    token = CancelToken()
+    timer = threading.Timer(0.2, token.cancel)
+    timer.start()
+    started = time.monotonic()
+
+    with pytest.raises(BatchCancelled):
+        _run_parallel([_step(SLOW, float("inf"), token) for _ in range(2)], 2, token)
+
+    assert time.monotonic() - started < 10
+
+
+def test_step_timeouts_are_reported_as_timeout_errors() -> None:
+    token = CancelToken()
+    with pytest.raises(TimeoutError, match="ffmpeg 处理超时"):
+        _run_step(SLOW, time.monotonic() - 1, token)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError, match="ffmpeg 处理超时"):
+        _run_step(SLOW, time.monotonic() + 0.3, token)
+    assert time.monotonic() - started < 10
+
+
+def _available(slots: threading.Semaphore) -> int:
+    count = 0
+    while slots.acquire(blocking=False):
+        count += 1
+    for _ in range(count):
+        slots.release()
+    return count
+
+
+async def _available_async(slots: asyncio.Semaphore) -> int:
+    count = 0
+    while not slots.locked():
+        await slots.acquire()
+        count += 1
+    for _ in range(count):
+        slots.release()
+    return count
+
+
+def _fake_encoders(monkeypatch: pytest.MonkeyPatch, calls: list[str | int]) -> None:
+    # 125 秒的源视频最多分 12 段；记录实际走的是单进程编码还是几路分段
+    def fake_single(*args: object, **kwargs: object) -> str:
+        calls.append("single")
+        return "single"
+
+    async def fake_single_async(*args: object, **kwargs: object) -> str:
+        return fake_single()
+
+    def fake_segmented(**kwargs: object) -> str:
+        calls.append(kwargs["workers"])
+        if kwargs["output_video"].name == "broken.mp4":
+            raise FFmpegError("bad segment")
+        return "segmented"
+
+    async def fake_probe_async(path: Path) -> VideoProbe:
+        return _probe(125)
+
+    monkeypatch.setattr(segment_encoder, "probe_video", lambda path, cancel_token=None: _probe(125))
+    monkeypatch.setattr(segment_encoder, "probe_video_async", fake_probe_async)
+    monkeypatch.setattr(segment_encoder, "concat_with_endcard", fake_single)
+    monkeypatch.setattr(segment_encoder, "concat_with_endcard_async", fake_single_async)
+    monkeypatch.setattr(segment_encoder, "concat_segmented", fake_segmented)
+
+
+def test_thread_path_borrows_idle_slots_and_always_returns_them(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls: list[str | int] = []
+    _fake_encoders(monkeypatch, calls)
+    settings = EncodeSettings(segment_threshold_sec=60)
+    endcard = tmp_path / "endcard.mp4"
+
+    def encode(slots: threading.Semaphore, name: str = "out.mp4") -> object:
+        return encode_with_endcard(
+            tmp_path / "src.mp4",
+            endcard,
+            tmp_path / name,
+            60,
+            settings=settings,
+            encode_slots=slots,
+            endcard_probe=_probe(3),
+        )
+
+    # 调用方自己的槽位之外还空着 3 个：借满 3 个，共 4 路分段
+    slots = threading.Semaphore(3)
+    assert encode(slots) == "segmented"
+    assert _available(slots) == 3
+    # 没有空闲槽位时不等待，直接单进程编码
+    assert encode(threading.Semaphore(0)) == "single"
+    with pytest.raises(FFmpegError):
+        encode(slots, "broken.mp4")
+    assert _available(slots) == 3
+    assert calls == [4, "single", 4]
+
+
+def test_async_path_borrows_idle_slots_and_always_returns_them(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls: list[str | int] = []
+    _fake_encoders(monkeypatch, calls)
+    settings = EncodeSettings(segment_threshold_sec=60)
+
+    async def encode(slots: asyncio.Semaphore, name: str = "out.mp4") -> object:
+        return await encode_with_endcard_async(
+            tmp_path / "src.mp4",
+            tmp_path / "endcard.mp4",
+            tmp_path / name,
+            60,
+            settings=settings,
+            encode_slots=slots,
+            endcard_probe=_probe(3),
+        )
+
+    async def main() -> None:
+        slots = asyncio.Semaphore(3)
+        assert await encode(slots) == "segmented"
+        assert await _available_async(slots) == 3
+        assert await encode(asyncio.Semaphore(0)) == "single"
+        with pytest.raises(FFmpegError):
+            await encode(slots, "broken.mp4")
+        assert await _available_async(slots) == 3
+
+    asyncio.run(main())
+    assert calls == [4, "single", 4]
+
+
+class _RacingSlots(AsyncSessionSlots):
+    # 另一个会话的线程总是在检查空闲槽位之后、获取之前抢走最后一个槽位
+    def __init__(self, session: ExecutionSession, rival: ExecutionSession) -> None:
+        super().__init__(session)
+        self.rival = rival
+
+    def locked(self) -> bool:
+        locked = super().locked()
+        self.rival.acquire(blocking=False)
+        return locked
+
+    def try_acquire(self) -> bool:
+        self.rival.acquire(blocking=False)
+        return super().try_acquire()
+
+
+def test_async_borrowing_never_waits_on_a_contended_shared_pool(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls: list[str | int] = []
+    _fake_encoders(monkeypatch, calls)
+    service = ExecutionService(limit=2)
+    session = service.open_session("mine")
+    rival = service.open_session("rival")
+
+    async def main() -> object:
+        await session.as_async().acquire()
+        result = await asyncio.wait_for(
+            encode_with_endcard_async(
+                tmp_path / "src.mp4",
+                tmp_path / "endcard.mp4",
+                tmp_path / "out.mp4",
+                60,
+                settings=EncodeSettings(segment_threshold_sec=60),
+                encode_slots=_RacingSlots(session, rival),
+                endcard_probe=_probe(3),
+            ),
+            timeout=2,
+        )
+        session.release()
+        return result
+
+    # 空闲槽位被其他会话抢走后不阻塞等待，直接单进程编码
+    assert asyncio.run(main()) == "single"
+    assert calls == ["single"]
+    assert session.status().running == 0
+    rival.release()
+    assert session.acquire(blocking=False) and session.acquire(blocking=False)
+
+
+def test_cancelling_the_async_task_cancels_segments_and_returns_slots(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _fake_encoders(monkeypatch, [])
+    tokens: list[CancelToken] = []
+    entered = threading.Event()
+
+    def blocking_segmented(**kwargs: object) -> str:
+        token = kwargs["cancel_token"]
+        tokens.append(token)
+        entered.set()
+        token.wait(5)
+        raise BatchCancelled("已取消")
+
+    monkeypatch.setattr(segment_encoder, "concat_segmented", blocking_segmented)
+
+    async def main() -> int:
+        slots = asyncio.Semaphore(2)
+        task = asyncio.create_task(
+            encode_with_endcard_async(
+                tmp_path / "src.mp4",
+                tmp_path / "endcard.mp4",
+                tmp_path / "out.mp4",
+                60,
+                settings=EncodeSettings(segment_threshold_sec=60),
+                encode_slots=slots,
+                endcard_probe=_probe(3),
+            )
+        )
+        while not entered.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await _available_async(slots)
+
+    assert asyncio.run(main()) == 2
+    assert tokens[0].cancelled
+
+
+def _fake_steps(
+    monkeypatch: pytest.MonkeyPatch, fail: str = "", block: bool = False
+) -> list[Path]:
+    # 按命令的输出路径写出假文件；piece_dirs 记录每次用到的临时目录
+    piece_dirs: list[Path] = []
+
+    def fake_run_step(cmd: list[str], deadline: float, token: CancelToken) -> None:
+        target = Path(cmd[-1])
+        if "segment" in cmd:
+            piece_dirs.append(target.parent)
+            for index in range(2):
+                (target.parent / f"src_{index:04d}.mp4").write_bytes(b"v")
+            return
+        if target.name == fail:
+            raise FFmpegError("bad segment")
+        if block and target.name.startswith("enc_"):
+            token.wait(5)
+            token.raise_if_cancelled()
+        target.write_bytes(b"x")
+
+    monkeypatch.setattr(segment_encoder, "_run_step", fake_run_step)
+    return piece_dirs
+
+
+def _segmented(
+    tmp_path: Path, timeout_sec: float = 60, cancel_token: CancelToken | None = None
+) -> object:
+    return concat_segmented(
+        source_video=tmp_path / "src.mp4",
+        endcard_video=tmp_path / "endcard.mp4",
+        output_video=tmp_path / "out.mp4",
+        source_probe=_probe(125),
+        endcard_probe=_probe(3),
+        settings=EncodeSettings(segment_threshold_sec=60),
+        workers=3,
+        timeout_sec=timeout_sec,
+        cancel_token=cancel_token,
+    )
+
+
+def test_segmented_encode_removes_its_pieces(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    piece_dirs = _fake_steps(monkeypatch)
+
+    policy = _segmented(tmp_path)
+
+    assert policy.segments == 2
+    assert (tmp_path / "out.mp4").read_bytes() == b"x"
+    assert not piece_dirs[0].exists()
+
+
+def test_failed_or_cancelled_segmented_encode_removes_its_pieces(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    piece_dirs = _fake_steps(monkeypatch, fail="enc_src_0001.mp4")
+    with pytest.raises(FFmpegError, match="bad segment"):
+        _segmented(tmp_path)
+    assert not piece_dirs[0].exists()
+
+    piece_dirs = _fake_steps(monkeypatch, block=True)
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel).start()
+    with pytest.raises(BatchCancelled):
+        _segmented(tmp_path, cancel_token=token)
+    assert not piece_dirs[0].exists()
+
+    with pytest.raises(TimeoutError, match="任务超时"):
+        _segmented(tmp_path, timeout_sec=0)
+    assert list(tmp_path.iterdir()) == []
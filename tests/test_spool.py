@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from video_splicer.spool import DiskBudget, DiskBudgetExceeded, estimate_task_bytes
+
+
+def test_reservation_resize_settle_and_release_track_usage() -> None:
+    budget = DiskBudget(limit_bytes=1000)
+
+    reservation = budget.reserve(600)
+    assert budget.used_bytes == 600
+
+    reservation.resize(400)
+    assert budget.used_bytes == 400
+
+    reservation.settle(150)
+    assert budget.used_bytes == 150
+
+    reservation.release()
+    assert budget.used_bytes == 0
+
+
+def test_oversized_request_is_clamped_to_whole_budget() -> None:
+    budget = DiskBudget(limit_bytes=1000)
+
+    reservation = budget.reserve(5000)
+
+    assert reservation.nbytes == 1000
+
+
+def test_reserve_waits_for_in_flight_task_to_release() -> None:
+    budget = DiskBudget(limit_bytes=1000)
+    first = budget.reserve(800)
+
+    def release_later() -> None:
+        time.sleep(0.1)
+        first.release()
+
+    threading.Thread(target=release_later).start()
+    second = budget.reserve(800)
+
+    assert second.nbytes == 800
+    assert budget.used_bytes == 800
+
+
+def test_reserve_fails_when_only_settled_outputs_hold_budget() -> None:
+    budget = DiskBudget(limit_bytes=1000)
+    budget.reserve(900).settle(900)
+
+    with pytest.raises(DiskBudgetExceeded):
+        budget.reserve(500)
+
+
+def test_unlimited_budget_never_blocks() -> None:
+    budget = DiskBudget(limit_bytes=0)
+
+    budget.reserve(10**12)
+    budget.reserve(10**12)
+
+
+def test_estimate_includes_source_predicted_output_and_endcard() -> None:
+    assert estimate_task_bytes(source_bytes=1000, endcard_bytes=200) == 1000 + 1200 + 200
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+import pytest
+
+from video_splicer import runner
+from video_splicer.async_runner import process_batch_async
+from video_splicer.input_parser import (
+    iter_output_filenames,
+    iter_split_inputs,
+    parse_split_inputs_with_errors,
+)
+from video_splicer.models import Config, InputRow, ParseFailure, TaskResult
+from video_splicer.runner import _RowFeed, _submit_windowed
+
+
+def _csv(count: int) -> bytes:
+    lines = ["pid,video_url"]
+    for i in range(count):
+        lines.append(f"p{i},https://e.com/{i}.mp4" if i % 3 else f"p{i},ftp://bad/{i}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def test_csv_rows_are_yielded_before_the_whole_upload_is_parsed() -> None:
+    items = iter_split_inputs("", "", upload_file_name="big.csv", upload_bytes=_csv(200_000))
+
+    first, second = next(items), next(items)
+
+    assert isinstance(first, ParseFailure) and first.index == 0
+    assert isinstance(second, InputRow) and second.pid_raw == "p1"
+
+
+def test_streamed_items_match_collected_parse_for_csv_and_excel() -> None:
+    payload = _csv(30)
+    rows, failures = parse_split_inputs_with_errors("", "", "in.csv", payload)
+    streamed = list(iter_split_inputs("", "", "in.csv", payload))
+    assert [item for item in streamed if isinstance(item, InputRow)] == rows
+    assert [item for item in streamed if isinstance(item, ParseFailure)] == failures
+    assert [item.index for item in streamed] == list(range(30))
+
+    buffer = BytesIO()
+    pd.DataFrame({"商品id": ["a", "b", None], "视频链接": ["https://e.com/a", "", "x"]}).to_excel(
+        buffer, index=False
+    )
+    excel = list(iter_split_inputs("", "", "in.xlsx", buffer.getvalue()))
+    assert [(type(item).__name__, item.index) for item in excel] == [
+        ("InputRow", 0),
+        ("ParseFailure", 1),
+    ]
+
+
+def test_output_names_follow_input_order_while_streaming() -> None:
+    items = iter_split_inputs("", "", upload_file_name="in.csv", upload_bytes=_csv(7))
+    valid = (item for item in items if isinstance(item, InputRow))
+    assert [(row.index, name) for row, name in iter_output_filenames(valid)] == [
+        (1, "1.mp4"),
+        (2, "2.mp4"),
+        (4, "3.mp4"),
+        (5, "4.mp4"),
+    ]
+
+
+def test_windowed_submission_keeps_bounded_tasks_in_flight() -> None:
+    pulled = 0
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def source():  # noqa: ANN202
+        nonlocal pulled
+        for i in range(50):
+            pulled += 1
+            yield i
+
+    def work(value: int) -> int:
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        threading.Event().wait(0.002)
+        with lock:
+            in_flight -= 1
+        return value * 2
+
+    feed = _RowFeed(source())
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = []
+        for job, future in _submit_windowed(feed, lambda job: executor.submit(work, job), 4):
+            # 还没消费完的结果不会让读取无限超前
+            assert pulled - len(results) <= 4
+            results.append((job, future.result()))
+
+    assert sorted(results) == [(i, i * 2) for i in range(50)]
+    assert peak <= 2
+    assert not feed.sized and feed.total == 50
+    assert _RowFeed([1, 2, 3]).describe() == "共 3 条"
+
+
+@pytest.mark.parametrize("engine", ["thread", "asyncio"])
+def test_input_read_error_still_removes_the_work_dir(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, engine: str
+) -> None:
+    def fake_single(row, output_filename, config, ctx, cancel_token):  # noqa: ANN001
+        return TaskResult(
+            index=row.index,
+            pid=row.pid_raw,
+            output_filename=output_filename,
+            status="FAILED",
+            error="boom",
+            duration_sec=0.0,
+            output_path=None,
+        )
+
+    async def fake_single_async(row, output_filename, **kwargs):  # noqa: ANN001, ANN003
+        return fake_single(row, output_filename, None, None, None)
+
+    monkeypatch.setattr(runner, "_process_single", fake_single)
+    monkeypatch.setattr("video_splicer.async_runner._process_single_async", fake_single_async)
+
+    def rows() -> Iterator[InputRow]:
+        yield InputRow(index=0, pid_raw="p0", pid_sanitized="p0", video_url="https://e.com/0.mp4")
+        raise ValueError("表格读取失败")
+
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"e")
+    spool = tmp_path / "spool"
+    config = Config(endcard_path=endcard, spool_dir=spool, engine=engine)
+    batch = process_batch_async if engine == "asyncio" else runner.process_batch
+
+    with pytest.raises(ValueError, match="表格读取失败"):
+        batch(rows(), config)
+
+    # 读取输入出错时批次中止，但工作目录照样清理
+    assert list(spool.iterdir()) == []
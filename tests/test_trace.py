@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import json
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from video_splicer import runner
+from video_splicer.artifact import write_download_artifact
+from video_splicer.models import Config, InputRow, TaskResult
+from video_splicer.trace import BatchTrace, activate, propagate, span
+
+
+def _events(trace: BatchTrace) -> list[dict]:
+    return json.loads(trace.to_json())["traceEvents"]
+
+
+def test_spans_are_noop_without_active_trace() -> None:
+    trace = BatchTrace()
+    with span("ffmpeg", "encode"):
+        pass
+    assert trace.span_count() == 0
+
+
+def test_spans_carry_lane_and_propagate_to_pool_threads() -> None:
+    trace = BatchTrace()
+    with activate(trace, lane="batch"):
+        with span("preflight", "batch", rows=3):
+            pass
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="sp-test") as executor:
+            executor.submit(propagate(lambda: _traced("ffmpeg"))).result()
+
+    events = _events(trace)
+    names = {event["args"]["name"] for event in events if event["ph"] == "M"}
+    spans = {event["name"]: event for event in events if event["ph"] == "X"}
+
+    assert names == {"batch", "sp-test_0"}
+    assert spans["preflight"]["args"]["rows"] == 3
+    assert spans["preflight"]["tid"] != spans["ffmpeg"]["tid"]
+    assert spans["ffmpeg"]["args"]["thread"] == "sp-test_0"
+
+
+def test_span_records_error_type() -> None:
+    trace = BatchTrace()
+    with activate(trace), pytest.raises(TimeoutError):
+        with span("download", "download", attempt=1):
+            raise TimeoutError("下载超时")
+
+    (event,) = [event for event in _events(trace) if event["ph"] == "X"]
+    assert event["args"]["error"] == "TimeoutError"
+
+
+def test_trace_is_packaged_next_to_result_csv(tmp_path: Path) -> None:
+    trace = BatchTrace()
+    result = TaskResult(
+        index=0,
+        pid="p0",
+        output_filename="1.mp4",
+        status="FAILED",
+        error="x",
+        duration_sec=0.0,
+        output_path=None,
+    )
+
+    with activate(trace):
+        mime, _, path = write_download_artifact([result], tmp_path, trace=trace)
+
+    assert mime == "application/zip"
+    with zipfile.ZipFile(path) as archive:
+        assert set(archive.namelist()) == {"result.csv", "trace.json"}
+        events = json.loads(archive.read("trace.json"))["traceEvents"]
+    assert any(event["name"] == "artifact_write" for event in events)
+
+
+def test_process_batch_records_queue_wait_and_task_per_worker(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def fake_single(row, output_filename, config, ctx, cancel_token):  # noqa: ANN001
+        return TaskResult(
+            index=row.index,
+            pid=row.pid_raw,
+            output_filename=output_filename,
+            status="SUCCESS",
+            error="",
+            duration_sec=0.0,
+            output_path=None,
+        )
+
+    monkeypatch.setattr(runner, "_process_single", fake_single)
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"e")
+    rows = [
+        InputRow(index=i, pid_raw=f"p{i}", pid_sanitized=f"p{i}", video_url=f"https://e.com/{i}")
+        for i in range(3)
+    ]
+    trace = BatchTrace()
+
+    runner.process_batch(rows, Config(endcard_path=endcard, max_workers=2), tracer=trace)
+
+    spans = [event for event in _events(trace) if event["ph"] == "X"]
+    tasks = [event for event in spans if event["name"] == "task"]
+    assert sorted(event["args"]["index"] for event in tasks) == [0, 1, 2]
+    assert all(event["args"]["status"] == "SUCCESS" for event in tasks)
+    assert all(event["args"]["worker"].startswith("sp-worker") for event in tasks)
+    assert len([event for event in spans if event["name"] == "queue_wait"]) == 3
+    assert any(event["name"] == "endcard_prepare" for event in spans)
+
+
+def _traced(name: str) -> None:
+    with span(name, "encode"):
+        pass
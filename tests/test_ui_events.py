@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from video_splicer.ui_events import UiEventBus
+
+
+def _bus(now: list[float], max_lines: int = 500) -> UiEventBus:
+    return UiEventBus(
+        flush_interval_sec=0.25,
+        max_lines=max_lines,
+        clock=lambda: now[0],
+        timestamp=lambda: "00:00:00",
+    )
+
+
+def test_updates_within_interval_are_coalesced() -> None:
+    now = [0.0]
+    bus = _bus(now)
+
+    bus.log("a")
+    first = bus.poll()
+    assert first is not None
+    assert first.new_lines == ["[00:00:00] a"]
+
+    now[0] = 0.1
+    bus.log("b")
+    bus.progress(1, 3)
+    bus.log("c")
+    assert bus.poll() is None
+
+    now[0] = 0.3
+    second = bus.poll()
+    assert second is not None
+    assert second.new_lines == ["[00:00:00] b", "[00:00:00] c"]
+    assert second.progress == (1, 3)
+
+
+def test_poll_returns_none_when_nothing_changed() -> None:
+    now = [0.0]
+    bus = _bus(now)
+    bus.progress(1, 2)
+    assert bus.poll() is not None
+
+    now[0] = 1.0
+    bus.progress(1, 2)
+    assert bus.poll() is None
+
+
+def test_force_flush_ignores_interval() -> None:
+    now = [0.0]
+    bus = _bus(now)
+    bus.log("a")
+    bus.poll()
+
+    bus.log("b")
+    delta = bus.poll(force=True)
+
+    assert delta is not None
+    assert delta.new_lines == ["[00:00:00] b"]
+
+
+def test_log_buffer_is_bounded() -> None:
+    now = [0.0]
+    bus = _bus(now, max_lines=3)
+
+    for i in range(10):
+        bus.log(str(i))
+
+    assert bus.lines() == ["[00:00:00] 7", "[00:00:00] 8", "[00:00:00] 9"]
+    assert bus.lines(last=1) == ["[00:00:00] 9"]
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+import launcher
+from video_splicer import endcard_pool, warmup
+from video_splicer.endcard_pool import EndcardPool, warm_endcards
+from video_splicer.ffmpeg_pipeline import VideoProbe
+from video_splicer.models import Config
+
+
+def _probe() -> VideoProbe:
+    return VideoProbe(
+        width=1080,
+        height=1920,
+        duration_sec=3.0,
+        has_audio=True,
+        video_bitrate=0,
+        audio_bitrate=0,
+        format_bitrate=0,
+    )
+
+
+def test_warmed_endcards_are_not_probed_again_until_the_file_changes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    probed: list[Path] = []
+
+    def fake_probe(path, cancel_token=None):  # noqa: ANN001
+        probed.append(path)
+        return _probe()
+
+    monkeypatch.setattr(endcard_pool, "probe_video", fake_probe)
+    default = tmp_path / "default.mp4"
+    default.write_bytes(b"default")
+    registry_dir = tmp_path / "endcards"
+    registry_dir.mkdir()
+    (registry_dir / "spring.mp4").write_bytes(b"spring")
+    config = Config(endcard_path=default, endcard_dir=registry_dir)
+
+    assert warm_endcards(config) == 2
+    pool = EndcardPool(default, {"spring": registry_dir / "spring.mp4"}, tmp_path / "pieces")
+    pool.prepare(["", "spring"])
+    assert probed == [default, registry_dir / "spring.mp4"]
+
+    default.write_bytes(b"replaced default")
+    EndcardPool(default, {}, tmp_path / "pieces").prepare([""])
+    assert probed[-1] == default and len(probed) == 3
+
+
+def test_startup_phases_are_recorded_once_from_the_launch_time(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(warmup, "_startup", {})
+    monkeypatch.delenv(warmup.LAUNCH_ENV, raising=False)
+    assert warmup.record_startup("first_render") is None
+    assert warmup.format_startup() == ""
+
+    monkeypatch.setenv(warmup.LAUNCH_ENV, str(time.time() - 2.0))
+    first = warmup.record_startup("first_render")
+    assert first is not None and first >= 2.0
+    assert warmup.record_startup("first_render") == first
+    warmup.record_startup("server_ready", 1.25)
+
+    assert warmup.format_startup() == f"启动耗时：服务就绪 1.25 秒，首屏 {first:.2f} 秒"
+
+
+class _Health(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802
+        self.send_response(200 if self.path == "/_stcore/health" else 404)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def test_launcher_waits_for_the_health_endpoint() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Health)
+    port = server.server_address[1]
+    server.server_close()
+    url = f"http://127.0.0.1:{port}"
+    assert launcher._wait_until_ready(url, timeout=0.3) is False
+
+    # 服务稍后才开始监听，轮询应在它就绪后立即返回
+    def serve_later() -> None:
+        time.sleep(0.3)
+        later = ThreadingHTTPServer(("127.0.0.1", port), _Health)
+        servers.append(later)
+        later.serve_forever()
+
+    servers: list[ThreadingHTTPServer] = []
+    threading.Thread(target=serve_later, daemon=True).start()
+    started_at = time.monotonic()
+    try:
+        assert launcher._wait_until_ready(url, timeout=10) is True
+        assert time.monotonic() - started_at < 5
+    finally:
+        for later in servers:
+            later.shutdown()
+            later.server_close()
+
+
+def test_warmup_runs_once_per_process(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(warmup, "_warmup", None)
+    monkeypatch.setattr(warmup, "_startup", {})
+    monkeypatch.setattr(warmup, "WARM_PROGRAMS", ())
+    monkeypatch.setattr(endcard_pool, "probe_video", lambda path, cancel_token=None: _probe())
+    endcard = tmp_path / "endcard.mp4"
+    endcard.write_bytes(b"endcard")
+    monkeypatch.setenv(warmup.LAUNCH_ENV, str(time.time()))
+
+    first = warmup.start_warmup(Config(endcard_path=endcard))
+    assert warmup.start_warmup(Config(endcard_path=endcard)) is first
+    assert first.done.wait(10)
+
+    assert first.error == ""
+    assert first.endcards == 1
+    assert set(first.steps) == {"imports", "runtime_checks", "endcards"}
+    assert "warmup" in warmup._startup
@@ -1,25 +1,37 @@
-from .artifact import build_download_artifact, build_result_csv
+from .artifact import build_download_artifact, build_result_csv, write_download_artifact
+from .artifact_store import ArtifactStore, get_artifact_store
+from .async_runner import process_batch_async
 from .config import load_config, validate_runtime
 from .input_parser import (
     assign_output_filenames,
+    iter_output_filenames,
+    iter_split_inputs,
     parse_inputs,
     parse_inputs_with_errors,
     parse_split_inputs_with_errors,
 )
 from .models import Config, InputRow, TaskResult
+from .result_store import ResultStore
 from .runner import process_batch
 
 __all__ = [
+    "ArtifactStore",
     "Config",
     "InputRow",
+    "ResultStore",
     "TaskResult",
     "assign_output_filenames",
     "build_download_artifact",
     "build_result_csv",
+    "get_artifact_store",
+    "iter_output_filenames",
+    "iter_split_inputs",
     "load_config",
     "parse_inputs",
     "parse_inputs_with_errors",
     "parse_split_inputs_with_errors",
     "process_batch",
+    "process_batch_async",
     "validate_runtime",
+    "write_download_artifact",
 ]
@@ -1,32 +1,25 @@
 from __future__ import annotations
 
-import csv
 import io
+import os
+import shutil
+import uuid
 import zipfile
 from datetime import datetime
 from pathlib import Path
+from typing import Iterable
 
 from .models import TaskResult
+from .result_store import ResultStore
+from .trace import TRACE_FILE_NAME, BatchTrace, span
 
 
-def build_result_csv(results: list[TaskResult]) -> bytes:
-    ordered = sorted(results, key=lambda item: item.index)
+RESULT_PARQUET_NAME = "result.parquet"
 
-    sio = io.StringIO(newline="")
-    writer = csv.writer(sio)
-    writer.writerow(["pid", "output_filename", "status", "error", "duration_sec"])
-
-    for result in ordered:
-        writer.writerow(
-            [
-                result.pid,
-                result.output_filename,
-                result.status,
-                result.error,
-                f"{result.duration_sec:.3f}",
-            ]
-        )
 
+def build_result_csv(results: list[TaskResult] | ResultStore) -> bytes:
+    sio = io.StringIO(newline="")
+    _as_store(results).write_csv(sio)
     return sio.getvalue().encode("utf-8-sig")
 
 
@@ -52,16 +45,100 @@ def build_download_artifact(results: list[TaskResult]) -> tuple[str, str, bytes]
                 continue
             if not result.output_path.exists():
                 continue
-            archive.writestr(result.output_filename, result.output_path.read_bytes())
+            archive.write(result.output_path, arcname=result.output_filename)
 
         archive.writestr("result.csv", result_csv)
 
+    return "application/zip", _zip_name(), zip_buffer.getvalue()
+
+
+def write_download_artifact(
+    results: list[TaskResult] | ResultStore,
+    destination_dir: Path,
+    trace: BatchTrace | None = None,
+    parquet: bool = False,
+) -> tuple[str, str, Path]:
+    # 与 build_download_artifact 规则一致，但结果直接落盘，不在内存中持有整份产物；
+    # 附带时间线或 Parquet 时总是打包为 ZIP，与 result.csv 放在一起
+    store = _as_store(results)
+    force_zip = trace is not None or parquet
+    with span("artifact_write", "artifact", rows=len(store)):
+        mime, file_name, target = _write_artifact(store, destination_dir, force_zip)
+        if parquet:
+            _append_parquet(store, target)
+    if trace is not None:
+        with zipfile.ZipFile(target, mode="a", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(TRACE_FILE_NAME, trace.to_json())
+    return mime, file_name, target
+
+
+def _as_store(results: list[TaskResult] | ResultStore) -> ResultStore:
+    return results if isinstance(results, ResultStore) else ResultStore.from_results(results)
+
+
+def _write_artifact(
+    store: ResultStore,
+    destination_dir: Path,
+    force_zip: bool,
+) -> tuple[str, str, Path]:
+    destination_dir.mkdir(parents=True, exist_ok=True)
+
+    if len(store) == 1 and not force_zip:
+        single = store.results()[0]
+        if single.status == "SUCCESS" and single.output_path and single.output_path.exists():
+            target = _staging_path(destination_dir, ".mp4")
+            _link_or_copy(single.output_path, target)
+            return "video/mp4", single.output_filename, target
+
+    if len(store) <= 1 and not force_zip:
+        target = _staging_path(destination_dir, ".csv")
+        with target.open("w", encoding="utf-8-sig", newline="") as stream:
+            store.write_csv(stream)
+        return "text/csv", "result.csv", target
+
+    target = _staging_path(destination_dir, ".zip")
+    with zipfile.ZipFile(target, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for output_filename, output_path in store.iter_outputs():
+            if not output_path.exists():
+                continue
+            archive.write(output_path, arcname=output_filename)
+
+        # result.csv 边生成边压缩写入，不在内存中拼出整份 CSV
+        with archive.open("result.csv", mode="w") as entry:
+            with io.TextIOWrapper(entry, encoding="utf-8-sig", newline="") as stream:
+                store.write_csv(stream)
+
+    return "application/zip", _zip_name(), target
+
+
+def _append_parquet(store: ResultStore, target: Path) -> None:
+    staged = target.with_suffix(".parquet")
+    try:
+        store.write_parquet(staged)
+        with zipfile.ZipFile(target, mode="a", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.write(staged, arcname=RESULT_PARQUET_NAME)
+    finally:
+        staged.unlink(missing_ok=True)
+
+
+def _zip_name() -> str:
     timestamp = datetime.now().strftime("%m-%d-%H-%M")
-    zip_name = f"results-{timestamp}.zip"
-    return "application/zip", zip_name, zip_buffer.getvalue()
+    return f"results-{timestamp}.zip"
+
+
+def _staging_path(destination_dir: Path, suffix: str) -> Path:
+    return destination_dir / f"artifact-{uuid.uuid4().hex}{suffix}"
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    # 同盘时用硬链接，避免再复制一遍视频
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
 
 
-def collect_work_dirs(results: list[TaskResult]) -> list[Path]:
+def collect_work_dirs(results: Iterable[TaskResult]) -> list[Path]:
     work_dirs: set[Path] = set()
     for result in results:
         if result.output_path is None:
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from .models import Config
+
+
+DEFAULT_ARTIFACT_DIR = Path(tempfile.gettempdir()) / "video_splicer_artifacts"
+
+
+@dataclass(frozen=True)
+class StoredArtifact:
+    artifact_id: str
+    mime: str
+    file_name: str
+    path: Path
+    size_bytes: int
+    created_at: float
+
+
+class ArtifactStore:
+    def __init__(
+        self,
+        root: Path,
+        ttl_sec: int,
+        max_total_bytes: int,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.root = root
+        self.ttl_sec = ttl_sec
+        self.max_total_bytes = max_total_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def staging_dir(self) -> Path:
+        # 与正式目录同盘，放入仓库时只需 rename
+        staging = self.root / ".staging"
+        staging.mkdir(parents=True, exist_ok=True)
+        return staging
+
+    def put_file(self, source: Path, mime: str, file_name: str) -> str:
+        artifact_id = uuid.uuid4().hex
+        data_path = self._data_path(artifact_id)
+        shutil.move(str(source), str(data_path))
+        now = self._clock()
+        meta = {
+            "mime": mime,
+            "file_name": file_name,
+            "size_bytes": data_path.stat().st_size,
+            "created_at": now,
+        }
+        with self._lock:
+            self._meta_path(artifact_id).write_text(json.dumps(meta), encoding="utf-8")
+            os.utime(data_path, (now, now))
+        self.cleanup(keep=artifact_id)
+        return artifact_id
+
+    def get(self, artifact_id: str) -> StoredArtifact | None:
+        with self._lock:
+            artifact = self._load(artifact_id)
+            if artifact is None:
+                return None
+            if self._expired(artifact):
+                self._remove(artifact_id)
+                return None
+            # 以数据文件的 atime/mtime 记录最近访问时间，供容量淘汰使用
+            now = self._clock()
+            os.utime(artifact.path, (now, now))
+            return artifact
+
+    def read_bytes(self, artifact_id: str) -> bytes | None:
+        artifact = self.get(artifact_id)
+        if artifact is None:
+            return None
+        try:
+            return artifact.path.read_bytes()
+        except OSError:
+            return None
+
+    def delete(self, artifact_id: str) -> None:
+        with self._lock:
+            self._remove(artifact_id)
+
+    def cleanup(self, keep: str | None = None) -> int:
+        removed = 0
+        with self._lock:
+            artifacts = [
+                item
+                for item in (self._load(meta.stem) for meta in self.root.glob("*.json"))
+                if item is not None
+            ]
+            alive: list[StoredArtifact] = []
+            for artifact in artifacts:
+                if self._expired(artifact) and artifact.artifact_id != keep:
+                    self._remove(artifact.artifact_id)
+                    removed += 1
+                else:
+                    alive.append(artifact)
+
+            total = sum(item.size_bytes for item in alive)
+            if self.max_total_bytes > 0 and total > self.max_total_bytes:
+                # 超出容量时按最近访问时间从旧到新淘汰
+                alive.sort(key=lambda item: self._last_access(item))
+                for artifact in alive:
+                    if total <= self.max_total_bytes:
+                        break
+                    if artifact.artifact_id == keep:
+                        continue
+                    self._remove(artifact.artifact_id)
+                    total -= artifact.size_bytes
+                    removed += 1
+        return removed
+
+    def _data_path(self, artifact_id: str) -> Path:
+        return self.root / f"{artifact_id}.bin"
+
+    def _meta_path(self, artifact_id: str) -> Path:
+        return self.root / f"{artifact_id}.json"
+
+    def _load(self, artifact_id: str) -> StoredArtifact | None:
+        if not artifact_id.isalnum():
+            return None
+        data_path = self._data_path(artifact_id)
+        try:
+            meta = json.loads(self._meta_path(artifact_id).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not data_path.is_file():
+            return None
+        return StoredArtifact(
+            artifact_id=artifact_id,
+            mime=str(meta.get("mime", "application/octet-stream")),
+            file_name=str(meta.get("file_name", artifact_id)),
+            path=data_path,
+            size_bytes=int(meta.get("size_bytes", 0)),
+            created_at=float(meta.get("created_at", 0.0)),
+        )
+
+    def _expired(self, artifact: StoredArtifact) -> bool:
+        return self.ttl_sec > 0 and self._clock() - artifact.created_at > self.ttl_sec
+
+    def _last_access(self, artifact: StoredArtifact) -> float:
+        try:
+            return artifact.path.stat().st_mtime
+        except OSError:
+            return artifact.created_at
+
+    def _remove(self, artifact_id: str) -> None:
+        self._data_path(artifact_id).unlink(missing_ok=True)
+        self._meta_path(artifact_id).unlink(missing_ok=True)
+
+
+_stores_lock = threading.Lock()
+_stores: dict[Path, ArtifactStore] = {}
+
+
+def get_artifact_store(config: Config) -> ArtifactStore:
+    # 同一进程内所有会话共用一个仓库，容量上限才能对整机生效
+    root = config.artifact_dir or DEFAULT_ARTIFACT_DIR
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = ArtifactStore(
+                root=root,
+                ttl_sec=config.artifact_ttl_sec,
+                max_total_bytes=config.artifact_max_mb * 1024 * 1024,
+            )
+            _stores[root] = store
+        return store
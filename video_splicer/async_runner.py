@@ -0,0 +1,464 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import aiohttp
+
+from .cancellation import CancelToken
+from .child_process import UsageCollector, collect_usage
+from .downloader import DownloadError, download_video_async, head_content_length_async
+from .endcard_pool import EndcardError
+from .execution_service import AsyncSessionSlots, ExecutionSession
+from .ffmpeg_pipeline import FFmpegError
+from .input_parser import assign_output_filenames, iter_output_filenames
+from .metrics import QUEUE_DEPTH, ensure_metrics_server, record_cache
+from .models import Config, InputRow, Status, TaskResult, TaskStats
+from .planner import EtaTracker
+from .preflight import run_preflight_async
+from .result_store import ResultStore
+from .runner import (
+    SUBMIT_WINDOW_FACTOR,
+    LogCallback,
+    ProgressCallback,
+    ResultCallback,
+    _apply_preflight,
+    _BatchContext,
+    _create_batch_context,
+    _describe_batch_context,
+    _describe_batch_usage,
+    _describe_history,
+    _finish_batch_context,
+    _log,
+    _log_plan,
+    _preflight_enabled,
+    _remaining_seconds,
+    _report_result,
+    _RowFeed,
+    _settle_reservation,
+    _task_stats,
+    _track_result,
+)
+from .segment_encoder import encode_with_endcard_async
+from .trace import BatchTrace, activate, bind_lane, record_span, span
+from .spool import DiskBudgetExceeded, Reservation, deliver_output, estimate_task_bytes, file_size
+
+
+def process_batch_async(
+    rows: Iterable[InputRow],
+    config: Config,
+    log_cb: LogCallback | None = None,
+    progress_cb: ProgressCallback | None = None,
+    result_cb: ResultCallback | None = None,
+    cancel_token: CancelToken | None = None,
+    tracer: BatchTrace | None = None,
+    session: ExecutionSession | None = None,
+    eta: EtaTracker | None = None,
+    store: ResultStore | None = None,
+) -> ResultStore:
+    results = store if store is not None else ResultStore()
+    if isinstance(rows, list) and not rows:
+        return results
+    ensure_metrics_server(config)
+    asyncio.run(
+        _run_batch(
+            rows,
+            config,
+            log_cb,
+            progress_cb,
+            result_cb,
+            cancel_token,
+            tracer,
+            session,
+            eta,
+            results,
+        )
+    )
+    return results
+
+
+async def _run_batch(
+    rows: Iterable[InputRow],
+    config: Config,
+    log_cb: LogCallback | None,
+    progress_cb: ProgressCallback | None,
+    result_cb: ResultCallback | None,
+    cancel_token: CancelToken | None,
+    tracer: BatchTrace | None,
+    execution: ExecutionSession | None,
+    eta: EtaTracker | None,
+    results: ResultStore,
+) -> None:
+    with activate(tracer, lane="batch"):
+        await _run_tasks(
+            rows, config, log_cb, progress_cb, result_cb, cancel_token, execution, eta, results
+        )
+
+
+async def _run_tasks(
+    rows: Iterable[InputRow],
+    config: Config,
+    log_cb: LogCallback | None,
+    progress_cb: ProgressCallback | None,
+    result_cb: ResultCallback | None,
+    cancel_token: CancelToken | None,
+    execution: ExecutionSession | None,
+    eta: EtaTracker | None,
+    results: ResultStore,
+) -> None:
+    if _preflight_enabled(config):
+        rows = list(rows)
+    feed = _RowFeed(rows)
+    ctx = _create_batch_context(config, execution, eta)
+    # 出错时也要清理工作目录、写入历史，中间文件不能留在 spool 上
+    try:
+        _log(
+            log_cb,
+            f"批次开始（asyncio），{feed.describe()}，{_describe_batch_context(ctx)}，"
+            f"并发下载 {config.max_downloads}，并发编码 {config.max_workers}",
+        )
+        prepare_usage = UsageCollector()
+        prepared_endcards: set[str] = set()
+
+        # 下载与编码分开限流：网络等待不占用 CPU 槽位
+        net_sem = asyncio.Semaphore(config.max_downloads)
+        cpu_sem = (
+            execution.as_async() if execution is not None else asyncio.Semaphore(config.max_workers)
+        )
+        timeout = aiohttp.ClientTimeout(sock_connect=10, sock_read=15)
+        connector = aiohttp.TCPConnector(limit=config.max_downloads)
+
+        completed_count = 0
+
+        def record(result: TaskResult) -> None:
+            nonlocal completed_count
+            results.add(result)
+            completed_count += 1
+            _track_result(ctx, result, feed, log_cb)
+            _report_result(result, completed_count, feed.total, log_cb, progress_cb, result_cb)
+
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            tasks: dict[asyncio.Task, tuple[InputRow, str]] = {}
+
+            # 取消信号来自其他线程，回到事件循环里取消全部任务：
+            # 进行中的下载连接会被关闭，ffmpeg 子进程会被终止。预检与落版探测也拿到同一个
+            # 取消信号，在它们开始之前就登记，整个批次期间取消都有效
+            loop = asyncio.get_running_loop()
+            cancel_handle = None
+            if cancel_token is not None:
+                cancel_handle = cancel_token.add_callback(
+                    lambda: loop.call_soon_threadsafe(_cancel_tasks, tasks)
+                )
+
+            try:
+                jobs: Iterator[tuple[InputRow, str]] = iter_output_filenames(feed)
+                if _preflight_enabled(config):
+                    filename_map = assign_output_filenames(rows)
+                    with span("preflight", "batch", rows=len(rows)):
+                        outcomes = await run_preflight_async(
+                            session,
+                            rows,
+                            max_bytes=config.max_video_mb * 1024 * 1024,
+                            governor=ctx.governor,
+                            concurrency=config.max_downloads,
+                            cancel_token=cancel_token,
+                        )
+                    queued_rows, rejected = _apply_preflight(
+                        rows, outcomes, filename_map, config, ctx, log_cb
+                    )
+                    for result in rejected:
+                        record(result)
+                    jobs = iter([(row, filename_map[row.index]) for row in queued_rows])
+                    _log_plan(ctx, queued_rows, config, log_cb)
+                elif isinstance(rows, list):
+                    _log_plan(ctx, rows, config, log_cb)
+
+                # 任务按输入（或预检排序后）的顺序创建，信号量先到先得，执行顺序与之一致；
+                # 拿到下载槽位之前都算在队列里。输入边读边处理时只保持有限个任务在途
+                window = (
+                    None
+                    if feed.sized
+                    else (config.max_downloads + config.max_workers) * SUBMIT_WINDOW_FACTOR
+                )
+
+                exhausted = False
+                while True:
+                    while not exhausted and (window is None or len(tasks) < window):
+                        # 边读边处理时在线程里取下一行：解析 Excel/CSV 期间
+                        # 事件循环里进行中的下载不会停顿
+                        job = (
+                            next(jobs, None)
+                            if feed.sized
+                            else await asyncio.to_thread(next, jobs, None)
+                        )
+                        if job is None:
+                            exhausted = True
+                            break
+                        row, output_filename = job
+                        if row.endcard not in prepared_endcards:
+                            prepared_endcards.add(row.endcard)
+                            with span("endcard_prepare", "batch"), collect_usage(prepare_usage):
+                                await asyncio.to_thread(
+                                    ctx.endcards.prepare, [row.endcard], cancel_token
+                                )
+                        if cancel_token is not None and cancel_token.cancelled:
+                            # 取消之后才读到的行不再创建任务
+                            record(
+                                _result(
+                                    row,
+                                    output_filename,
+                                    ctx.output_dir / output_filename,
+                                    time.monotonic(),
+                                    "CANCELLED",
+                                    "已取消",
+                                )
+                            )
+                            continue
+                        QUEUE_DEPTH.inc()
+                        if execution is not None:
+                            execution.expect(1)
+                        task = asyncio.create_task(
+                            _process_single_async(
+                                row=row,
+                                output_filename=output_filename,
+                                config=config,
+                                session=session,
+                                net_sem=net_sem,
+                                cpu_sem=cpu_sem,
+                                ctx=ctx,
+                                cancel_token=cancel_token,
+                                queued_at=time.perf_counter(),
+                            )
+                        )
+                        tasks[task] = job
+                    if not tasks:
+                        break
+
+                    finished, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in finished:
+                        row, output_filename = tasks.pop(task)
+                        if task.cancelled():
+                            # 尚未开始执行就被取消的任务，没有机会自己离开队列
+                            QUEUE_DEPTH.dec()
+                            result = _result(
+                                row,
+                                output_filename,
+                                ctx.output_dir / output_filename,
+                                time.monotonic(),
+                                "CANCELLED",
+                                "已取消",
+                            )
+                        else:
+                            try:
+                                result = task.result()
+                            except Exception as exc:  # noqa: BLE001
+                                result = _result(
+                                    row,
+                                    output_filename,
+                                    ctx.output_dir / output_filename,
+                                    time.monotonic(),
+                                    "FAILED",
+                                    f"内部错误: {exc}",
+                                )
+                        if execution is not None:
+                            execution.task_done()
+                        record(result)
+            finally:
+                if cancel_token is not None:
+                    cancel_token.remove_callback(cancel_handle)
+                # 异常中止时先停下仍在途的任务，再清理它们所用的工作目录
+                _cancel_tasks(tasks)
+                if tasks:
+                    await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        _finish_batch_context(ctx, results)
+    _log(log_cb, _describe_batch_usage(results, prepare_usage.total))
+    if ctx.history is not None:
+        _log(log_cb, _describe_history(ctx))
+    if cancel_token is not None and cancel_token.cancelled:
+        _log(log_cb, "批次已取消")
+    else:
+        _log(log_cb, "批次处理完成")
+
+
+def _cancel_tasks(tasks: dict[asyncio.Task, tuple[InputRow, str]]) -> None:
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+
+
+async def _process_single_async(
+    row: InputRow,
+    output_filename: str,
+    config: Config,
+    session: aiohttp.ClientSession,
+    net_sem: asyncio.Semaphore,
+    cpu_sem: asyncio.Semaphore | AsyncSessionSlots,
+    ctx: _BatchContext,
+    cancel_token: CancelToken | None = None,
+    queued_at: float | None = None,
+) -> TaskResult:
+    # 协程都跑在事件循环线程上，每个任务单独一条泳道
+    bind_lane(f"task {row.index}")
+    with span("task", "task", index=row.index, pid=row.pid_raw) as task_args:
+        with collect_usage() as usage:
+            result = await _run_single_async(
+                row,
+                output_filename,
+                config,
+                session,
+                net_sem,
+                cpu_sem,
+                ctx,
+                cancel_token,
+                queued_at,
+            )
+        result.usage = usage.total
+        task_args["status"] = result.status
+        task_args["cpu_sec"] = round(result.usage.cpu_sec, 3)
+    return result
+
+
+async def _run_single_async(
+    row: InputRow,
+    output_filename: str,
+    config: Config,
+    session: aiohttp.ClientSession,
+    net_sem: asyncio.Semaphore,
+    cpu_sem: asyncio.Semaphore | AsyncSessionSlots,
+    ctx: _BatchContext,
+    cancel_token: CancelToken | None,
+    queued_at: float | None,
+) -> TaskResult:
+    output_path = ctx.output_dir / output_filename
+    download_path = ctx.download_dir / f"{row.index}.mp4"
+    max_bytes = config.max_video_mb * 1024 * 1024
+    reservation: Reservation | None = None
+    succeeded = False
+    delivered = False
+    started_at = time.monotonic()
+    # 任务超时只计算实际下载和编码的时间，排队等待信号量的时间不计入
+    active_sec = 0.0
+    queued = True
+
+    try:
+        endcard = ctx.endcards.get(row.endcard)
+        if ctx.budget.limit_bytes > 0:
+            record_cache("preflight_size", row.index in ctx.expected_bytes)
+            expected_bytes = ctx.expected_bytes.get(
+                row.index
+            ) or await head_content_length_async(session, row.video_url)
+            reservation = await ctx.budget.reserve_async(
+                estimate_task_bytes(min(expected_bytes or max_bytes, max_bytes), endcard.size_bytes)
+            )
+
+        async with net_sem:
+            QUEUE_DEPTH.dec()
+            queued = False
+            if queued_at is not None:
+                record_span("queue_wait", "queue", queued_at, index=row.index)
+            stage_started = time.monotonic()
+            await download_video_async(
+                session=session,
+                video_url=row.video_url,
+                destination=download_path,
+                max_bytes=max_bytes,
+                retries=config.download_retries,
+                total_timeout_sec=config.task_timeout_sec,
+                governor=ctx.governor,
+            )
+            download_sec = time.monotonic() - stage_started
+            active_sec += download_sec
+        source_bytes = file_size(download_path)
+        if reservation is not None:
+            reservation.resize(estimate_task_bytes(source_bytes, endcard.size_bytes))
+
+        async with cpu_sem:
+            stage_started = time.monotonic()
+            policy = await encode_with_endcard_async(
+                source_video=download_path,
+                endcard_video=endcard.path,
+                output_video=output_path,
+                timeout_sec=_remaining_seconds(
+                    stage_started - active_sec, config.task_timeout_sec
+                ),
+                settings=ctx.encode,
+                encode_slots=cpu_sem,
+                endcard_probe=endcard.probe,
+                endcard_cache=ctx.endcards.piece,
+            )
+            encode_sec = time.monotonic() - stage_started
+        download_path.unlink(missing_ok=True)
+
+        if ctx.deliver_dir is not None:
+            output_path = deliver_output(output_path, ctx.deliver_dir)
+            delivered = True
+
+        succeeded = True
+        return _result(
+            row,
+            output_filename,
+            output_path,
+            started_at,
+            "SUCCESS",
+            "",
+            encode_policy=policy.describe(),
+            output_duration_sec=policy.output_duration_sec,
+            stats=_task_stats(policy, source_bytes, download_sec, encode_sec),
+        )
+    except asyncio.CancelledError:
+        # 只吞掉批次取消引起的 CancelledError，其余情况继续向上传播
+        if cancel_token is None or not cancel_token.cancelled:
+            raise
+        return _result(row, output_filename, output_path, started_at, "CANCELLED", "已取消")
+    except TimeoutError:
+        return _result(
+            row,
+            output_filename,
+            output_path,
+            started_at,
+            "FAILED",
+            f"超时：超过 {config.task_timeout_sec} 秒",
+        )
+    except (DownloadError, FFmpegError, DiskBudgetExceeded, EndcardError) as exc:
+        return _result(row, output_filename, output_path, started_at, "FAILED", str(exc))
+    except Exception as exc:  # noqa: BLE001
+        return _result(
+            row, output_filename, output_path, started_at, "FAILED", f"未预期错误: {exc}"
+        )
+    finally:
+        if queued:
+            QUEUE_DEPTH.dec()
+        if download_path.exists():
+            download_path.unlink(missing_ok=True)
+        if not succeeded:
+            output_path.unlink(missing_ok=True)
+        if reservation is not None:
+            _settle_reservation(reservation, output_path, kept_on_spool=succeeded and not delivered)
+
+
+def _result(
+    row: InputRow,
+    output_filename: str,
+    output_path: Path,
+    started_at: float,
+    status: Status,
+    error: str,
+    encode_policy: str = "",
+    output_duration_sec: float = 0.0,
+    stats: TaskStats | None = None,
+) -> TaskResult:
+    return TaskResult(
+        index=row.index,
+        pid=row.pid_raw,
+        output_filename=output_filename,
+        status=status,
+        error=error,
+        duration_sec=time.monotonic() - started_at,
+        output_path=output_path,
+        encode_policy=encode_policy,
+        output_duration_sec=output_duration_sec,
+        stats=stats,
+    )
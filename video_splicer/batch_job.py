@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import importlib.util
+import shutil
+import threading
+import time
+from typing import Iterable, Iterator, Sized
+
+from .artifact import collect_work_dirs, write_download_artifact
+from .artifact_store import ArtifactStore
+from .async_runner import process_batch_async
+from .cancellation import CancelToken
+from .execution_service import ExecutionService, ExecutionSession, QueueStatus
+from .input_parser import iter_output_filenames
+from .models import Config, InputRow, ParseFailure, TaskResult
+from .planner import EtaTracker, load_model
+from .result_store import ResultStore
+from .runner import process_batch
+from .trace import BatchTrace, activate
+from .ui_events import UiEventBus
+
+
+class BatchJob:
+    def __init__(
+        self,
+        rows: Iterable[InputRow | ParseFailure],
+        failure_results: list[TaskResult],
+        config: Config,
+        artifact_store: ArtifactStore,
+        runtime_errors: list[str] | None = None,
+        execution_service: ExecutionService | None = None,
+    ) -> None:
+        self.config = config
+        self.artifact_store = artifact_store
+        self.runtime_errors = runtime_errors or []
+        # rows 可以是边解析边产出的生成器：批次线程按需读取，解析失败的行直接记为失败，
+        # 读完之前总数只统计已读到的行
+        self._streaming = not isinstance(rows, Sized)
+        self._source = iter(rows)
+        self._known_total = None if self._streaming else len(rows) + len(failure_results)
+        self._ingested = len(failure_results)
+        self._seen_rows: list[InputRow] = []
+        self.input_exhausted = not self._streaming
+        self.bus = UiEventBus()
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+        self.artifact_id: str | None = None
+        self.partial_artifact_id: str | None = None
+        self.first_output_sec: float | None = None
+        self.cancel_token = CancelToken()
+        # 批次线程开始处理时创建，界面据此展示预计剩余时间
+        self.eta: EtaTracker | None = None
+        self.tracer = BatchTrace() if config.trace else None
+        # 应用内所有会话共享编码槽位；未提供服务时批次按 SP_MAX_WORKERS 独立运行
+        self.execution: ExecutionSession | None = None
+        if execution_service is not None:
+            self.execution = execution_service.open_session(
+                label=f"{self.total} 条" if not self._streaming else "流式输入",
+                max_parallel=config.max_workers,
+                cancel_token=self.cancel_token,
+            )
+        self._lock = threading.Lock()
+        # 打包部分结果与批次结束清理互斥，避免打包时工作目录被删
+        self._artifact_lock = threading.Lock()
+        # 结果按列存放，界面直接读取零拷贝的 DataFrame 视图
+        self.result_store = ResultStore.from_results(failure_results)
+        self._thread = threading.Thread(target=self._run, name="sp-batch", daemon=True)
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def total(self) -> int:
+        return self._known_total if self._known_total is not None else self._ingested
+
+    def start(self) -> None:
+        self.bus.progress(len(self.result_store), self.total)
+        self._thread.start()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self.cancel_token.cancelled
+
+    def cancel(self) -> None:
+        if self.done or self.cancel_token.cancelled:
+            return
+        self.bus.log("已请求取消，正在停止进行中的任务")
+        self.cancel_token.cancel()
+
+    def queue_status(self) -> QueueStatus | None:
+        if self.execution is None or self.done:
+            return None
+        return self.execution.status()
+
+    def eta_text(self) -> str:
+        if self.eta is None or self.done:
+            return ""
+        return self.eta.describe()
+
+    def results(self) -> list[TaskResult]:
+        return self.result_store.results()
+
+    def completed_count(self) -> int:
+        return len(self.result_store)
+
+    def build_partial_artifact(self) -> str | None:
+        # 批次仍在进行时，把目前已完成的输出打包成一份可下载的产物
+        with self._artifact_lock:
+            if self.done:
+                return self.artifact_id
+            if not len(self.result_store):
+                return None
+            mime, file_name, path = write_download_artifact(
+                self.result_store, self.artifact_store.staging_dir()
+            )
+            artifact_id = self.artifact_store.put_file(
+                path, mime=mime, file_name=f"partial-{file_name}"
+            )
+            if self.partial_artifact_id:
+                self.artifact_store.delete(self.partial_artifact_id)
+            self.partial_artifact_id = artifact_id
+            return artifact_id
+
+    def _on_result(self, result: TaskResult) -> None:
+        # 批次之外产生的结果（解析失败、前置检查失败）由这里写入结果存储
+        self.result_store.add(result)
+        self._note_result(result)
+
+    def _note_result(self, result: TaskResult) -> None:
+        # 调度器已把结果写进同一个结果存储，这里只记录首个输出的时间
+        with self._lock:
+            if result.status == "SUCCESS" and self.first_output_sec is None:
+                self.first_output_sec = time.monotonic() - self.started_at
+                self.bus.log(f"首个输出已完成，用时 {self.first_output_sec:.1f} 秒")
+
+    def _ingest(self) -> Iterator[InputRow]:
+        for item in self._source:
+            self._ingested += 1
+            if isinstance(item, ParseFailure):
+                self._on_result(_failure_to_result(item))
+                self._on_progress()
+                continue
+            self._seen_rows.append(item)
+            yield item
+        self.input_exhausted = True
+
+    def _run(self) -> None:
+        try:
+            rows: Iterable[InputRow] = self._ingest() if self._streaming else list(self._ingest())
+            # 非流式输入且没有有效行时无需处理，只打包解析失败的结果
+            if rows or self._streaming:
+                self._process(rows)
+        except Exception as exc:  # noqa: BLE001
+            self.bus.log(f"批次异常中止: {exc}")
+            self._fail_all(f"内部错误: {exc}", only_missing=True)
+        finally:
+            self._finish()
+
+    def _process(self, rows: Iterable[InputRow]) -> None:
+        if self.runtime_errors:
+            self._fail_all("; ".join(self.runtime_errors))
+            self.bus.log("运行前置检查失败，已跳过处理")
+            return
+        batch_runner = process_batch_async if self.config.engine == "asyncio" else process_batch
+        self.eta = EtaTracker(load_model(self.config), self.config)
+        batch_runner(
+            rows=rows,
+            config=self.config,
+            log_cb=self.bus.log,
+            progress_cb=self._on_progress,
+            result_cb=self._note_result,
+            cancel_token=self.cancel_token,
+            tracer=self.tracer,
+            session=self.execution,
+            eta=self.eta,
+            store=self.result_store,
+        )
+
+    def _on_progress(self, done: int = 0, total: int = 0) -> None:
+        # 解析失败的行不经过调度器，进度按整批已完成的结果计算
+        self.bus.progress(self.completed_count(), self.total)
+
+    def _fail_all(self, error: str, only_missing: bool = False) -> None:
+        # 先读完剩余输入，没来得及处理的行也要有结果
+        for _ in self._ingest():
+            pass
+        for row, output_filename in iter_output_filenames(self._seen_rows):
+            if only_missing and row.index in self.result_store:
+                continue
+            self._on_result(
+                TaskResult(
+                    index=row.index,
+                    pid=row.pid_raw,
+                    output_filename=output_filename,
+                    status="FAILED",
+                    error=error,
+                    duration_sec=0.0,
+                    output_path=None,
+                )
+            )
+
+    def _finish(self) -> None:
+        # 打包或清理出错时也必须标记结束，否则界面会一直轮询下去
+        try:
+            if self.execution is not None:
+                self.execution.close()
+            with self._artifact_lock:
+                self._package_results()
+                if self.partial_artifact_id:
+                    self.artifact_store.delete(self.partial_artifact_id)
+                    self.partial_artifact_id = None
+
+                for work_dir in collect_work_dirs(self.result_store.iter_results()):
+                    shutil.rmtree(work_dir, ignore_errors=True)
+        finally:
+            with self._artifact_lock:
+                self.bus.progress(self.total, self.total)
+                self.finished_at = time.monotonic()
+
+    def _package_results(self) -> None:
+        parquet = self.config.result_parquet
+        if parquet and importlib.util.find_spec("pyarrow") is None:
+            # 前置检查已提示过；结果照常打包，只是不附带 Parquet
+            self.bus.log("未安装 pyarrow，结果不附带 result.parquet")
+            parquet = False
+        try:
+            with activate(self.tracer, lane="batch"):
+                mime, file_name, path = write_download_artifact(
+                    self.result_store,
+                    self.artifact_store.staging_dir(),
+                    trace=self.tracer,
+                    parquet=parquet,
+                )
+            self.artifact_id = self.artifact_store.put_file(path, mime=mime, file_name=file_name)
+        except Exception as exc:  # noqa: BLE001
+            # 除磁盘错误外还可能是 pyarrow 写 Parquet 时的错误
+            self.bus.log(f"结果打包失败: {exc}")
+
+
+def _failure_to_result(failure: ParseFailure) -> TaskResult:
+    return TaskResult(
+        index=failure.index,
+        pid=failure.pid_raw,
+        output_filename="",
+        status="FAILED",
+        error=failure.error,
+        duration_sec=0.0,
+        output_path=None,
+    )
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+from .child_process import run_child
+from .config import load_config, profile_path
+from .ffmpeg_pipeline import (
+    EncodeSettings,
+    FFmpegError,
+    VideoProbe,
+    concat_with_endcard,
+    encode_settings,
+    ensure_ffmpeg_available,
+    probe_video,
+)
+from .models import X264_PRESETS
+from .spool import create_work_dir
+
+
+DEFAULT_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium")
+# 常见商品视频的竖屏分辨率
+DEFAULT_RESOLUTIONS = ((720, 1280), (1080, 1920))
+DEFAULT_CLIP_SEC = 8
+DEFAULT_MIN_SSIM = 0.95
+ENDCARD_CLIP_SEC = 2
+# 每个并发度至少跑这么多轮，避免只测到启动开销
+ROWS_PER_WORKER = 2
+# 吞吐量相差在此比例以内视为持平，取画质更好、并发更低的组合，结果不随测量噪声跳动
+THROUGHPUT_TOLERANCE = 0.03
+ENCODE_TIMEOUT_SEC = 600
+SSIM_PATTERN = re.compile(r"All:([\d.]+)")
+
+
+@dataclass(frozen=True)
+class CalibrationPoint:
+    preset: str
+    workers: int
+    rows: int
+    wall_sec: float
+    rows_per_min: float
+    mean_output_bytes: int
+    ssim: float
+
+
+def synth_clip(path: Path, width: int, height: int, duration_sec: float, pattern: str) -> None:
+    # 用 lavfi 合成带运动画面和音轨的片段，不依赖外部素材；码率接近同尺寸的真实上传视频
+    bitrate = min(width, height) * 4000
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"{pattern}=size={width}x{height}:rate=30",
+        "-f",
+        "lavfi",
+        "-i",
+        "sine=frequency=440:sample_rate=48000",
+        "-t",
+        f"{duration_sec:.3f}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-b:v",
+        str(bitrate),
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        str(path),
+    ]
+    completed = run_child(cmd, timeout_sec=ENCODE_TIMEOUT_SEC)
+    if completed.returncode != 0:
+        raise FFmpegError(f"合成测试片段失败: {completed.stderr.strip()}")
+
+
+def measure_ssim(output: Path, reference: Path, duration_sec: float) -> float:
+    # 只比较输出开头的源视频部分，落版不参与画质评估；配置了输出分辨率上限时输出会被缩小，
+    # 参考源先缩放到输出尺寸再比较，测的仍是预设本身的画质
+    output_probe = probe_video(output)
+    lavfi = (
+        f"[0:v]trim=duration={duration_sec:.3f},setpts=PTS-STARTPTS[out];"
+        f"[1:v]trim=duration={duration_sec:.3f},setpts=PTS-STARTPTS,"
+        f"scale={output_probe.width}:{output_probe.height}:flags=bicubic[ref];"
+        "[out][ref]ssim"
+    )
+    cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-i",
+        str(output),
+        "-i",
+        str(reference),
+        "-lavfi",
+        lavfi,
+        "-f",
+        "null",
+        "-",
+    ]
+    completed = run_child(cmd, timeout_sec=ENCODE_TIMEOUT_SEC)
+    return parse_ssim(completed.stderr)
+
+
+def parse_ssim(stderr: str) -> float:
+    matches = SSIM_PATTERN.findall(stderr)
+    if not matches:
+        raise FFmpegError("无法解析 SSIM 输出")
+    return float(matches[-1])
+
+
+def run_calibration(
+    work_dir: Path,
+    presets: list[str],
+    worker_counts: list[int],
+    resolutions: list[tuple[int, int]],
+    clip_sec: float,
+    settings: EncodeSettings,
+    log: Callable[[str], None] = print,
+) -> list[CalibrationPoint]:
+    # 用与批次完全相同的 concat_with_endcard 滤镜图编码，逐个预设、逐个并发度测吞吐量、
+    # 输出大小和画质（相对合成源的 SSIM）
+    sources: list[tuple[Path, VideoProbe]] = []
+    for width, height in resolutions:
+        path = work_dir / f"source-{width}x{height}.mp4"
+        synth_clip(path, width, height, clip_sec, pattern="testsrc2")
+        sources.append((path, probe_video(path)))
+    endcard = work_dir / "endcard.mp4"
+    endcard_width, endcard_height = max(resolutions, key=lambda item: item[0] * item[1])
+    synth_clip(endcard, endcard_width, endcard_height, ENDCARD_CLIP_SEC, pattern="smptebars")
+    endcard_probe = probe_video(endcard)
+    # 校准只测单次编码路径，不分段
+    settings = replace(settings, segment_threshold_sec=0)
+
+    points: list[CalibrationPoint] = []
+    for preset in presets:
+        preset_settings = replace(settings, preset=preset)
+        ssim: float | None = None
+        for workers in worker_counts:
+            rows = max(workers * ROWS_PER_WORKER, len(sources))
+            jobs = [
+                (sources[i % len(sources)], work_dir / f"{preset}-{workers}-{i}.mp4")
+                for i in range(rows)
+            ]
+
+            def encode(job: tuple[tuple[Path, VideoProbe], Path]) -> None:
+                (source, source_probe), output = job
+                concat_with_endcard(
+                    source,
+                    endcard,
+                    output,
+                    timeout_sec=ENCODE_TIMEOUT_SEC,
+                    settings=preset_settings,
+                    source_probe=source_probe,
+                    endcard_probe=endcard_probe,
+                )
+
+            started_at = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(encode, jobs))
+            wall_sec = time.perf_counter() - started_at
+
+            sizes = [output.stat().st_size for _, output in jobs]
+            if ssim is None:
+                # 画质只取决于预设，每个预设每种分辨率测一次
+                ssim = statistics.fmean(
+                    measure_ssim(output, source, clip_sec)
+                    for (source, _), output in jobs[: len(sources)]
+                )
+            for _, output in jobs:
+                output.unlink(missing_ok=True)
+
+            point = CalibrationPoint(
+                preset=preset,
+                workers=workers,
+                rows=rows,
+                wall_sec=round(wall_sec, 3),
+                rows_per_min=round(rows / wall_sec * 60, 2),
+                mean_output_bytes=int(statistics.fmean(sizes)),
+                ssim=round(ssim, 4),
+            )
+            log(format_point(point))
+            points.append(point)
+    return points
+
+
+def choose_profile(points: list[CalibrationPoint], min_ssim: float) -> CalibrationPoint | None:
+    acceptable = [point for point in points if point.ssim >= min_ssim]
+    if not acceptable:
+        return None
+    best = max(point.rows_per_min for point in acceptable)
+    close = [
+        point for point in acceptable if point.rows_per_min >= best * (1 - THROUGHPUT_TOLERANCE)
+    ]
+    return max(close, key=lambda point: (point.ssim, -point.workers, point.rows_per_min))
+
+
+def write_profile(
+    path: Path, chosen: CalibrationPoint, points: list[CalibrationPoint], min_ssim: float
+) -> None:
+    payload = {
+        "settings": {"x264_preset": chosen.preset, "max_workers": chosen.workers},
+        "measured_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "min_ssim": min_ssim,
+        "points": [asdict(point) for point in points],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staged = path.with_suffix(".tmp")
+    staged.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    staged.replace(path)
+
+
+def format_point(point: CalibrationPoint) -> str:
+    return (
+        f"preset={point.preset:<9} workers={point.workers:<3} "
+        f"{point.rows_per_min:8.2f} 条/分钟  "
+        f"平均输出 {point.mean_output_bytes / 1024 / 1024:6.2f} MB  SSIM {point.ssim:.4f}"
+    )
+
+
+def _default_worker_counts() -> list[int]:
+    cpus = os.cpu_count() or 1
+    return sorted({1, max(cpus // 2, 1), cpus})
+
+
+def _parse_presets(raw: str) -> list[str]:
+    presets = [item.strip().lower() for item in raw.split(",") if item.strip()]
+    unknown = [item for item in presets if item not in X264_PRESETS]
+    if unknown or not presets:
+        raise argparse.ArgumentTypeError(f"未知的 x264 预设: {','.join(unknown) or raw}")
+    return presets
+
+
+def _parse_workers(raw: str) -> list[int]:
+    try:
+        counts = sorted({int(item) for item in raw.split(",") if item.strip()})
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"并发度需为正整数: {raw}") from exc
+    if not counts or counts[0] <= 0:
+        raise argparse.ArgumentTypeError(f"并发度需为正整数: {raw}")
+    return counts
+
+
+def _parse_resolutions(raw: str) -> list[tuple[int, int]]:
+    resolutions = []
+    for item in raw.split(","):
+        width, sep, height = item.strip().partition("x")
+        if not sep or not width.isdigit() or not height.isdigit():
+            raise argparse.ArgumentTypeError(f"分辨率格式需为 宽x高: {item}")
+        # yuv420p 要求宽高为偶数
+        resolutions.append((int(width) // 2 * 2, int(height) // 2 * 2))
+    return resolutions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m video_splicer.calibration",
+        description="在本机合成测试片段，扫描 x264 预设与并发度，写出供 load_config 使用的机器档案",
+    )
+    parser.add_argument(
+        "--presets", type=_parse_presets, default=list(DEFAULT_PRESETS), help="逗号分隔的预设"
+    )
+    parser.add_argument(
+        "--workers", type=_parse_workers, default=_default_worker_counts(), help="逗号分隔的并发度"
+    )
+    parser.add_argument(
+        "--resolutions",
+        type=_parse_resolutions,
+        default=list(DEFAULT_RESOLUTIONS),
+        help="逗号分隔的 宽x高",
+    )
+    parser.add_argument("--clip-sec", type=float, default=DEFAULT_CLIP_SEC, help="测试片段时长")
+    parser.add_argument(
+        "--min-ssim", type=float, default=DEFAULT_MIN_SSIM, help="可接受的最低 SSIM"
+    )
+    parser.add_argument("--output", type=Path, default=None, help="档案路径，默认 SP_PROFILE_PATH")
+    parser.add_argument("--dry-run", action="store_true", help="只输出测量结果，不写档案")
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    ensure_ffmpeg_available()
+    work_dir = create_work_dir(config)
+    try:
+        points = run_calibration(
+            work_dir=work_dir,
+            presets=args.presets,
+            worker_counts=args.workers,
+            resolutions=args.resolutions,
+            clip_sec=args.clip_sec,
+            settings=encode_settings(config),
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    chosen = choose_profile(points, args.min_ssim)
+    if chosen is None:
+        print(f"没有组合达到 SSIM {args.min_ssim}，未写出档案", file=sys.stderr)
+        return 1
+    print(f"选定：{format_point(chosen)}")
+    if args.dry_run:
+        return 0
+    output = (args.output or profile_path()).expanduser()
+    write_profile(output, chosen, points, args.min_ssim)
+    print(f"已写出档案: {output}（环境变量 SP_X264_PRESET / SP_MAX_WORKERS 仍优先）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
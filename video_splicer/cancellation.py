@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import itertools
+import threading
+from typing import Callable
+
+
+class BatchCancelled(RuntimeError):
+    pass
+
+
+class CancelToken:
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: dict[int, Callable[[], None]] = {}
+        self._ids = itertools.count()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:  # noqa: BLE001
+                pass
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise BatchCancelled("已取消")
+
+    def wait(self, timeout_sec: float) -> bool:
+        # 可被取消打断的 sleep；返回 True 表示已取消
+        return self._event.wait(timeout_sec)
+
+    def add_callback(self, callback: Callable[[], None]) -> int | None:
+        # 取消时回调，用于关闭下载连接、终止子进程；已取消时立即执行
+        with self._lock:
+            if not self._event.is_set():
+                handle = next(self._ids)
+                self._callbacks[handle] = callback
+                return handle
+        callback()
+        return None
+
+    def remove_callback(self, handle: int | None) -> None:
+        if handle is None:
+            return
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+
+def raise_if_cancelled(cancel_token: CancelToken | None) -> None:
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Mapping
+
+
+# 每次写出的块大小；限速时按更小的块发，速率曲线更平滑
+SEND_CHUNK = 64 * 1024
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+FAULT_KINDS = ("redirect", "throttle", "unavailable", "missing_length", "disconnect")
+
+
+@dataclass(frozen=True)
+class FaultProfile:
+    # 每个连接的带宽上限（KB/s），0 为不限
+    bandwidth_kbps: int = 0
+    # 响应头发出前的固定延迟
+    latency_ms: int = 0
+    # 以下均为每次 GET 请求触发的概率
+    redirect_rate: float = 0.0
+    throttle_rate: float = 0.0
+    unavailable_rate: float = 0.0
+    missing_length_rate: float = 0.0
+    disconnect_rate: float = 0.0
+    retry_after_sec: int = 1
+    ranges: bool = True
+    # 每个路径最多注入这么多次故障（0 为不限）；设为 1 时重试必然成功，结果可预期
+    max_faults_per_path: int = 0
+    seed: int | None = None
+
+
+class CdnSimulator(ThreadingHTTPServer):
+    # 本地源站：按 FaultProfile 随机注入限速、延迟、重定向、429/503、缺失 Content-Length
+    # 和中途断开，用于压测下载器的重试与续传；随机数按 seed 固定，可复现
+    daemon_threads = True
+    # 高并发压测时默认的 5 个积压连接不够，会直接被拒绝
+    request_queue_size = 256
+
+    def __init__(
+        self,
+        files: Mapping[str, bytes],
+        profile: FaultProfile = FaultProfile(),
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        super().__init__((host, port), _OriginHandler)
+        self.profile = profile
+        self.files: dict[str, bytes] = {}
+        self.etags: dict[str, str] = {}
+        self.stats: Counter[str] = Counter()
+        self._digests: dict[int, str] = {}
+        self._random = random.Random(profile.seed)
+        self._faults: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        for name, payload in files.items():
+            self.add(name, payload)
+
+    def add(self, name: str, payload: bytes) -> None:
+        # 同一份内容挂在多个路径下时只算一次摘要；files 持有引用，id 不会被复用
+        etag = self._digests.get(id(payload))
+        if etag is None:
+            etag = '"' + hashlib.sha1(payload).hexdigest()[:16] + '"'
+            self._digests[id(payload)] = etag
+        self.files[name] = payload
+        self.etags[name] = etag
+
+    def url(self, name: str) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/{name}"
+
+    def start(self) -> CdnSimulator:
+        self._thread = threading.Thread(target=self.serve_forever, name="sp-cdn", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self) -> CdnSimulator:
+        return self.start()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+    def record(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+
+    def draw(self, path: str, kind: str, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        limit = self.profile.max_faults_per_path
+        with self._lock:
+            if limit and self._faults[path] >= limit:
+                return False
+            if self._random.random() >= rate:
+                return False
+            self._faults[path] += 1
+            self.stats[kind] += 1
+            return True
+
+    def cut_point(self, length: int) -> int:
+        # 断开位置落在响应体的 10%–90% 之间
+        with self._lock:
+            return self._random.randint(max(length // 10, 1), max(length * 9 // 10, 1))
+
+
+class _OriginHandler(BaseHTTPRequestHandler):
+    server: CdnSimulator
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._serve(head=False)
+
+    def do_HEAD(self) -> None:  # noqa: N802
+        self._serve(head=True)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
+
+    def _serve(self, head: bool) -> None:
+        server = self.server
+        profile = server.profile
+        path, _, query = self.path.partition("?")
+        name = path.lstrip("/")
+        server.record("requests")
+        payload = server.files.get(name)
+        if payload is None:
+            self.send_error(404)
+            return
+        if profile.latency_ms > 0:
+            time.sleep(profile.latency_ms / 1000)
+
+        # 重定向只跳一次，跳转后的地址带 hop 参数
+        if "hop=" not in query and server.draw(path, "redirect", profile.redirect_rate):
+            self._send_empty(302, {"Location": f"{path}?hop=1"})
+            return
+        # HEAD 预检不注入错误，故障次数都留给真正的下载
+        if not head:
+            for kind, status, rate in (
+                ("throttle", 429, profile.throttle_rate),
+                ("unavailable", 503, profile.unavailable_rate),
+            ):
+                if server.draw(path, kind, rate):
+                    self._send_empty(status, {"Retry-After": str(profile.retry_after_sec)})
+                    return
+
+        etag = server.etags[name]
+        start, end = 0, len(payload) - 1
+        requested = self.headers.get("Range") if profile.ranges else None
+        if requested and self.headers.get("If-Range", etag) == etag:
+            matched = RANGE_PATTERN.match(requested.strip())
+            if matched:
+                parsed = _resolve_range(matched.group(1), matched.group(2), len(payload))
+                if parsed is None:
+                    self._send_empty(416, {"Content-Range": f"bytes */{len(payload)}"})
+                    return
+                start, end = parsed
+
+        missing_length = not head and server.draw(
+            path, "missing_length", profile.missing_length_rate
+        )
+        partial = (start, end) != (0, len(payload) - 1)
+        self.send_response(206 if partial else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("ETag", etag)
+        if profile.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if partial:
+            server.record("range_requests")
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+        if missing_length:
+            # 没有长度时只能靠关闭连接标记结束
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if head:
+            return
+
+        body = memoryview(payload)[start : end + 1]
+        # 声明了长度的响应才中途断开，客户端能据此判断出不完整；
+        # 没有长度时断开与正常结束无法区分，那是源站的问题而不是下载器的
+        if not missing_length and server.draw(path, "disconnect", profile.disconnect_rate):
+            body = body[: server.cut_point(len(body))]
+            self.close_connection = True
+        try:
+            self._write_paced(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端主动放弃（超过大小限制、超时、取消）
+            server.record("client_aborts")
+            self.close_connection = True
+
+    def _send_empty(self, status: int, headers: dict[str, str]) -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _write_paced(self, body: memoryview) -> None:
+        rate = self.server.profile.bandwidth_kbps * 1024
+        chunk_size = SEND_CHUNK if rate <= 0 else max(min(SEND_CHUNK, rate // 20), 1024)
+        started_at = time.monotonic()
+        sent = 0
+        try:
+            for offset in range(0, len(body), chunk_size):
+                chunk = body[offset : offset + chunk_size]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if rate > 0:
+                    ahead = sent / rate - (time.monotonic() - started_at)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        finally:
+            self.server.record("bytes_sent", sent)
+
+
+def _resolve_range(first: str, last: str, size: int) -> tuple[int, int] | None:
+    if not first:
+        # 后缀区间：最后 N 字节
+        if not last or int(last) == 0:
+            return None
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
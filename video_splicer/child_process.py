@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import locale
+import os
+import selectors
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import IO, TYPE_CHECKING, Iterator
+
+from .cancellation import BatchCancelled, CancelToken
+from .metrics import track_child
+from .models import ResourceUsage
+
+if TYPE_CHECKING:
+    from resource import struct_rusage
+
+
+POLL_INTERVAL_SEC = 0.2
+READ_CHUNK_BYTES = 32 * 1024
+# 子进程关闭输出之后等待其退出的轮询间隔
+REAP_POLL_SEC = 0.01
+TERMINATE_GRACE_SEC = 2.0
+
+# Linux 的 ru_maxrss 单位是 KB，macOS 是字节
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+@dataclass(frozen=True)
+class ChildResult:
+    returncode: int
+    stdout: str
+    stderr: str
+    usage: ResourceUsage = field(default_factory=ResourceUsage)
+
+
+class UsageCollector:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._total = ResourceUsage()
+
+    def add(self, usage: ResourceUsage) -> None:
+        with self._lock:
+            self._total = self._total.combine(usage)
+
+    @property
+    def total(self) -> ResourceUsage:
+        with self._lock:
+            return self._total
+
+
+# 当前任务的资源汇总；子线程、asyncio 任务通过上下文副本继承
+_collector: contextvars.ContextVar[UsageCollector | None] = contextvars.ContextVar(
+    "sp_usage_collector", default=None
+)
+
+
+@contextmanager
+def collect_usage(collector: UsageCollector | None = None) -> Iterator[UsageCollector]:
+    # 传入已有的汇总对象时继续累加，用于分多次执行的同一阶段
+    collector = collector or UsageCollector()
+    reset = _collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _collector.reset(reset)
+
+
+def run_child(
+    cmd: list[str],
+    timeout_sec: float | None = None,
+    cancel_token: CancelToken | None = None,
+) -> ChildResult:
+    # 与 subprocess.run 类似，但会定期检查取消信号，取消或超时时终止子进程
+    started_at = time.monotonic()
+    deadline = None if timeout_sec is None else started_at + timeout_sec
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    rusage = None
+    try:
+        with track_child(cmd):
+            stdout, stderr = _wait_output(proc, cmd, deadline, timeout_sec, cancel_token)
+            rusage = _reap(proc)
+    finally:
+        # 任何异常（中断、读取输出出错、统计出错）都不能留下孤儿子进程
+        if proc.returncode is None:
+            _terminate(proc)
+        _close_pipes(proc)
+        usage = _record_usage(rusage, time.monotonic() - started_at)
+    return ChildResult(returncode=proc.returncode, stdout=stdout, stderr=stderr, usage=usage)
+
+
+async def run_child_async(cmd: list[str], timeout_sec: float | None = None) -> ChildResult:
+    # 输出由事件循环直接读取，不占用线程；子进程关闭输出后用 os.wait4 非阻塞地回收。
+    # 不用 create_subprocess_exec：事件循环的子进程监视器会抢先回收，资源占用就丢了
+    started_at = time.monotonic()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    rusage = None
+    try:
+        with track_child(cmd):
+            try:
+                stdout, stderr = await asyncio.wait_for(_read_output_async(proc), timeout_sec)
+                rusage = await _reap_async(proc)
+            except asyncio.TimeoutError:
+                await _terminate_async(proc)
+                raise subprocess.TimeoutExpired(cmd, timeout_sec or 0.0) from None
+    finally:
+        # 任务被取消或出现其他异常时同样终止子进程
+        if proc.returncode is None:
+            await _terminate_async(proc)
+        _close_pipes(proc)
+        usage = _record_usage(rusage, time.monotonic() - started_at)
+    return ChildResult(returncode=proc.returncode, stdout=stdout, stderr=stderr, usage=usage)
+
+
+def _wait_output(
+    proc: subprocess.Popen,
+    cmd: list[str],
+    deadline: float | None,
+    timeout_sec: float | None,
+    cancel_token: CancelToken | None,
+) -> tuple[str, str]:
+    # 与 Popen.communicate 一样在当前线程里轮流读两路输出，但读到 EOF 后不回收子进程，
+    # 留给 os.wait4；两路都关闭时子进程已经或即将退出
+    chunks: dict[IO[bytes], list[bytes]] = {proc.stdout: [], proc.stderr: []}
+    with selectors.DefaultSelector() as selector:
+        for pipe in chunks:
+            selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map():
+            wait_sec = POLL_INTERVAL_SEC
+            if deadline is not None:
+                wait_sec = max(min(wait_sec, deadline - time.monotonic()), 0.0)
+            for key, _ in selector.select(wait_sec):
+                data = os.read(key.fd, READ_CHUNK_BYTES)
+                if data:
+                    chunks[key.fileobj].append(data)
+                else:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+
+            if cancel_token is not None and cancel_token.cancelled:
+                _terminate(proc)
+                raise BatchCancelled("已取消")
+            if deadline is not None and time.monotonic() >= deadline and selector.get_map():
+                _terminate(proc)
+                raise subprocess.TimeoutExpired(cmd, timeout_sec or 0.0)
+    return _decode(b"".join(chunks[proc.stdout])), _decode(b"".join(chunks[proc.stderr]))
+
+
+async def _read_output_async(proc: subprocess.Popen) -> tuple[str, str]:
+    stdout, stderr = await asyncio.gather(_read_pipe(proc.stdout), _read_pipe(proc.stderr))
+    return _decode(stdout), _decode(stderr)
+
+
+async def _read_pipe(pipe: IO[bytes]) -> bytes:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), pipe
+    )
+    try:
+        return await reader.read()
+    finally:
+        transport.close()
+
+
+def _close_pipes(proc: subprocess.Popen) -> None:
+    for pipe in (proc.stdout, proc.stderr):
+        if pipe is not None:
+            pipe.close()
+
+
+def _decode(data: bytes) -> str:
+    # 与 subprocess 的文本模式一致：按本地编码解码、统一换行
+    text = data.decode(locale.getpreferredencoding(False), errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _reap(proc: subprocess.Popen) -> struct_rusage | None:
+    # 自己用 os.wait4 回收子进程，顺带拿到该子进程的 CPU 时间与峰值内存；
+    # Popen.wait 用的 waitpid 会把这些信息丢掉
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        proc.wait()
+        return None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+async def _reap_async(proc: subprocess.Popen) -> struct_rusage | None:
+    # 输出已关闭，子进程随即退出，短间隔轮询即可，不阻塞事件循环
+    if not hasattr(os, "wait4"):
+        while proc.poll() is None:
+            await asyncio.sleep(REAP_POLL_SEC)
+        return None
+    while True:
+        try:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        except ChildProcessError:
+            proc.wait()
+            return None
+        if pid == proc.pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return rusage
+        await asyncio.sleep(REAP_POLL_SEC)
+
+
+def _record_usage(rusage: struct_rusage | None, wall_sec: float) -> ResourceUsage:
+    usage = _usage_of(rusage, wall_sec)
+    collector = _collector.get()
+    if collector is not None:
+        collector.add(usage)
+    return usage
+
+
+def _usage_of(rusage: struct_rusage | None, wall_sec: float) -> ResourceUsage:
+    if rusage is None:
+        # 被终止的子进程由 Popen 回收，只能记录耗时
+        return ResourceUsage(wall_sec=wall_sec, children=1)
+    return ResourceUsage(
+        user_sec=rusage.ru_utime,
+        sys_sec=rusage.ru_stime,
+        max_rss_bytes=rusage.ru_maxrss * _MAXRSS_UNIT,
+        wall_sec=wall_sec,
+        children=1,
+    )
+
+
+def _terminate(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=TERMINATE_GRACE_SEC)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+async def _terminate_async(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    deadline = time.monotonic() + TERMINATE_GRACE_SEC
+    while proc.poll() is None:
+        if time.monotonic() >= deadline:
+            proc.kill()
+            proc.wait()
+            return
+        await asyncio.sleep(REAP_POLL_SEC)
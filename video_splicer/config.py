@@ -1,15 +1,22 @@
 from __future__ import annotations
 
+import importlib.util
+import json
 import os
 import shutil
+from dataclasses import replace
 from pathlib import Path
 
-from .models import Config
+from .models import DEFAULT_BITRATE_LADDER, X264_PRESETS, Config
 
 
 DEFAULT_ENDCARD_PATH = Path(
     "/Users/bytedance/Documents/Code/python-video-splicing/assets/video/endcard.mp4"
 )
+DEFAULT_PROFILE_PATH = Path("~/.video_splicer/profile.json")
+DEFAULT_HISTORY_PATH = Path("~/.video_splicer/history.sqlite3")
+# 校准命令写出的机器档案可以设置这些配置项；对应环境变量已设置时以环境变量为准
+PROFILE_FIELDS = {"x264_preset": "SP_X264_PRESET", "max_workers": "SP_MAX_WORKERS"}
 
 
 def _read_positive_int(env_name: str, default: int) -> int:
@@ -23,15 +30,134 @@ def _read_positive_int(env_name: str, default: int) -> int:
     return value if value > 0 else default
 
 
+def _read_choice(env_name: str, choices: set[str], default: str) -> str:
+    raw = os.getenv(env_name)
+    if raw is None:
+        return default
+    value = raw.strip().lower()
+    return value if value in choices else default
+
+
+def _read_flag(env_name: str, default: bool) -> bool:
+    raw = os.getenv(env_name)
+    if raw is None:
+        return default
+    value = raw.strip().lower()
+    if value in {"1", "true", "yes", "on"}:
+        return True
+    if value in {"0", "false", "no", "off"}:
+        return False
+    return default
+
+
+def _read_bitrate_ladder(
+    env_name: str, default: tuple[tuple[int, int], ...]
+) -> tuple[tuple[int, int], ...]:
+    # 格式：短边:码率上限kbps，逗号分隔，如 "720:3000,1080:6000"；"off" 表示不设上限
+    raw = os.getenv(env_name)
+    if raw is None or not raw.strip():
+        return default
+    if raw.strip().lower() == "off":
+        return ()
+    ladder: list[tuple[int, int]] = []
+    for item in raw.split(","):
+        edge, sep, kbps = item.partition(":")
+        try:
+            rung = (int(edge), int(kbps) * 1000)
+        except ValueError:
+            return default
+        if not sep or rung[0] <= 0 or rung[1] <= 0:
+            return default
+        ladder.append(rung)
+    return tuple(sorted(ladder))
+
+
+def _read_optional_path(env_name: str) -> Path | None:
+    raw = os.getenv(env_name, "").strip()
+    if not raw:
+        return None
+    return Path(raw).expanduser()
+
+
+def profile_path() -> Path:
+    return _read_optional_path("SP_PROFILE_PATH") or DEFAULT_PROFILE_PATH.expanduser()
+
+
+def _read_history_path() -> Path | None:
+    # "off" 关闭历史记录与预估
+    if os.getenv("SP_HISTORY_PATH", "").strip().lower() == "off":
+        return None
+    return _read_optional_path("SP_HISTORY_PATH") or DEFAULT_HISTORY_PATH.expanduser()
+
+
+def load_profile(path: Path) -> dict[str, object]:
+    # 档案缺失或内容无效时忽略，只取认识且取值合法的配置项
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    settings = payload.get("settings") if isinstance(payload, dict) else None
+    if not isinstance(settings, dict):
+        return {}
+    values: dict[str, object] = {}
+    preset = settings.get("x264_preset")
+    if preset in X264_PRESETS:
+        values["x264_preset"] = preset
+    workers = settings.get("max_workers")
+    if isinstance(workers, int) and not isinstance(workers, bool) and workers > 0:
+        values["max_workers"] = workers
+    return values
+
+
+def _apply_profile(config: Config, path: Path) -> Config:
+    values = {
+        name: value
+        for name, value in load_profile(path).items()
+        if os.getenv(PROFILE_FIELDS[name]) is None
+    }
+    if not values:
+        return config
+    return replace(config, profile_path=path, **values)
+
+
 def load_config() -> Config:
     endcard_path = Path(os.getenv("SP_ENDCARD_PATH", str(DEFAULT_ENDCARD_PATH))).expanduser()
-    return Config(
+    config = Config(
         endcard_path=endcard_path,
+        endcard_dir=_read_optional_path("SP_ENDCARD_DIR"),
         max_video_mb=_read_positive_int("SP_MAX_VIDEO_MB", 50),
         max_workers=_read_positive_int("SP_MAX_WORKERS", 4),
         task_timeout_sec=_read_positive_int("SP_TASK_TIMEOUT_SEC", 180),
         download_retries=_read_positive_int("SP_DOWNLOAD_RETRIES", 2),
+        engine=_read_choice("SP_ENGINE", {"thread", "asyncio"}, "thread"),
+        max_downloads=_read_positive_int("SP_MAX_DOWNLOADS", 32),
+        per_host_connections=_read_positive_int("SP_PER_HOST_CONNECTIONS", 4),
+        bandwidth_limit_kbps=_read_positive_int("SP_BANDWIDTH_LIMIT_KBPS", 0),
+        spool_dir=_read_optional_path("SP_SPOOL_DIR"),
+        deliver_dir=_read_optional_path("SP_DELIVER_DIR"),
+        disk_budget_mb=_read_positive_int("SP_DISK_BUDGET_MB", 0),
+        artifact_dir=_read_optional_path("SP_ARTIFACT_DIR"),
+        artifact_ttl_sec=_read_positive_int("SP_ARTIFACT_TTL_SEC", 6 * 3600),
+        artifact_max_mb=_read_positive_int("SP_ARTIFACT_MAX_MB", 4096),
+        preflight=_read_flag("SP_PREFLIGHT", False),
+        task_order=_read_choice(
+            "SP_TASK_ORDER", {"input", "largest_first", "smallest_first"}, "input"
+        ),
+        rate_control=_read_choice("SP_RATE_CONTROL", {"bitrate", "crf"}, "bitrate"),
+        crf=min(_read_positive_int("SP_CRF", 23), 51),
+        x264_preset=_read_choice("SP_X264_PRESET", set(X264_PRESETS), "medium"),
+        bitrate_ladder=_read_bitrate_ladder("SP_BITRATE_LADDER", DEFAULT_BITRATE_LADDER),
+        max_output_long_edge=_read_positive_int("SP_MAX_OUTPUT_LONG_EDGE", 0),
+        max_output_height=_read_positive_int("SP_MAX_OUTPUT_HEIGHT", 0),
+        segment_threshold_sec=_read_positive_int("SP_SEGMENT_THRESHOLD_SEC", 0),
+        mp4_packaging=_read_choice("SP_MP4_PACKAGING", {"faststart", "fragmented"}, "faststart"),
+        metrics_port=_read_positive_int("SP_METRICS_PORT", 0),
+        metrics_host=os.getenv("SP_METRICS_HOST", "").strip() or "127.0.0.1",
+        trace=_read_flag("SP_TRACE", False),
+        result_parquet=_read_flag("SP_RESULT_PARQUET", False),
+        history_path=_read_history_path(),
     )
+    return _apply_profile(config, profile_path())
 
 
 def validate_runtime(config: Config) -> list[str]:
@@ -42,4 +168,6 @@ def validate_runtime(config: Config) -> list[str]:
         errors.append("未找到 ffmpeg 可执行文件")
     if shutil.which("ffprobe") is None:
         errors.append("未找到 ffprobe 可执行文件")
+    if config.result_parquet and importlib.util.find_spec("pyarrow") is None:
+        errors.append("已启用 SP_RESULT_PARQUET，但未安装 pyarrow")
     return errors
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import shutil
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+
+from .artifact import collect_work_dirs
+from .calibration import synth_clip
+from .cdn_simulator import CdnSimulator, FaultProfile
+from .config import load_config
+from .download_governor import DownloadGovernor
+from .downloader import DownloadError, download_video
+from .ffmpeg_pipeline import ensure_ffmpeg_available
+from .metrics import DOWNLOAD_BYTES, DOWNLOAD_RESUMES, DOWNLOAD_RETRIES
+from .models import Config, InputRow
+from .runner import process_batch
+from .spool import create_work_dir
+
+
+DEFAULT_COUNT = 200
+DEFAULT_CONCURRENCY = 32
+DEFAULT_SIZE_MB = 4.0
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT_SEC = 120
+# 批处理模式合成的源视频与落版
+BATCH_CLIP_SIZE = (720, 1280)
+BATCH_CLIP_SEC = 4.0
+BATCH_ENDCARD_SEC = 2.0
+# 报告里单条错误信息的最大长度，同类错误才能归并计数
+ERROR_KEY_CHARS = 80
+
+
+@dataclass(frozen=True)
+class BenchmarkReport:
+    mode: str
+    count: int
+    concurrency: int
+    succeeded: int
+    failed: int
+    wall_sec: float
+    downloaded_bytes: int
+    retries: int
+    resumes: int
+    # 单条耗时：download 模式为 download_video（含重试），batch 模式为整条任务
+    latency_p50: float
+    latency_p90: float
+    latency_p99: float
+    latency_max: float
+    errors: dict[str, int]
+    server: dict[str, int]
+
+    @property
+    def throughput_mb_per_sec(self) -> float:
+        return self.downloaded_bytes / 1024 / 1024 / self.wall_sec if self.wall_sec > 0 else 0.0
+
+    @property
+    def rows_per_min(self) -> float:
+        return self.succeeded / self.wall_sec * 60 if self.wall_sec > 0 else 0.0
+
+
+def run_download_benchmark(
+    simulator: CdnSimulator,
+    names: list[str],
+    work_dir: Path,
+    concurrency: int,
+    retries: int = DEFAULT_RETRIES,
+    timeout_sec: float = DEFAULT_TIMEOUT_SEC,
+    max_bytes: int = 1 << 40,
+) -> BenchmarkReport:
+    # 所有请求都落到同一台主机上，单主机连接数放开到与并发度相同
+    governor = DownloadGovernor(per_host_limit=concurrency)
+    latencies: list[float] = []
+    errors: Counter[str] = Counter()
+    before = _counters()
+
+    def fetch(item: tuple[int, str]) -> None:
+        index, name = item
+        destination = work_dir / f"{index}.bin"
+        started_at = time.perf_counter()
+        try:
+            download_video(
+                simulator.url(name),
+                destination,
+                max_bytes=max_bytes,
+                retries=retries,
+                total_timeout_sec=timeout_sec,
+                governor=governor,
+            )
+        except DownloadError as exc:
+            errors[str(exc)[:ERROR_KEY_CHARS]] += 1
+        finally:
+            latencies.append(time.perf_counter() - started_at)
+            destination.unlink(missing_ok=True)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fetch, enumerate(names)))
+    wall_sec = time.perf_counter() - started_at
+
+    failed = sum(errors.values())
+    return _report(
+        mode="download",
+        count=len(names),
+        concurrency=concurrency,
+        succeeded=len(names) - failed,
+        wall_sec=wall_sec,
+        before=before,
+        latencies=latencies,
+        errors=errors,
+        simulator=simulator,
+    )
+
+
+def run_batch_benchmark(
+    simulator: CdnSimulator, names: list[str], config: Config
+) -> BenchmarkReport:
+    # 走完整的 process_batch（下载、探测、编码），引擎与并发度取自 config
+    rows = [
+        InputRow(index=i, pid_raw=str(i), pid_sanitized=str(i), video_url=simulator.url(name))
+        for i, name in enumerate(names, start=1)
+    ]
+    before = _counters()
+    started_at = time.perf_counter()
+    results = process_batch(rows, config)
+    wall_sec = time.perf_counter() - started_at
+    for work_dir in collect_work_dirs(results.iter_results()):
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    table = results.frame(["status", "error", "duration_sec"])
+    succeeded_mask = table["status"] == "SUCCESS"
+    errors = Counter(error[:ERROR_KEY_CHARS] for error in table["error"][~succeeded_mask])
+    succeeded = int(succeeded_mask.sum())
+    return _report(
+        mode="batch",
+        count=len(names),
+        concurrency=config.max_downloads,
+        succeeded=succeeded,
+        wall_sec=wall_sec,
+        before=before,
+        latencies=table["duration_sec"].tolist(),
+        errors=errors,
+        simulator=simulator,
+    )
+
+
+def format_report(report: BenchmarkReport) -> list[str]:
+    lines = [
+        f"模式 {report.mode}：{report.count} 条，并发 {report.concurrency}，"
+        f"成功 {report.succeeded}，失败 {report.failed}，耗时 {report.wall_sec:.2f} 秒",
+        f"吞吐 {report.throughput_mb_per_sec:.2f} MB/s，{report.rows_per_min:.1f} 条/分钟，"
+        f"下载 {report.downloaded_bytes / 1024 / 1024:.1f} MB",
+        f"重试 {report.retries} 次，断点续传 {report.resumes} 次",
+        f"单条耗时 p50 {report.latency_p50:.3f}s  p90 {report.latency_p90:.3f}s  "
+        f"p99 {report.latency_p99:.3f}s  max {report.latency_max:.3f}s",
+        "源站：" + "，".join(f"{key} {value}" for key, value in sorted(report.server.items())),
+    ]
+    errors = sorted(report.errors.items(), key=lambda item: -item[1])
+    lines.extend(f"  失败 {count} 条：{error}" for error, count in errors)
+    return lines
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    # 最近秩法，样本少时也不会插值出不存在的耗时
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(max(math.ceil(fraction * len(ordered)), 1), len(ordered))
+    return ordered[rank - 1]
+
+
+def _counters() -> tuple[float, float, float]:
+    return DOWNLOAD_BYTES.value(), DOWNLOAD_RETRIES.value(), DOWNLOAD_RESUMES.value()
+
+
+def _report(
+    mode: str,
+    count: int,
+    concurrency: int,
+    succeeded: int,
+    wall_sec: float,
+    before: tuple[float, float, float],
+    latencies: list[float],
+    errors: Counter[str],
+    simulator: CdnSimulator,
+) -> BenchmarkReport:
+    # 指标是进程级累计值，取压测前后的差
+    downloaded, retries, resumes = (after - start for after, start in zip(_counters(), before))
+    return BenchmarkReport(
+        mode=mode,
+        count=count,
+        concurrency=concurrency,
+        succeeded=succeeded,
+        failed=count - succeeded,
+        wall_sec=round(wall_sec, 3),
+        downloaded_bytes=int(downloaded),
+        retries=int(retries),
+        resumes=int(resumes),
+        latency_p50=round(percentile(latencies, 0.50), 3),
+        latency_p90=round(percentile(latencies, 0.90), 3),
+        latency_p99=round(percentile(latencies, 0.99), 3),
+        latency_max=round(max(latencies, default=0.0), 3),
+        errors=dict(errors),
+        server=simulator.snapshot(),
+    )
+
+
+def _fault_profile(args: argparse.Namespace) -> FaultProfile:
+    return FaultProfile(
+        bandwidth_kbps=args.bandwidth_kbps,
+        latency_ms=args.latency_ms,
+        redirect_rate=args.redirect_rate,
+        throttle_rate=args.throttle_rate,
+        unavailable_rate=args.unavailable_rate,
+        missing_length_rate=args.missing_length_rate,
+        disconnect_rate=args.disconnect_rate,
+        retry_after_sec=args.retry_after_sec,
+        ranges=not args.no_ranges,
+        max_faults_per_path=args.max_faults_per_path,
+        seed=args.seed,
+    )
+
+
+def _rate(raw: str) -> float:
+    value = float(raw)
+    if not 0.0 <= value <= 1.0:
+        raise argparse.ArgumentTypeError(f"概率需在 0 到 1 之间: {raw}")
+    return value
+
+
+def _positive(raw: str) -> int:
+    value = int(raw)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"需为正整数: {raw}")
+    return value
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m video_splicer.download_bench",
+        description="启动注入故障的本地源站，高并发压测 download_video / process_batch",
+    )
+    parser.add_argument("--mode", choices=("download", "batch"), default="download")
+    parser.add_argument("--count", type=_positive, default=DEFAULT_COUNT, help="请求条数")
+    parser.add_argument(
+        "--concurrency", type=_positive, default=DEFAULT_CONCURRENCY, help="并发下载数"
+    )
+    parser.add_argument(
+        "--size-mb", type=float, default=DEFAULT_SIZE_MB, help="download 模式的文件大小"
+    )
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="下载重试次数")
+    parser.add_argument(
+        "--timeout-sec", type=float, default=DEFAULT_TIMEOUT_SEC, help="download 模式单条下载总时限"
+    )
+    parser.add_argument(
+        "--engine", choices=("thread", "asyncio"), default=None, help="batch 模式的执行引擎"
+    )
+    parser.add_argument("--bandwidth-kbps", type=int, default=0, help="每连接带宽上限")
+    parser.add_argument("--latency-ms", type=int, default=0, help="首字节前延迟")
+    parser.add_argument("--redirect-rate", type=_rate, default=0.0)
+    parser.add_argument("--throttle-rate", type=_rate, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--unavailable-rate", type=_rate, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--missing-length-rate", type=_rate, default=0.0)
+    parser.add_argument("--disconnect-rate", type=_rate, default=0.0, help="中途断开的概率")
+    parser.add_argument("--retry-after-sec", type=int, default=1)
+    parser.add_argument("--no-ranges", action="store_true", help="源站不支持区间请求")
+    parser.add_argument(
+        "--max-faults-per-path", type=int, default=0, help="每条链接最多注入的故障次数"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="故障随机数种子")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出报告")
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    work_dir = create_work_dir(config)
+    names = [f"video-{i}.mp4" for i in range(1, args.count + 1)]
+    try:
+        if args.mode == "download":
+            payload = random.Random(args.seed).randbytes(int(args.size_mb * 1024 * 1024))
+            with CdnSimulator(dict.fromkeys(names, payload), _fault_profile(args)) as simulator:
+                report = run_download_benchmark(
+                    simulator, names, work_dir, args.concurrency, args.retries, args.timeout_sec
+                )
+        else:
+            ensure_ffmpeg_available()
+            source = work_dir / "source.mp4"
+            endcard = work_dir / "endcard.mp4"
+            width, height = BATCH_CLIP_SIZE
+            synth_clip(source, width, height, BATCH_CLIP_SEC, pattern="testsrc2")
+            synth_clip(endcard, width, height, BATCH_ENDCARD_SEC, pattern="smptebars")
+            batch_config = replace(
+                config,
+                endcard_path=endcard,
+                endcard_dir=None,
+                engine=args.engine or config.engine,
+                download_retries=args.retries,
+                max_downloads=args.concurrency,
+                per_host_connections=args.concurrency,
+            )
+            payload = source.read_bytes()
+            with CdnSimulator(dict.fromkeys(names, payload), _fault_profile(args)) as simulator:
+                report = run_batch_benchmark(simulator, names, batch_config)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(asdict(report), ensure_ascii=False, indent=2))
+    else:
+        print("\n".join(format_report(report)))
+    return 0 if report.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable, Iterator
+from urllib.parse import urlparse
+
+from .cancellation import BatchCancelled, CancelToken, raise_if_cancelled
+
+
+BACKOFF_BASE_SEC = 0.5
+BACKOFF_CAP_SEC = 20.0
+MAX_RETRY_AFTER_SEC = 60.0
+HOST_SLOT_POLL_SEC = 0.05
+
+
+def parse_retry_after(raw: str | None, now: datetime | None = None) -> float | None:
+    if not raw:
+        return None
+    raw = raw.strip()
+    try:
+        return max(float(int(raw)), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(raw)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    current = now or datetime.now(timezone.utc)
+    return max((retry_at - current).total_seconds(), 0.0)
+
+
+def backoff_delay(
+    attempt: int,
+    retry_after_sec: float | None = None,
+    rand: Callable[[float, float], float] = random.uniform,
+) -> float:
+    # 指数退避 + full jitter；服务端给了 Retry-After 时至少等到它要求的时间
+    ceiling = min(BACKOFF_CAP_SEC, BACKOFF_BASE_SEC * (2 ** max(attempt - 1, 0)))
+    delay = rand(0.0, ceiling)
+    if retry_after_sec is not None:
+        delay = max(delay, min(retry_after_sec, MAX_RETRY_AFTER_SEC))
+    return delay
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate_bytes_per_sec: float,
+        burst_bytes: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = float(rate_bytes_per_sec)
+        self.capacity = float(burst_bytes if burst_bytes is not None else rate_bytes_per_sec)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes: int) -> float:
+        # 先扣令牌（允许为负），返回调用方需要等待的秒数；线程与协程共用
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= nbytes
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+_bucket_lock = threading.Lock()
+_shared_buckets: dict[int, TokenBucket] = {}
+
+
+def shared_token_bucket(rate_bytes_per_sec: int) -> TokenBucket:
+    # 全局限速：同一进程内所有批次、所有会话共用一个令牌桶
+    with _bucket_lock:
+        bucket = _shared_buckets.get(rate_bytes_per_sec)
+        if bucket is None:
+            bucket = TokenBucket(rate_bytes_per_sec)
+            _shared_buckets[rate_bytes_per_sec] = bucket
+        return bucket
+
+
+_host_slot_lock = threading.Lock()
+_shared_host_slots: dict[tuple[str, int], threading.BoundedSemaphore] = {}
+
+
+def shared_host_slot(host: str, limit: int) -> threading.BoundedSemaphore:
+    # 每主机连接上限同样按进程计算：所有批次、所有会话对同一主机共用一组槽位
+    with _host_slot_lock:
+        slot = _shared_host_slots.get((host, limit))
+        if slot is None:
+            slot = threading.BoundedSemaphore(limit)
+            _shared_host_slots[(host, limit)] = slot
+        return slot
+
+
+class DownloadGovernor:
+    def __init__(self, per_host_limit: int = 0, bandwidth_limit_kbps: int = 0) -> None:
+        self.per_host_limit = per_host_limit
+        self.bucket = (
+            shared_token_bucket(bandwidth_limit_kbps * 1024) if bandwidth_limit_kbps > 0 else None
+        )
+
+    @contextmanager
+    def host_slot(self, url: str, cancel_token: CancelToken | None = None) -> Iterator[None]:
+        if self.per_host_limit <= 0:
+            yield
+            return
+        slot = shared_host_slot(_host_key(url), self.per_host_limit)
+        # 分段等待，排队中的任务也能及时响应取消
+        while not slot.acquire(timeout=0.5):
+            raise_if_cancelled(cancel_token)
+        try:
+            yield
+        finally:
+            slot.release()
+
+    @asynccontextmanager
+    async def host_slot_async(self, url: str) -> AsyncIterator[None]:
+        if self.per_host_limit <= 0:
+            yield
+            return
+        # 与线程共用同一组槽位；各会话的事件循环不同，只能非阻塞地轮询获取
+        slot = shared_host_slot(_host_key(url), self.per_host_limit)
+        while not slot.acquire(blocking=False):
+            await asyncio.sleep(HOST_SLOT_POLL_SEC)
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def throttle(self, nbytes: int, cancel_token: CancelToken | None = None) -> None:
+        if self.bucket is None:
+            return
+        delay = self.bucket.reserve(nbytes)
+        if delay <= 0:
+            return
+        # 限速等待可被取消打断，带宽很紧时取消也能及时生效
+        if cancel_token is None:
+            time.sleep(delay)
+        elif cancel_token.wait(delay):
+            raise BatchCancelled("已取消")
+
+    async def throttle_async(self, nbytes: int) -> None:
+        if self.bucket is None:
+            return
+        delay = self.bucket.reserve(nbytes)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _host_key(url: str) -> str:
+    return urlparse(url).netloc.lower()
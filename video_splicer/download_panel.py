@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import streamlit as st
+
+from .artifact_store import ArtifactStore
+
+
+EXPIRED_MESSAGE = "结果文件已过期清理，请重新处理。"
+
+
+def prepared_key(key: str) -> str:
+    return f"{key}_prepared"
+
+
+def render_download(store: ArtifactStore, artifact_id: str, key: str) -> None:
+    # 会话里只记住已准备的产物 ID，字节只在渲染下载按钮的这一次重跑里从磁盘读取；
+    # 调用方需放在轮询局部之外，进度刷新时不会反复读取、注册整段视频
+    state_key = prepared_key(key)
+    stored = store.get(artifact_id)
+    if stored is None:
+        st.session_state.pop(state_key, None)
+        st.info(EXPIRED_MESSAGE)
+        return
+    if st.session_state.get(state_key) != artifact_id:
+        size_mb = stored.size_bytes / 1024 / 1024
+        label = f"准备下载：{stored.file_name}（{size_mb:.1f} MB）"
+        if not st.button(label, key=f"{key}_prepare"):
+            return
+        st.session_state[state_key] = artifact_id
+    payload = store.read_bytes(artifact_id)
+    if payload is None:
+        st.session_state.pop(state_key, None)
+        st.info(EXPIRED_MESSAGE)
+        return
+    st.download_button(
+        label=f"下载结果：{stored.file_name}",
+        data=payload,
+        file_name=stored.file_name,
+        mime=stored.mime,
+        key=f"{key}_download",
+    )
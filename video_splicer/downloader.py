@@ -1,76 +1,532 @@
 from __future__ import annotations
 
+import asyncio
+import re
 import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO, Mapping
 
+import aiohttp
 import requests
 
+from .cancellation import BatchCancelled, CancelToken, raise_if_cancelled
+from .download_governor import DownloadGovernor, backoff_delay, parse_retry_after
+from .metrics import (
+    DOWNLOAD_BYTES,
+    DOWNLOAD_RESUMES,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_SECONDS,
+    observe_duration,
+)
+from .trace import span
+
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
 
 class DownloadError(RuntimeError):
     pass
 
 
+class DownloadTimeout(TimeoutError):
+    # 任务的下载总时间预算耗尽；传输层的读超时（requests / aiohttp）不属于此类，照常重试
+    pass
+
+
+class TruncatedDownload(RuntimeError):
+    # 连接提前结束、收到的字节数少于声明的长度；可重试，重试时从断点继续
+    pass
+
+
+@dataclass
+class _Partial:
+    # 目标文件里已写入的字节数和资源标识，重试时凭它们从断点继续并确认仍是同一个文件
+    size: int = 0
+    total: int | None = None
+    etag: str = ""
+    last_modified: str = ""
+    accept_ranges: bool = False
+    encoded: bool = False
+
+    @property
+    def resumable(self) -> bool:
+        return self.size > 0 and self.accept_ranges
+
+    def reset(self) -> None:
+        self.size = 0
+        self.total = None
+        self.etag = ""
+        self.last_modified = ""
+        self.accept_ranges = False
+        self.encoded = False
+
+    def request_headers(self) -> dict[str, str]:
+        if not self.resumable:
+            return {}
+        headers = {"Range": f"bytes={self.size}-"}
+        # 资源已变化时 If-Range 让服务端直接回完整的 200，不会拼出新旧混杂的文件
+        validator = self.etag if self.etag and not self.etag.startswith("W/") else ""
+        validator = validator or self.last_modified
+        if validator:
+            headers["If-Range"] = validator
+        return headers
+
+    def begin(self, status: int, headers: Mapping[str, str]) -> int | None:
+        # 返回本次响应从文件的哪个偏移开始写；None 表示断点续不上，需要丢弃已下载部分
+        requested = self.resumable
+        if requested and status == 416:
+            return None
+        if status >= 400:
+            return 0
+        if requested and status == 206:
+            content_range = _parse_content_range(headers.get("Content-Range"))
+            etag = headers.get("ETag", "")
+            if content_range is None:
+                return None
+            start, total = content_range
+            if start != self.size:
+                return None
+            if self.total is not None and total is not None and total != self.total:
+                return None
+            if self.etag and etag and etag != self.etag:
+                return None
+            if total is not None:
+                self.total = total
+            return self.size
+
+        # 首次请求，或服务端忽略了 Range：从头写完整内容
+        self.size = 0
+        self.total = _parse_content_length(headers.get("Content-Length"))
+        self.etag = headers.get("ETag", "")
+        self.last_modified = headers.get("Last-Modified", "")
+        # 压缩传输时 Content-Length 和区间都针对压缩后的字节，而写入的是解压后的内容：
+        # 不做续传，也不按长度判断是否完整
+        self.encoded = headers.get("Content-Encoding", "identity").lower() not in {"", "identity"}
+        self.accept_ranges = (
+            headers.get("Accept-Ranges", "").lower() == "bytes" and not self.encoded
+        )
+        return 0
+
+    def check_complete(self) -> None:
+        if self.encoded:
+            return
+        if self.total is not None and self.size != self.total:
+            raise TruncatedDownload(f"下载不完整：收到 {self.size}/{self.total} 字节")
+
+
+@dataclass(frozen=True)
+class RetryDecision:
+    retryable: bool
+    retry_after_sec: float | None = None
+
+
+def classify_download_error(exc: BaseException) -> RetryDecision:
+    status, retry_after_raw = _http_status_of(exc)
+    if status is not None:
+        if status not in RETRYABLE_STATUS_CODES:
+            return RetryDecision(retryable=False)
+        return RetryDecision(retryable=True, retry_after_sec=parse_retry_after(retry_after_raw))
+
+    # 超过大小限制、总下载时间耗尽：重试也不会成功；
+    # aiohttp 的读超时同样是 TimeoutError 的子类，但属于传输错误，可以重试并断点续传
+    if isinstance(exc, (DownloadError, DownloadTimeout)):
+        return RetryDecision(retryable=False)
+    return RetryDecision(retryable=True)
+
+
+def _http_status_of(exc: BaseException) -> tuple[int | None, str | None]:
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code, exc.response.headers.get("Retry-After")
+    if isinstance(exc, aiohttp.ClientResponseError):
+        headers = exc.headers or {}
+        return exc.status, headers.get("Retry-After")
+    return None, None
+
+
 def download_video(
     video_url: str,
     destination: Path,
     max_bytes: int,
     retries: int,
     total_timeout_sec: float,
+    governor: DownloadGovernor | None = None,
+    cancel_token: CancelToken | None = None,
+) -> None:
+    with observe_duration(DOWNLOAD_SECONDS):
+        _download_with_retries(
+            video_url, destination, max_bytes, retries, total_timeout_sec, governor, cancel_token
+        )
+
+
+def _download_with_retries(
+    video_url: str,
+    destination: Path,
+    max_bytes: int,
+    retries: int,
+    total_timeout_sec: float,
+    governor: DownloadGovernor | None,
+    cancel_token: CancelToken | None,
 ) -> None:
+    governor = governor or DownloadGovernor()
     attempts = max(retries, 0) + 1
+    started_at = time.monotonic()
     last_error: Exception | None = None
+    partial = _Partial()
 
     for attempt in range(1, attempts + 1):
         try:
-            _download_once(
-                video_url=video_url,
-                destination=destination,
-                max_bytes=max_bytes,
-                total_timeout_sec=total_timeout_sec,
-            )
+            raise_if_cancelled(cancel_token)
+            with governor.host_slot(video_url, cancel_token=cancel_token):
+                with span(
+                    "download", "download", attempt=attempt, url=video_url, offset=partial.size
+                ):
+                    _download_once(
+                        video_url=video_url,
+                        destination=destination,
+                        max_bytes=max_bytes,
+                        total_timeout_sec=total_timeout_sec - (time.monotonic() - started_at),
+                        governor=governor,
+                        partial=partial,
+                        cancel_token=cancel_token,
+                    )
             return
+        except BatchCancelled:
+            destination.unlink(missing_ok=True)
+            raise
         except Exception as exc:  # noqa: BLE001
             last_error = exc
-            if destination.exists():
-                destination.unlink(missing_ok=True)
-            if attempt == attempts:
+            delay = _next_retry_delay(exc, attempt, attempts, started_at, total_timeout_sec)
+            if delay is None:
                 break
-            time.sleep(min(attempt, 2))
+            _keep_or_discard(partial, destination)
+            DOWNLOAD_RETRIES.inc()
+            with span("retry_backoff", "download", attempt=attempt, delay_sec=round(delay, 3)):
+                if cancel_token is None:
+                    time.sleep(delay)
+                elif cancel_token.wait(delay):
+                    destination.unlink(missing_ok=True)
+                    raise BatchCancelled("已取消")
 
+    destination.unlink(missing_ok=True)
     raise DownloadError(str(last_error) if last_error else "下载失败")
 
 
-def _download_once(
+async def download_video_async(
+    session: aiohttp.ClientSession,
     video_url: str,
     destination: Path,
     max_bytes: int,
+    retries: int,
     total_timeout_sec: float,
+    governor: DownloadGovernor | None = None,
 ) -> None:
+    with observe_duration(DOWNLOAD_SECONDS):
+        await _download_with_retries_async(
+            session, video_url, destination, max_bytes, retries, total_timeout_sec, governor
+        )
+
+
+async def _download_with_retries_async(
+    session: aiohttp.ClientSession,
+    video_url: str,
+    destination: Path,
+    max_bytes: int,
+    retries: int,
+    total_timeout_sec: float,
+    governor: DownloadGovernor | None,
+) -> None:
+    governor = governor or DownloadGovernor()
+    attempts = max(retries, 0) + 1
     started_at = time.monotonic()
+    last_error: Exception | None = None
+    partial = _Partial()
+
+    for attempt in range(1, attempts + 1):
+        try:
+            async with governor.host_slot_async(video_url):
+                with span(
+                    "download", "download", attempt=attempt, url=video_url, offset=partial.size
+                ):
+                    await _download_once_async(
+                        session=session,
+                        video_url=video_url,
+                        destination=destination,
+                        max_bytes=max_bytes,
+                        total_timeout_sec=total_timeout_sec - (time.monotonic() - started_at),
+                        governor=governor,
+                        partial=partial,
+                    )
+            return
+        except asyncio.CancelledError:
+            destination.unlink(missing_ok=True)
+            raise
+        except Exception as exc:  # noqa: BLE001
+            last_error = exc
+            delay = _next_retry_delay(exc, attempt, attempts, started_at, total_timeout_sec)
+            if delay is None:
+                break
+            _keep_or_discard(partial, destination)
+            DOWNLOAD_RETRIES.inc()
+            with span("retry_backoff", "download", attempt=attempt, delay_sec=round(delay, 3)):
+                await asyncio.sleep(delay)
+
+    destination.unlink(missing_ok=True)
+    raise DownloadError(str(last_error) if last_error else "下载失败")
+
+
+def _keep_or_discard(partial: _Partial, destination: Path) -> None:
+    # 服务端支持区间请求时保留已下载部分，下次从断点继续；否则从头再来
+    if partial.resumable:
+        return
+    partial.reset()
+    destination.unlink(missing_ok=True)
 
-    with requests.get(video_url, stream=True, timeout=(10, 15), allow_redirects=True) as response:
-        response.raise_for_status()
 
-        content_length = response.headers.get("Content-Length")
-        if content_length:
+def _next_retry_delay(
+    exc: Exception,
+    attempt: int,
+    attempts: int,
+    started_at: float,
+    total_timeout_sec: float,
+) -> float | None:
+    if attempt >= attempts:
+        return None
+    decision = classify_download_error(exc)
+    if not decision.retryable:
+        return None
+    delay = backoff_delay(attempt, decision.retry_after_sec)
+    remaining = total_timeout_sec - (time.monotonic() - started_at)
+    # 等待时间已经超出剩余预算时直接放弃，不再空等
+    if delay >= remaining:
+        return None
+    return delay
+
+
+def _download_once(
+    video_url: str,
+    destination: Path,
+    max_bytes: int,
+    total_timeout_sec: float,
+    governor: DownloadGovernor,
+    partial: _Partial | None = None,
+    cancel_token: CancelToken | None = None,
+) -> None:
+    if total_timeout_sec <= 0:
+        raise DownloadTimeout("下载超时")
+    started_at = time.monotonic()
+    partial = partial or _Partial()
+
+    while True:
+        with requests.get(
+            video_url,
+            stream=True,
+            timeout=(10, 15),
+            allow_redirects=True,
+            headers=partial.request_headers(),
+        ) as response:
+            # 取消时直接关闭连接，阻塞中的读取会立即返回
+            close_handle = cancel_token.add_callback(response.close) if cancel_token else None
             try:
-                if int(content_length) > max_bytes:
-                    raise DownloadError("源视频超过大小限制")
-            except ValueError:
-                pass
-
-        bytes_written = 0
-        with destination.open("wb") as out_file:
-            for chunk in response.iter_content(chunk_size=256 * 1024):
-                if not chunk:
+                offset = partial.begin(response.status_code, response.headers)
+                if offset is None:
+                    # 断点续不上（资源已变化或区间无效）：丢弃已下载部分，从头重新请求
+                    partial.reset()
+                    destination.unlink(missing_ok=True)
                     continue
+                _stream_to_file(
+                    response=response,
+                    destination=destination,
+                    offset=offset,
+                    partial=partial,
+                    max_bytes=max_bytes,
+                    total_timeout_sec=total_timeout_sec,
+                    started_at=started_at,
+                    governor=governor,
+                    cancel_token=cancel_token,
+                )
+            except Exception:
+                raise_if_cancelled(cancel_token)
+                raise
+            finally:
+                if cancel_token is not None:
+                    cancel_token.remove_callback(close_handle)
+        return
+
 
-                bytes_written += len(chunk)
-                if bytes_written > max_bytes:
-                    raise DownloadError("源视频超过大小限制")
+def _stream_to_file(
+    response: requests.Response,
+    destination: Path,
+    offset: int,
+    partial: _Partial,
+    max_bytes: int,
+    total_timeout_sec: float,
+    started_at: float,
+    governor: DownloadGovernor,
+    cancel_token: CancelToken | None,
+) -> None:
+    response.raise_for_status()
+    _check_declared_size(partial, max_bytes)
+
+    with _open_at(destination, offset) as out_file:
+        for chunk in response.iter_content(chunk_size=256 * 1024):
+            if not chunk:
+                continue
+
+            if partial.size + len(chunk) > max_bytes:
+                raise DownloadError("源视频超过大小限制")
+
+            elapsed = time.monotonic() - started_at
+            if elapsed > total_timeout_sec:
+                raise DownloadTimeout("下载超时")
+
+            raise_if_cancelled(cancel_token)
+            out_file.write(chunk)
+            partial.size += len(chunk)
+            DOWNLOAD_BYTES.inc(len(chunk))
+            governor.throttle(len(chunk), cancel_token)
+
+    partial.check_complete()
+
+
+async def _download_once_async(
+    session: aiohttp.ClientSession,
+    video_url: str,
+    destination: Path,
+    max_bytes: int,
+    total_timeout_sec: float,
+    governor: DownloadGovernor,
+    partial: _Partial | None = None,
+) -> None:
+    if total_timeout_sec <= 0:
+        raise DownloadTimeout("下载超时")
+    started_at = time.monotonic()
+    partial = partial or _Partial()
+
+    while True:
+        async with session.get(
+            video_url, allow_redirects=True, headers=partial.request_headers()
+        ) as response:
+            offset = partial.begin(response.status, response.headers)
+            if offset is None:
+                partial.reset()
+                destination.unlink(missing_ok=True)
+                continue
+            response.raise_for_status()
+            _check_declared_size(partial, max_bytes)
+
+            # 本地盘写入足够快，直接同步写，避免每个分块都切换线程
+            with _open_at(destination, offset) as out_file:
+                async for chunk in response.content.iter_chunked(256 * 1024):
+                    if not chunk:
+                        continue
+
+                    if partial.size + len(chunk) > max_bytes:
+                        raise DownloadError("源视频超过大小限制")
+
+                    elapsed = time.monotonic() - started_at
+                    if elapsed > total_timeout_sec:
+                        raise DownloadTimeout("下载超时")
+
+                    out_file.write(chunk)
+                    partial.size += len(chunk)
+                    DOWNLOAD_BYTES.inc(len(chunk))
+                    await governor.throttle_async(len(chunk))
+
+            partial.check_complete()
+        return
+
+
+def _check_declared_size(partial: _Partial, max_bytes: int) -> None:
+    if partial.total is not None and partial.total > max_bytes:
+        raise DownloadError("源视频超过大小限制")
+
+
+def _open_at(destination: Path, offset: int) -> BinaryIO:
+    if offset == 0:
+        return destination.open("wb")
+    # 续传：截到已确认的偏移后接着写
+    DOWNLOAD_RESUMES.inc()
+    out_file = destination.open("r+b")
+    out_file.seek(offset)
+    out_file.truncate()
+    return out_file
+
+
+def _parse_content_range(raw: str | None) -> tuple[int, int | None] | None:
+    match = CONTENT_RANGE_PATTERN.fullmatch((raw or "").strip())
+    if match is None:
+        return None
+    total = match.group(3)
+    return int(match.group(1)), None if total == "*" else int(total)
+
+
+# HEAD 返回这些状态码时资源确定不存在，预检阶段可以直接判失败
+GONE_STATUS_CODES = {404, 410}
+
+
+@dataclass(frozen=True)
+class HeadProbe:
+    content_length: int | None
+    status: int | None = None
+    unreachable: bool = False
+    error: str = ""
+
+
+def head_probe(video_url: str, timeout_sec: float = 10.0) -> HeadProbe:
+    try:
+        response = requests.head(video_url, timeout=timeout_sec, allow_redirects=True)
+    except requests.Timeout:
+        # 超时不代表不可达，留给正式下载去重试
+        return HeadProbe(content_length=None)
+    except requests.ConnectionError as exc:
+        return HeadProbe(content_length=None, unreachable=True, error=f"无法连接: {exc}")
+    except requests.RequestException:
+        return HeadProbe(content_length=None)
+    return _head_probe_from(response.status_code, response.headers.get("Content-Length"))
+
+
+async def head_probe_async(session: aiohttp.ClientSession, video_url: str) -> HeadProbe:
+    try:
+        async with session.head(video_url, allow_redirects=True) as response:
+            return _head_probe_from(response.status, response.headers.get("Content-Length"))
+    except aiohttp.ClientConnectorError as exc:
+        return HeadProbe(content_length=None, unreachable=True, error=f"无法连接: {exc}")
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return HeadProbe(content_length=None)
+
+
+def _head_probe_from(status: int, content_length_raw: str | None) -> HeadProbe:
+    if status in GONE_STATUS_CODES:
+        return HeadProbe(
+            content_length=None,
+            status=status,
+            unreachable=True,
+            error=f"视频链接不可用（HTTP {status}）",
+        )
+    # 部分 CDN / 签名链接不支持 HEAD（403/405 等），此时只是拿不到大小
+    if status >= 400:
+        return HeadProbe(content_length=None, status=status)
+    return HeadProbe(content_length=_parse_content_length(content_length_raw), status=status)
+
+
+def head_content_length(video_url: str, timeout_sec: float = 10.0) -> int | None:
+    return head_probe(video_url, timeout_sec).content_length
+
+
+async def head_content_length_async(
+    session: aiohttp.ClientSession,
+    video_url: str,
+) -> int | None:
+    return (await head_probe_async(session, video_url)).content_length
 
-                elapsed = time.monotonic() - started_at
-                if elapsed > total_timeout_sec:
-                    raise TimeoutError("下载超时")
 
-                out_file.write(chunk)
+def _parse_content_length(raw: str | None) -> int | None:
+    if not raw:
+        return None
+    try:
+        value = int(raw)
+    except ValueError:
+        return None
+    return value if value >= 0 else None
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable
+
+from .cancellation import BatchCancelled, CancelToken
+from .ffmpeg_pipeline import FFmpegError, VideoProbe, probe_video
+from .metrics import record_cache
+from .models import Config
+
+
+ENDCARD_SUFFIXES = {".mp4", ".mov", ".m4v"}
+
+# 落版文件的探测结果按 (路径, 大小, 修改时间) 在进程内缓存，跨批次复用；
+# 启动器在后台预热时先填好，第一个批次不必再等探测
+_probe_cache: dict[tuple[str, int, int], VideoProbe] = {}
+_probe_cache_lock = threading.Lock()
+
+
+class EndcardError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class PooledEndcard:
+    name: str
+    path: Path
+    probe: VideoProbe
+    size_bytes: int
+
+
+def load_endcard_registry(config: Config) -> dict[str, Path]:
+    # 落版目录下的每个视频文件按文件名（不含扩展名）登记，输入里的落版列按名称引用
+    if config.endcard_dir is None or not config.endcard_dir.is_dir():
+        return {}
+    return {
+        path.stem: path
+        for path in sorted(config.endcard_dir.iterdir())
+        if path.is_file() and path.suffix.lower() in ENDCARD_SUFFIXES
+    }
+
+
+def probe_endcard(path: Path, cancel_token: CancelToken | None = None) -> VideoProbe:
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _probe_cache_lock:
+        probe = _probe_cache.get(key)
+    record_cache("endcard_file", probe is not None)
+    if probe is None:
+        probe = probe_video(path, cancel_token=cancel_token)
+        with _probe_cache_lock:
+            _probe_cache[key] = probe
+    return probe
+
+
+def warm_endcards(config: Config) -> int:
+    # 探测默认落版和落版目录里的所有文件，返回成功探测的个数；不可用的留给批次报错
+    paths = [config.endcard_path, *load_endcard_registry(config).values()]
+    warmed = 0
+    for path in paths:
+        try:
+            probe_endcard(path)
+        except (FFmpegError, OSError):
+            continue
+        warmed += 1
+    return warmed
+
+
+class EndcardPool:
+    def __init__(self, default_path: Path, registry: dict[str, Path], piece_dir: Path) -> None:
+        self.default_path = default_path
+        self.registry = registry
+        self.piece_dir = piece_dir
+        self._entries: dict[str, PooledEndcard] = {}
+        self._errors: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._piece_locks: dict[str, threading.Lock] = {}
+
+    def prepare(self, names: Iterable[str], cancel_token: CancelToken | None = None) -> None:
+        # 批次开始时每个用到的落版只探测一次，之后所有任务共用探测结果
+        for name in dict.fromkeys(names):
+            if name in self._entries or name in self._errors:
+                continue
+            path = self._resolve(name)
+            if path is None:
+                self._errors[name] = f"未知落版: {name}"
+                continue
+            try:
+                probe = probe_endcard(path, cancel_token=cancel_token)
+            except BatchCancelled:
+                # 批次已取消，剩余任务会直接标记为已取消，不必再探测
+                return
+            except (FFmpegError, OSError) as exc:
+                self._errors[name] = f"落版视频不可用（{name or '默认'}）: {exc}"
+                continue
+            self._entries[name] = PooledEndcard(
+                name=name, path=path, probe=probe, size_bytes=path.stat().st_size
+            )
+
+    def get(self, name: str) -> PooledEndcard:
+        entry = self._entries.get(name)
+        record_cache("endcard_probe", entry is not None)
+        if entry is None:
+            raise EndcardError(self._errors.get(name, f"落版未探测: {name}"))
+        return entry
+
+    def size_bytes(self, name: str) -> int:
+        entry = self._entries.get(name)
+        return entry.size_bytes if entry is not None else 0
+
+    def piece(self, key: str, build: Callable[[Path], None]) -> Path:
+        # 分段编码用到的落版片段按编码参数缓存，同一批次内只编码一次
+        with self._lock:
+            lock = self._piece_locks.setdefault(key, threading.Lock())
+        with lock:
+            target = self.piece_dir / f"{key}.mp4"
+            record_cache("endcard_piece", target.exists())
+            if not target.exists():
+                self.piece_dir.mkdir(parents=True, exist_ok=True)
+                staging = self.piece_dir / f"{key}.partial.mp4"
+                build(staging)
+                staging.replace(target)
+            return target
+
+    def _resolve(self, name: str) -> Path | None:
+        if not name:
+            return self.default_path
+        return self.registry.get(name)
@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+from .cancellation import BatchCancelled, CancelToken
+from .models import Config
+
+
+WAIT_POLL_SEC = 0.2
+# 估算等待时间用的单条编码耗时滑动平均系数
+HOLD_EWMA_ALPHA = 0.2
+
+
+@dataclass(frozen=True)
+class QueueStatus:
+    # position：本批次下一条任务前面还有几条任务会先拿到编码槽位；None 表示没有任务在等
+    position: int | None
+    waiting: int
+    running: int
+    remaining: int
+    active_sessions: int
+    limit: int
+    start_wait_sec: float | None
+    finish_sec: float | None
+
+
+@dataclass(eq=False)
+class _Waiter:
+    session: _SessionState
+    event: threading.Event | None = None
+    loop: asyncio.AbstractEventLoop | None = None
+    future: asyncio.Future | None = None
+    granted: bool = False
+
+
+@dataclass(eq=False)
+class _SessionState:
+    label: str
+    max_parallel: int
+    cancel_token: CancelToken | None
+    expected: int = 0
+    done: int = 0
+    running: int = 0
+    last_grant: int = 0
+    waiters: deque[_Waiter] = field(default_factory=deque)
+    grant_times: deque[float] = field(default_factory=deque)
+
+
+class ExecutionService:
+    # 进程级编码槽位：所有会话共用同一个并发上限，空出的槽位优先分给
+    # 正在运行任务最少的批次，小批次不会被排在大批次后面饿死
+    def __init__(self, limit: int, clock: Callable[[], float] = time.monotonic) -> None:
+        self.limit = max(limit, 1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sessions: list[_SessionState] = []
+        self._running = 0
+        self._sequence = itertools.count(1)
+        self._avg_hold_sec: float | None = None
+
+    def open_session(
+        self,
+        label: str,
+        max_parallel: int | None = None,
+        cancel_token: CancelToken | None = None,
+    ) -> ExecutionSession:
+        state = _SessionState(
+            label=label,
+            max_parallel=max_parallel or self.limit,
+            cancel_token=cancel_token,
+        )
+        with self._lock:
+            self._sessions.append(state)
+        return ExecutionSession(self, state)
+
+    def active_sessions(self) -> int:
+        with self._lock:
+            return len(self._active())
+
+    def _close(self, state: _SessionState) -> None:
+        with self._lock:
+            if state in self._sessions:
+                self._sessions.remove(state)
+            self._dispatch()
+
+    def _expect(self, state: _SessionState, count: int) -> None:
+        with self._lock:
+            state.expected += count
+
+    def _task_done(self, state: _SessionState) -> None:
+        with self._lock:
+            state.done += 1
+
+    def _try_acquire(self, state: _SessionState) -> bool:
+        # 非阻塞获取只用空闲槽位，有可分配的等待者时不插队；本批次已到上限时也不分配
+        with self._lock:
+            if self._running >= self.limit or not _below_cap(state):
+                return False
+            if any(item.waiters and _below_cap(item) for item in self._sessions):
+                return False
+            self._grant(state)
+            return True
+
+    def _acquire(self, state: _SessionState, timeout: float | None) -> bool:
+        deadline = None if timeout is None else self._clock() + timeout
+        waiter = _Waiter(session=state, event=threading.Event())
+        with self._lock:
+            state.waiters.append(waiter)
+            self._dispatch()
+        while True:
+            wait_sec = WAIT_POLL_SEC
+            if deadline is not None:
+                wait_sec = max(min(wait_sec, deadline - self._clock()), 0.0)
+            if waiter.event.wait(wait_sec):
+                return True
+            cancelled = state.cancel_token is not None and state.cancel_token.cancelled
+            expired = deadline is not None and self._clock() >= deadline
+            if not cancelled and not expired:
+                continue
+            if self._withdraw(waiter):
+                # 撤回前的一瞬间已经拿到槽位
+                if not cancelled:
+                    return True
+                self._release(state)
+            if cancelled:
+                raise BatchCancelled("已取消")
+            return False
+
+    async def _acquire_async(self, state: _SessionState) -> None:
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(session=state, loop=loop, future=loop.create_future())
+        with self._lock:
+            state.waiters.append(waiter)
+            self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if self._withdraw(waiter):
+                self._release(state)
+            raise
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        # 返回 True 表示撤回时槽位已经分配给了该等待者
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.session.waiters.remove(waiter)
+            return False
+
+    def _release(self, state: _SessionState) -> None:
+        with self._lock:
+            self._running -= 1
+            state.running -= 1
+            if state.grant_times:
+                hold = self._clock() - state.grant_times.popleft()
+                self._avg_hold_sec = (
+                    hold
+                    if self._avg_hold_sec is None
+                    else self._avg_hold_sec + HOLD_EWMA_ALPHA * (hold - self._avg_hold_sec)
+                )
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._running < self.limit:
+            state = self._pick()
+            if state is None:
+                return
+            waiter = state.waiters.popleft()
+            waiter.granted = True
+            self._grant(state)
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def _pick(self) -> _SessionState | None:
+        # 已用满自身并发上限的批次不参与分配，等它自己的任务释放槽位后再排
+        candidates = [item for item in self._sessions if item.waiters and _below_cap(item)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda item: (item.running, item.last_grant))
+
+    def _grant(self, state: _SessionState) -> None:
+        self._running += 1
+        state.running += 1
+        state.last_grant = next(self._sequence)
+        state.grant_times.append(self._clock())
+
+    def _active(self) -> list[_SessionState]:
+        return [
+            item
+            for item in self._sessions
+            if item.running or item.waiters or item.done < item.expected
+        ]
+
+    def _status(self, state: _SessionState) -> QueueStatus:
+        with self._lock:
+            position = self._position(state)
+            active = max(len(self._active()), 1)
+            remaining = max(state.expected - state.done, 0)
+            free = self.limit - self._running
+            start_wait_sec = finish_sec = None
+            if position is not None and position < free:
+                start_wait_sec = 0.0
+            elif position is not None and self._avg_hold_sec is not None:
+                start_wait_sec = (position - free + 1) * self._avg_hold_sec / self.limit
+            if self._avg_hold_sec is not None:
+                share = max(min(state.max_parallel, self.limit / active), 1e-6)
+                finish_sec = remaining * self._avg_hold_sec / share
+            return QueueStatus(
+                position=position,
+                waiting=len(state.waiters),
+                running=state.running,
+                remaining=remaining,
+                active_sessions=active,
+                limit=self.limit,
+                start_wait_sec=start_wait_sec,
+                finish_sec=finish_sec,
+            )
+
+    def _position(self, target: _SessionState) -> int | None:
+        # 按同样的分配规则模拟后续的槽位分配顺序，数出排在本批次前面的任务；
+        # 已到上限的批次排在其余批次之后，等自己的任务释放槽位
+        if not target.waiters:
+            return None
+        running = {id(item): item.running for item in self._sessions}
+        pending = {id(item): len(item.waiters) for item in self._sessions}
+        order = {id(item): item.last_grant for item in self._sessions}
+        sequence = max(order.values(), default=0)
+        ahead = 0
+        while True:
+            state = min(
+                (item for item in self._sessions if pending[id(item)] > 0),
+                key=lambda item: (
+                    running[id(item)] >= item.max_parallel,
+                    running[id(item)],
+                    order[id(item)],
+                ),
+            )
+            if state is target:
+                return ahead
+            ahead += 1
+            sequence += 1
+            running[id(state)] += 1
+            pending[id(state)] -= 1
+            order[id(state)] = sequence
+
+
+def _below_cap(state: _SessionState) -> bool:
+    return state.running < state.max_parallel
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ExecutionSession:
+    # 一个批次在共享服务里的句柄；接口与 threading.Semaphore 一致，可直接作为编码槽位使用
+    def __init__(self, service: ExecutionService, state: _SessionState) -> None:
+        self.service = service
+        self._state = state
+
+    @property
+    def label(self) -> str:
+        return self._state.label
+
+    def expect(self, count: int) -> None:
+        self.service._expect(self._state, count)
+
+    def task_done(self) -> None:
+        self.service._task_done(self._state)
+
+    def acquire(self, blocking: bool = True, timeout: float | None = None) -> bool:
+        if not blocking:
+            return self.service._try_acquire(self._state)
+        return self.service._acquire(self._state, timeout)
+
+    def release(self) -> None:
+        self.service._release(self._state)
+
+    def __enter__(self) -> ExecutionSession:
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.release()
+
+    def as_async(self) -> AsyncSessionSlots:
+        return AsyncSessionSlots(self)
+
+    def status(self) -> QueueStatus:
+        return self.service._status(self._state)
+
+    def describe(self) -> str:
+        status = self.status()
+        return f"共享编码槽位 {status.limit} 个，当前 {status.active_sessions} 个批次"
+
+    def close(self) -> None:
+        self.service._close(self._state)
+
+
+class AsyncSessionSlots:
+    # asyncio 引擎使用的视图，接口与 asyncio.Semaphore 一致
+    def __init__(self, session: ExecutionSession) -> None:
+        self.session = session
+
+    def locked(self) -> bool:
+        return not self._has_free_slot()
+
+    async def acquire(self) -> bool:
+        await self.session.service._acquire_async(self.session._state)
+        return True
+
+    def try_acquire(self) -> bool:
+        # 检查与获取在同一把锁内完成，其他会话不会在两者之间拿走槽位
+        return self.session.acquire(blocking=False)
+
+    def release(self) -> None:
+        self.session.release()
+
+    async def __aenter__(self) -> AsyncSessionSlots:
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self.release()
+
+    def _has_free_slot(self) -> bool:
+        service = self.session.service
+        state = self.session._state
+        with service._lock:
+            return (
+                service._running < service.limit
+                and _below_cap(state)
+                and not any(item.waiters and _below_cap(item) for item in service._sessions)
+            )
+
+
+_service_lock = threading.Lock()
+_service: ExecutionService | None = None
+
+
+def get_execution_service(config: Config) -> ExecutionService:
+    # 同一进程内所有会话共用一个服务，SP_MAX_WORKERS 对整机生效而不是对每个会话
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ExecutionService(limit=config.max_workers)
+        return _service
+
+
+def format_queue_status(status: QueueStatus) -> str:
+    parts = []
+    if status.position is not None:
+        text = f"全局排队第 {status.position + 1} 位"
+        if status.start_wait_sec is not None:
+            text += f"，预计 {math.ceil(status.start_wait_sec)} 秒后开始下一条"
+        parts.append(text)
+    parts.append(f"占用 {status.running} 个编码槽位，未完成 {status.remaining} 条")
+    if status.finish_sec is not None and status.remaining:
+        parts.append(f"预计还需 {math.ceil(status.finish_sec / 60)} 分钟")
+    parts.append(f"{status.active_sessions} 个批次共享 {status.limit} 个编码槽位")
+    return "，".join(parts)
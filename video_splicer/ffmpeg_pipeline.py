@@ -3,28 +3,86 @@ from __future__ import annotations
 import json
 import shutil
 import subprocess
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from pathlib import Path
 
+from .cancellation import CancelToken, raise_if_cancelled
+from .child_process import run_child, run_child_async
+from .metrics import ENCODE_SECONDS, PROBES, observe_duration
+from .models import DEFAULT_BITRATE_LADDER, Config, VideoProbe
+from .mp4_probe import probe_mp4
+from .trace import span
+
 
 class FFmpegError(RuntimeError):
     pass
 
 
-@dataclass(frozen=True)
-class VideoProbe:
-    width: int
-    height: int
-    duration_sec: float
-    has_audio: bool
-    video_bitrate: int
-    audio_bitrate: int
-    format_bitrate: int
-
-
 DEFAULT_VIDEO_BITRATE = 2_500_000
 DEFAULT_AUDIO_BITRATE = 128_000
 MIN_VIDEO_BITRATE = 300_000
+DEFAULT_CRF = 23
+# 分片 MP4 写完后校验时长允许的偏差：取 1 秒与预期时长 2% 中的较大者
+OUTPUT_DURATION_TOLERANCE_SEC = 1.0
+OUTPUT_DURATION_TOLERANCE_RATIO = 0.02
+
+
+@dataclass(frozen=True)
+class EncodeSettings:
+    rate_control: str = "bitrate"
+    crf: int = DEFAULT_CRF
+    preset: str = "medium"
+    bitrate_ladder: tuple[tuple[int, int], ...] = DEFAULT_BITRATE_LADDER
+    max_long_edge: int = 0
+    max_height: int = 0
+    segment_threshold_sec: int = 0
+    packaging: str = "faststart"
+
+
+@dataclass(frozen=True)
+class EncodePolicy:
+    rate_control: str
+    video_bitrate: int
+    audio_bitrate: int
+    crf: int | None = None
+    capped: bool = False
+    scaled_to: tuple[int, int] | None = None
+    segments: int = 1
+    output_duration_sec: float = 0.0
+    packaging: str = "faststart"
+    preset: str = "medium"
+    source_duration_sec: float = 0.0
+    output_width: int = 0
+    output_height: int = 0
+
+    def describe(self) -> str:
+        kbps = self.video_bitrate // 1000
+        if self.rate_control == "crf":
+            text = f"crf={self.crf} maxrate={kbps}k"
+        else:
+            text = f"bitrate={kbps}k capped" if self.capped else f"bitrate={kbps}k"
+        if self.scaled_to is not None:
+            text += f" scale={self.scaled_to[0]}x{self.scaled_to[1]}"
+        if self.segments > 1:
+            text += f" segments={self.segments}"
+        if self.preset != "medium":
+            text += f" preset={self.preset}"
+        if self.packaging == "fragmented":
+            text += " fmp4"
+        return text
+
+
+def encode_settings(config: Config) -> EncodeSettings:
+    return EncodeSettings(
+        rate_control=config.rate_control,
+        crf=config.crf,
+        preset=config.x264_preset,
+        bitrate_ladder=config.bitrate_ladder,
+        max_long_edge=config.max_output_long_edge,
+        max_height=config.max_output_height,
+        segment_threshold_sec=config.segment_threshold_sec,
+        packaging=config.mp4_packaging,
+    )
 
 
 def _parse_positive_int(raw: object) -> int:
@@ -54,6 +112,88 @@ def _select_audio_bitrate(source_probe: VideoProbe) -> int:
     return DEFAULT_AUDIO_BITRATE
 
 
+def _bitrate_ceiling(
+    width: int, height: int, ladder: tuple[tuple[int, int], ...]
+) -> int | None:
+    if not ladder:
+        return None
+    short_edge = min(width, height)
+    for edge, ceiling in ladder:
+        if short_edge <= edge:
+            return ceiling
+    return ladder[-1][1]
+
+
+def output_size(width: int, height: int, settings: EncodeSettings) -> tuple[int, int]:
+    # 超过上限时等比缩小，宽高取偶数（yuv420p 要求）；未超限时保持源尺寸
+    scale = 1.0
+    if settings.max_long_edge > 0:
+        scale = min(scale, settings.max_long_edge / max(width, height))
+    if settings.max_height > 0:
+        scale = min(scale, settings.max_height / height)
+    if scale >= 1.0:
+        return width, height
+    return max(int(width * scale) // 2 * 2, 2), max(int(height * scale) // 2 * 2, 2)
+
+
+def select_encode_policy(
+    source_probe: VideoProbe,
+    settings: EncodeSettings,
+    output_width: int,
+    output_height: int,
+) -> EncodePolicy:
+    # 码率模式：沿用源码率但不超过分辨率档位上限；
+    # CRF 模式：同一个值作为 VBV 上限，画面简单时码率自然更低
+    source_bitrate = _select_video_bitrate(source_probe)
+    ceiling = _bitrate_ceiling(output_width, output_height, settings.bitrate_ladder)
+    capped = ceiling is not None and source_bitrate > ceiling
+    video_bitrate = max(ceiling, MIN_VIDEO_BITRATE) if capped else source_bitrate
+    return EncodePolicy(
+        rate_control=settings.rate_control,
+        video_bitrate=video_bitrate,
+        audio_bitrate=_select_audio_bitrate(source_probe),
+        crf=settings.crf if settings.rate_control == "crf" else None,
+        capped=capped,
+        scaled_to=(
+            None
+            if (output_width, output_height) == (source_probe.width, source_probe.height)
+            else (output_width, output_height)
+        ),
+        packaging=settings.packaging,
+        preset=settings.preset,
+        source_duration_sec=source_probe.duration_sec,
+        output_width=output_width,
+        output_height=output_height,
+    )
+
+
+def _preset_args(policy: EncodePolicy) -> list[str]:
+    # 预设决定编码速度与同码率下的画质，按机器用校准命令选定
+    return ["-preset", policy.preset]
+
+
+def _video_rate_args(policy: EncodePolicy) -> list[str]:
+    if policy.rate_control == "crf":
+        rate_args = ["-crf", str(policy.crf)]
+    else:
+        rate_args = ["-b:v", str(policy.video_bitrate)]
+    return [
+        *rate_args,
+        "-maxrate",
+        str(policy.video_bitrate),
+        "-bufsize",
+        str(policy.video_bitrate * 2),
+    ]
+
+
+def movflags_args(packaging: str) -> list[str]:
+    # faststart 写完后要再完整改写一遍文件把 moov 移到开头；分片 MP4 一次写成，
+    # 边写边可读，适合写完就归档或上传的输出
+    if packaging == "fragmented":
+        return ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+    return ["-movflags", "+faststart"]
+
+
 def ensure_ffmpeg_available() -> None:
     if shutil.which("ffmpeg") is None:
         raise FFmpegError("未找到 ffmpeg 可执行文件")
@@ -61,8 +201,8 @@ def ensure_ffmpeg_available() -> None:
         raise FFmpegError("未找到 ffprobe 可执行文件")
 
 
-def probe_video(video_path: Path) -> VideoProbe:
-    cmd = [
+def _probe_command(video_path: Path) -> list[str]:
+    return [
         "ffprobe",
         "-v",
         "error",
@@ -73,19 +213,48 @@ def probe_video(video_path: Path) -> VideoProbe:
         str(video_path),
     ]
 
-    try:
-        completed = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-    except subprocess.CalledProcessError as exc:
-        stderr = exc.stderr.strip() if exc.stderr else ""
-        raise FFmpegError(f"ffprobe 失败: {stderr or exc}") from exc
 
+def probe_video(video_path: Path, cancel_token: CancelToken | None = None) -> VideoProbe:
+    # 先直接读 MP4/MOV 的 moov，读不了的容器再起 ffprobe
+    probe = _probe_native(video_path)
+    if probe is not None:
+        return probe
+    PROBES.inc(method="ffprobe")
+    with span("ffprobe", "probe", file=video_path.name):
+        completed = run_child(_probe_command(video_path), cancel_token=cancel_token)
+    if completed.returncode != 0:
+        stderr = completed.stderr.strip()
+        raise FFmpegError(f"ffprobe 失败: {stderr or f'退出码 {completed.returncode}'}")
+
+    return _parse_probe_output(completed.stdout)
+
+
+async def probe_video_async(video_path: Path) -> VideoProbe:
+    # 原生解析只读文件头部的几个盒子，耗时微秒级，直接在事件循环里做
+    probe = _probe_native(video_path)
+    if probe is not None:
+        return probe
+    PROBES.inc(method="ffprobe")
+    with span("ffprobe", "probe", file=video_path.name):
+        completed = await run_child_async(_probe_command(video_path))
+    if completed.returncode != 0:
+        stderr = completed.stderr.strip()
+        raise FFmpegError(f"ffprobe 失败: {stderr or f'退出码 {completed.returncode}'}")
+
+    return _parse_probe_output(completed.stdout)
+
+
+def _probe_native(video_path: Path) -> VideoProbe | None:
+    with span("mp4_probe", "probe", file=video_path.name):
+        probe = probe_mp4(video_path)
+    if probe is not None:
+        PROBES.inc(method="native")
+    return probe
+
+
+def _parse_probe_output(stdout: str) -> VideoProbe:
     try:
-        payload = json.loads(completed.stdout)
+        payload = json.loads(stdout)
     except json.JSONDecodeError as exc:
         raise FFmpegError("ffprobe 输出无法解析") from exc
 
@@ -113,6 +282,9 @@ def probe_video(video_path: Path) -> VideoProbe:
     video_bitrate = _parse_positive_int(video_stream.get("bit_rate"))
     audio_bitrate = _parse_positive_int(audio_stream.get("bit_rate")) if audio_stream else 0
     format_bitrate = _parse_positive_int(format_data.get("bit_rate"))
+    frame_rate = _parse_frame_rate(
+        video_stream.get("avg_frame_rate") or video_stream.get("r_frame_rate")
+    )
 
     return VideoProbe(
         width=width,
@@ -122,34 +294,223 @@ def probe_video(video_path: Path) -> VideoProbe:
         video_bitrate=video_bitrate,
         audio_bitrate=audio_bitrate,
         format_bitrate=format_bitrate,
+        frame_rate=frame_rate,
     )
 
 
+def _parse_frame_rate(raw: object) -> float:
+    # ffprobe 以分数形式给出帧率，如 "30000/1001"；"0/0" 表示未知
+    numerator, _, denominator = str(raw or "").partition("/")
+    try:
+        value = float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+    return value if value > 0 else 0.0
+
+
 def concat_with_endcard(
     source_video: Path,
     endcard_video: Path,
     output_video: Path,
     timeout_sec: float,
-) -> None:
+    cancel_token: CancelToken | None = None,
+    settings: EncodeSettings | None = None,
+    source_probe: VideoProbe | None = None,
+    endcard_probe: VideoProbe | None = None,
+) -> EncodePolicy:
     if timeout_sec <= 0:
         raise TimeoutError("任务超时")
 
-    source_probe = probe_video(source_video)
-    endcard_probe = probe_video(endcard_video)
-    target_video_bitrate = _select_video_bitrate(source_probe)
-    target_audio_bitrate = _select_audio_bitrate(source_probe)
+    source_probe = source_probe or probe_video(source_video, cancel_token=cancel_token)
+    endcard_probe = endcard_probe or probe_video(endcard_video, cancel_token=cancel_token)
+    settings = settings or EncodeSettings()
+    width, height = output_size(source_probe.width, source_probe.height, settings)
+    policy = replace(
+        select_encode_policy(source_probe, settings, width, height),
+        output_duration_sec=source_probe.duration_sec + endcard_probe.duration_sec,
+    )
+    cmd = _build_concat_command(
+        source_video=source_video,
+        endcard_video=endcard_video,
+        output_video=output_video,
+        source_probe=source_probe,
+        endcard_probe=endcard_probe,
+        policy=policy,
+        output_width=width,
+        output_height=height,
+    )
+
+    raise_if_cancelled(cancel_token)
+    with observe_duration(ENCODE_SECONDS, mode="single"), span(
+        "ffmpeg", "encode", mode="single", output=output_video.name
+    ):
+        try:
+            completed = run_child(cmd, timeout_sec=timeout_sec, cancel_token=cancel_token)
+        except subprocess.TimeoutExpired as exc:
+            raise TimeoutError("ffmpeg 处理超时") from exc
+        if completed.returncode != 0:
+            raise FFmpegError(_ffmpeg_error_message(completed.stderr))
+    if policy.packaging == "fragmented":
+        verify_output(output_video, policy, cancel_token=cancel_token)
+    return policy
+
+
+async def concat_with_endcard_async(
+    source_video: Path,
+    endcard_video: Path,
+    output_video: Path,
+    timeout_sec: float,
+    settings: EncodeSettings | None = None,
+    source_probe: VideoProbe | None = None,
+    endcard_probe: VideoProbe | None = None,
+) -> EncodePolicy:
+    if timeout_sec <= 0:
+        raise TimeoutError("任务超时")
+
+    source_probe = source_probe or await probe_video_async(source_video)
+    endcard_probe = endcard_probe or await probe_video_async(endcard_video)
+    settings = settings or EncodeSettings()
+    width, height = output_size(source_probe.width, source_probe.height, settings)
+    policy = replace(
+        select_encode_policy(source_probe, settings, width, height),
+        output_duration_sec=source_probe.duration_sec + endcard_probe.duration_sec,
+    )
+    cmd = _build_concat_command(
+        source_video=source_video,
+        endcard_video=endcard_video,
+        output_video=output_video,
+        source_probe=source_probe,
+        endcard_probe=endcard_probe,
+        policy=policy,
+        output_width=width,
+        output_height=height,
+    )
+
+    with observe_duration(ENCODE_SECONDS, mode="single"), span(
+        "ffmpeg", "encode", mode="single", output=output_video.name
+    ):
+        try:
+            completed = await run_child_async(cmd, timeout_sec=timeout_sec)
+        except subprocess.TimeoutExpired as exc:
+            raise TimeoutError("ffmpeg 处理超时") from exc
+        if completed.returncode != 0:
+            raise FFmpegError(_ffmpeg_error_message(completed.stderr))
+    if policy.packaging == "fragmented":
+        await verify_output_async(output_video, policy)
+    return policy
+
+
+def verify_output(
+    output_video: Path, policy: EncodePolicy, cancel_token: CancelToken | None = None
+) -> None:
+    # 分片 MP4 没有 faststart 改写这一步兜底，写完后重新探测一次确认文件完整可用
+    try:
+        probe = probe_video(output_video, cancel_token=cancel_token)
+    except FFmpegError as exc:
+        raise FFmpegError(f"输出校验失败: {exc}") from exc
+    check_output_probe(probe, policy)
+
+
+async def verify_output_async(output_video: Path, policy: EncodePolicy) -> None:
+    try:
+        probe = await probe_video_async(output_video)
+    except FFmpegError as exc:
+        raise FFmpegError(f"输出校验失败: {exc}") from exc
+    check_output_probe(probe, policy)
+
+
+def check_output_probe(probe: VideoProbe, policy: EncodePolicy) -> None:
+    if not probe.has_audio:
+        raise FFmpegError("输出校验失败: 缺少音轨")
+    expected = policy.output_duration_sec
+    tolerance = max(OUTPUT_DURATION_TOLERANCE_SEC, expected * OUTPUT_DURATION_TOLERANCE_RATIO)
+    if expected > 0 and abs(probe.duration_sec - expected) > tolerance:
+        raise FFmpegError(
+            f"输出校验失败: 时长 {probe.duration_sec:.2f} 秒，预期 {expected:.2f} 秒"
+        )
+
+
+def _ffmpeg_error_message(stderr: str) -> str:
+    stderr = stderr.strip()
+    return stderr.splitlines()[-1] if stderr else "ffmpeg 执行失败"
+
+
+def _build_concat_command(
+    source_video: Path,
+    endcard_video: Path,
+    output_video: Path,
+    source_probe: VideoProbe,
+    endcard_probe: VideoProbe,
+    policy: EncodePolicy,
+    output_width: int | None = None,
+    output_height: int | None = None,
+) -> list[str]:
+    width = output_width or source_probe.width
+    height = output_height or source_probe.height
 
     input_args = ["-i", str(source_video), "-i", str(endcard_video)]
     filter_parts = [
-        "[0:v]setsar=1[v0]",
-        (
-            "[1:v]"
-            f"scale={source_probe.width}:{source_probe.height}:force_original_aspect_ratio=decrease,"
-            f"pad={source_probe.width}:{source_probe.height}:(ow-iw)/2:(oh-ih)/2:black,"
-            "setsar=1[v1]"
-        ),
+        f"[0:v]{_source_video_filter(source_probe, width, height)}[v0]",
+        f"[1:v]{_endcard_video_filter(width, height)}[v1]",
     ]
 
+    audio_inputs, audio_filters = _audio_graph(source_probe, endcard_probe)
+    input_args.extend(audio_inputs)
+    filter_parts.extend(audio_filters)
+
+    filter_parts.append("[v0][a0][v1][a1]concat=n=2:v=1:a=1[v][a]")
+    filter_complex = ";".join(filter_parts)
+
+    return [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        *input_args,
+        "-filter_complex",
+        filter_complex,
+        "-map",
+        "[v]",
+        "-map",
+        "[a]",
+        "-c:v",
+        "libx264",
+        *_preset_args(policy),
+        *_video_rate_args(policy),
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        "-b:a",
+        str(policy.audio_bitrate),
+        *movflags_args(policy.packaging),
+        str(output_video),
+    ]
+
+
+def _source_video_filter(source_probe: VideoProbe, width: int, height: int) -> str:
+    # 源视频超过输出上限时在同一个滤镜图里缩小
+    if (width, height) != (source_probe.width, source_probe.height):
+        return f"scale={width}:{height},setsar=1"
+    return "setsar=1"
+
+
+def _endcard_video_filter(width: int, height: int) -> str:
+    # 落版按输出尺寸（可能已缩小）等比适配并居中补边
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,"
+        "setsar=1"
+    )
+
+
+def _audio_graph(
+    source_probe: VideoProbe, endcard_probe: VideoProbe
+) -> tuple[list[str], list[str]]:
+    # 输入 0 为源视频、输入 1 为落版，产出 [a0][a1]；缺音轨时补同长度静音
+    input_args: list[str] = []
+    filter_parts: list[str] = []
     next_input_index = 2
 
     if source_probe.has_audio:
@@ -195,52 +556,4 @@ def concat_with_endcard(
             f"[{next_input_index}:a]atrim=0:{endcard_probe.duration_sec:.3f},asetpts=N/SR/TB[a1]"
         )
 
-    filter_parts.append("[v0][a0][v1][a1]concat=n=2:v=1:a=1[v][a]")
-    filter_complex = ";".join(filter_parts)
-
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-hide_banner",
-        "-loglevel",
-        "error",
-        *input_args,
-        "-filter_complex",
-        filter_complex,
-        "-map",
-        "[v]",
-        "-map",
-        "[a]",
-        "-c:v",
-        "libx264",
-        "-b:v",
-        str(target_video_bitrate),
-        "-maxrate",
-        str(target_video_bitrate),
-        "-bufsize",
-        str(target_video_bitrate * 2),
-        "-pix_fmt",
-        "yuv420p",
-        "-c:a",
-        "aac",
-        "-b:a",
-        str(target_audio_bitrate),
-        "-movflags",
-        "+faststart",
-        str(output_video),
-    ]
-
-    try:
-        subprocess.run(
-            cmd,
-            check=True,
-            capture_output=True,
-            text=True,
-            timeout=timeout_sec,
-        )
-    except subprocess.TimeoutExpired as exc:
-        raise TimeoutError("ffmpeg 处理超时") from exc
-    except subprocess.CalledProcessError as exc:
-        stderr = (exc.stderr or "").strip()
-        message = stderr.splitlines()[-1] if stderr else "ffmpeg 执行失败"
-        raise FFmpegError(message) from exc
+    return input_args, filter_parts
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import platform
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import astuple, dataclass, fields
+from pathlib import Path
+from typing import Iterable
+
+from .models import Config, TaskResult
+
+
+# 每台机器只保留最近这么多条，库文件大小有上限
+MAX_ROWS_PER_HOST = 5000
+# 预估只参考最近这么多条，机器或网络变化后能较快跟上
+RECENT_LIMIT = 500
+# 批次内攒够这么多条写一次库
+FLUSH_ROWS = 100
+CONNECT_TIMEOUT_SEC = 5.0
+
+
+@dataclass(frozen=True)
+class HistorySample:
+    host: str
+    engine: str
+    preset: str
+    max_workers: int
+    source_bytes: int
+    media_duration_sec: float
+    width: int
+    height: int
+    download_sec: float
+    encode_sec: float
+    wall_sec: float
+    cpu_sec: float
+    recorded_at: float = 0.0
+
+
+COLUMNS = tuple(item.name for item in fields(HistorySample))
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_stats (
+    host TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    preset TEXT NOT NULL,
+    max_workers INTEGER NOT NULL,
+    source_bytes INTEGER NOT NULL,
+    media_duration_sec REAL NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    download_sec REAL NOT NULL,
+    encode_sec REAL NOT NULL,
+    wall_sec REAL NOT NULL,
+    cpu_sec REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS task_stats_host ON task_stats (host, recorded_at);
+"""
+
+
+def current_host() -> str:
+    return platform.node() or "unknown"
+
+
+class ThroughputHistory:
+    # 本机的任务统计历史（SQLite）；每次读写单独连接，多个会话、多个进程可同时使用
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._initialized = False
+
+    def record(self, samples: Iterable[HistorySample]) -> int:
+        now = time.time()
+        rows = [astuple(sample)[:-1] + (sample.recorded_at or now,) for sample in samples]
+        if not rows:
+            return 0
+        placeholders = ",".join("?" * len(COLUMNS))
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                f"INSERT INTO task_stats ({','.join(COLUMNS)}) VALUES ({placeholders})", rows
+            )
+            for host in {row[0] for row in rows}:
+                conn.execute(
+                    "DELETE FROM task_stats WHERE host = ? AND rowid NOT IN ("
+                    "SELECT rowid FROM task_stats WHERE host = ? "
+                    "ORDER BY recorded_at DESC LIMIT ?)",
+                    (host, host, MAX_ROWS_PER_HOST),
+                )
+        return len(rows)
+
+    def recent(
+        self, host: str, preset: str | None = None, limit: int = RECENT_LIMIT
+    ) -> list[HistorySample]:
+        query = f"SELECT {','.join(COLUMNS)} FROM task_stats WHERE host = ?"
+        params: list[object] = [host]
+        if preset is not None:
+            query += " AND preset = ?"
+            params.append(preset)
+        query += " ORDER BY recorded_at DESC LIMIT ?"
+        params.append(limit)
+        with closing(self._connect()) as conn:
+            return [HistorySample(*row) for row in conn.execute(query, params)]
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=CONNECT_TIMEOUT_SEC)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+
+class HistoryRecorder:
+    # 批次内缓冲成功任务的统计，攒够一批或批次结束时写库；
+    # 写库失败只是少了历史，不影响批次本身，之后不再尝试
+    def __init__(self, history: ThroughputHistory, config: Config) -> None:
+        self.history = history
+        self.config = config
+        self.host = current_host()
+        self.recorded = 0
+        self.error = ""
+        self._pending: list[HistorySample] = []
+
+    def add(self, result: TaskResult) -> None:
+        sample = sample_from_result(result, self.config, self.host)
+        if sample is None or self.error:
+            return
+        self._pending.append(sample)
+        if len(self._pending) >= FLUSH_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        if not pending or self.error:
+            return
+        try:
+            self.recorded += self.history.record(pending)
+        except (sqlite3.Error, OSError) as exc:
+            self.error = str(exc)
+
+
+def sample_from_result(result: TaskResult, config: Config, host: str) -> HistorySample | None:
+    # 失败、取消的任务耗时不代表正常吞吐，不记录
+    stats = result.stats
+    if result.status != "SUCCESS" or stats is None:
+        return None
+    return HistorySample(
+        host=host,
+        engine=config.engine,
+        preset=config.x264_preset,
+        max_workers=config.max_workers,
+        source_bytes=stats.source_bytes,
+        media_duration_sec=stats.media_duration_sec,
+        width=stats.width,
+        height=stats.height,
+        download_sec=stats.download_sec,
+        encode_sec=stats.encode_sec,
+        wall_sec=result.duration_sec,
+        cpu_sec=result.usage.cpu_sec,
+    )
+
+
+def open_recorder(config: Config) -> HistoryRecorder | None:
+    if config.history_path is None:
+        return None
+    return HistoryRecorder(ThroughputHistory(config.history_path), config)
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
 import csv
-from io import BytesIO, StringIO
+from io import BytesIO, TextIOWrapper
+from itertools import zip_longest
 from pathlib import Path
+from typing import Iterable, Iterator
 from urllib.parse import urlparse
 
 import pandas as pd
+from openpyxl import load_workbook
 
 from .models import InputRow, ParseFailure
 
 
 REQUIRED_COLUMNS = {"pid", "video_url"}
 REQUIRED_EXCEL_COLUMNS = {"商品id", "视频链接"}
+# 可选列：按名称选择落版，留空使用默认落版
+ENDCARD_COLUMN = "endcard"
+EXCEL_ENDCARD_COLUMN = "落版"
 INVALID_FILENAME_CHARS = set('<>:"/\\|?*')
 
 
@@ -44,17 +50,34 @@ def parse_split_inputs_with_errors(
     upload_file_name: str | None = None,
     upload_bytes: bytes | None = None,
 ) -> tuple[list[InputRow], list[ParseFailure]]:
+    return _collect(
+        iter_split_inputs(
+            pid_text=pid_text,
+            video_url_text=video_url_text,
+            upload_file_name=upload_file_name,
+            upload_bytes=upload_bytes,
+        )
+    )
+
+
+def iter_split_inputs(
+    pid_text: str,
+    video_url_text: str,
+    upload_file_name: str | None = None,
+    upload_bytes: bytes | None = None,
+) -> Iterator[InputRow | ParseFailure]:
+    # 按输入顺序逐条产出解析结果，调用方可以边解析边处理；
     # 分列输入优先：任一输入框有内容就忽略 CSV
     has_pid_text = any(line.strip() for line in pid_text.splitlines())
     has_url_text = any(line.strip() for line in video_url_text.splitlines())
     if has_pid_text or has_url_text:
-        return _parse_split_text_rows(pid_text=pid_text, video_url_text=video_url_text)
+        return _iter_split_text_rows(pid_text=pid_text, video_url_text=video_url_text)
     if upload_bytes:
-        return _parse_uploaded_rows(
+        return _iter_uploaded_rows(
             upload_file_name=upload_file_name,
             upload_bytes=upload_bytes,
         )
-    return [], []
+    return iter(())
 
 
 def parse_inputs_with_errors(
@@ -62,95 +85,83 @@ def parse_inputs_with_errors(
 ) -> tuple[list[InputRow], list[ParseFailure]]:
     # 文本框优先：只要有至少一条非空行，就忽略 CSV
     if any(line.strip() for line in text.splitlines()):
-        return _parse_text_rows(text)
+        return _collect(_iter_text_rows(text))
     if csv_bytes:
-        return _parse_csv_rows(csv_bytes)
+        return _collect(_iter_csv_rows(csv_bytes))
     return [], []
 
 
-def _parse_text_rows(text: str) -> tuple[list[InputRow], list[ParseFailure]]:
+def _collect(
+    items: Iterable[InputRow | ParseFailure],
+) -> tuple[list[InputRow], list[ParseFailure]]:
     rows: list[InputRow] = []
     failures: list[ParseFailure] = []
-    index = 0
+    for item in items:
+        if isinstance(item, ParseFailure):
+            failures.append(item)
+        else:
+            rows.append(item)
+    return rows, failures
+
 
+def _checked_row(
+    index: int, pid_raw: str, video_url: str, endcard: str = ""
+) -> InputRow | ParseFailure:
+    error = _validate_row(pid_raw=pid_raw, video_url=video_url)
+    if error:
+        return ParseFailure(index=index, pid_raw=pid_raw, error=error)
+    return InputRow(
+        index=index,
+        pid_raw=pid_raw,
+        pid_sanitized=sanitize_pid(pid_raw),
+        video_url=video_url,
+        endcard=endcard,
+    )
+
+
+def _iter_text_rows(text: str) -> Iterator[InputRow | ParseFailure]:
+    index = 0
     for raw_line in text.splitlines():
         line = raw_line.strip()
         if not line:
             continue
 
         if "," not in line:
-            failures.append(
-                ParseFailure(
-                    index=index,
-                    pid_raw=line,
-                    error="输入格式错误：需为 pid,video_url",
-                )
+            yield ParseFailure(
+                index=index,
+                pid_raw=line,
+                error="输入格式错误：需为 pid,video_url",
             )
             index += 1
             continue
 
         pid_raw, video_url = line.split(",", 1)
-        pid_raw = pid_raw.strip()
-        video_url = video_url.strip()
-
-        error = _validate_row(pid_raw=pid_raw, video_url=video_url)
-        if error:
-            failures.append(ParseFailure(index=index, pid_raw=pid_raw, error=error))
-        else:
-            rows.append(
-                InputRow(
-                    index=index,
-                    pid_raw=pid_raw,
-                    pid_sanitized=sanitize_pid(pid_raw),
-                    video_url=video_url,
-                )
-            )
+        yield _checked_row(index, pid_raw.strip(), video_url.strip())
         index += 1
 
-    return rows, failures
-
 
-def _parse_split_text_rows(
+def _iter_split_text_rows(
     pid_text: str,
     video_url_text: str,
-) -> tuple[list[InputRow], list[ParseFailure]]:
-    rows: list[InputRow] = []
-    failures: list[ParseFailure] = []
-
-    pid_lines = [line.strip() for line in pid_text.splitlines()]
-    url_lines = [line.strip() for line in video_url_text.splitlines()]
-
+) -> Iterator[InputRow | ParseFailure]:
     row_index = 0
-    for i in range(max(len(pid_lines), len(url_lines))):
-        pid_raw = pid_lines[i] if i < len(pid_lines) else ""
-        video_url = url_lines[i] if i < len(url_lines) else ""
+    for pid_line, url_line in zip_longest(
+        pid_text.splitlines(), video_url_text.splitlines(), fillvalue=""
+    ):
+        pid_raw = pid_line.strip()
+        video_url = url_line.strip()
 
         # 两列同一行都为空则忽略
         if not pid_raw and not video_url:
             continue
 
-        error = _validate_row(pid_raw=pid_raw, video_url=video_url)
-        if error:
-            failures.append(ParseFailure(index=row_index, pid_raw=pid_raw, error=error))
-        else:
-            rows.append(
-                InputRow(
-                    index=row_index,
-                    pid_raw=pid_raw,
-                    pid_sanitized=sanitize_pid(pid_raw),
-                    video_url=video_url,
-                )
-            )
+        yield _checked_row(row_index, pid_raw, video_url)
         row_index += 1
 
-    return rows, failures
-
 
-def _decode_csv(csv_bytes: bytes) -> str:
-    try:
-        return csv_bytes.decode("utf-8-sig")
-    except UnicodeDecodeError:
-        return csv_bytes.decode("utf-8", errors="replace")
+def _open_csv_text(csv_bytes: bytes) -> TextIOWrapper:
+    # 按需解码，不把整个上传内容先转换成一份字符串；非法字节替换为占位符
+    return TextIOWrapper(BytesIO(csv_bytes), encoding="utf-8-sig", errors="replace", newline="")
 
 
 def _normalize_header(value: object) -> str:
@@ -167,133 +178,123 @@ def _to_text(value: object) -> str:
     return str(value).strip()
 
 
-def _parse_uploaded_rows(
+def _iter_uploaded_rows(
     upload_file_name: str | None,
     upload_bytes: bytes,
-) -> tuple[list[InputRow], list[ParseFailure]]:
+) -> Iterator[InputRow | ParseFailure]:
     suffix = Path(upload_file_name or "").suffix.lower()
     if suffix in {".xlsx", ".xlsm"}:
-        return _parse_excel_rows(upload_bytes)
+        return _iter_excel_rows(upload_bytes)
     if suffix in {"", ".csv"}:
-        return _parse_csv_rows(upload_bytes)
-
-    return [], [
-        ParseFailure(
-            index=0,
-            pid_raw="",
-            error=f"不支持的文件类型: {upload_file_name or 'unknown'}",
-        )
-    ]
+        return _iter_csv_rows(upload_bytes)
+
+    return iter(
+        [
+            ParseFailure(
+                index=0,
+                pid_raw="",
+                error=f"不支持的文件类型: {upload_file_name or 'unknown'}",
+            )
+        ]
+    )
 
 
-def _parse_excel_rows(excel_bytes: bytes) -> tuple[list[InputRow], list[ParseFailure]]:
-    rows: list[InputRow] = []
-    failures: list[ParseFailure] = []
-
+def _iter_excel_rows(excel_bytes: bytes) -> Iterator[InputRow | ParseFailure]:
+    # 只读模式逐行读取工作表，内存占用不随表格行数增长
     try:
-        df = pd.read_excel(BytesIO(excel_bytes), dtype=object)
+        workbook = load_workbook(BytesIO(excel_bytes), read_only=True, data_only=True)
     except Exception as exc:  # noqa: BLE001
-        return [], [ParseFailure(index=0, pid_raw="", error=f"Excel 解析失败: {exc}")]
-
-    normalized_headers = {_normalize_header(col): col for col in df.columns}
-    normalized_required = {_normalize_header(col) for col in REQUIRED_EXCEL_COLUMNS}
-    if not normalized_required.issubset(set(normalized_headers.keys())):
-        return [], [ParseFailure(index=0, pid_raw="", error="Excel 缺少必需列: 商品id,视频链接")]
-
-    pid_col = normalized_headers[_normalize_header("商品id")]
-    url_col = normalized_headers[_normalize_header("视频链接")]
+        yield ParseFailure(index=0, pid_raw="", error=f"Excel 解析失败: {exc}")
+        return
 
     index = 0
-    for row in df[[pid_col, url_col]].itertuples(index=False, name=None):
-        pid_raw = _to_text(row[0])
-        video_url = _to_text(row[1])
-
-        # 需求：链接为空时直接忽略，不作为失败项
-        if not video_url:
-            continue
+    try:
+        values = workbook.worksheets[0].iter_rows(values_only=True)
+        normalized_headers: dict[str, int] = {}
+        for position, col in enumerate(next(values, None) or ()):
+            if col is not None:
+                normalized_headers.setdefault(_normalize_header(col), position)
+        normalized_required = {_normalize_header(col) for col in REQUIRED_EXCEL_COLUMNS}
+        if not normalized_required.issubset(set(normalized_headers.keys())):
+            yield ParseFailure(index=0, pid_raw="", error="Excel 缺少必需列: 商品id,视频链接")
+            return
+
+        pid_col = normalized_headers[_normalize_header("商品id")]
+        url_col = normalized_headers[_normalize_header("视频链接")]
+        endcard_col = normalized_headers.get(_normalize_header(EXCEL_ENDCARD_COLUMN))
+
+        for row in values:
+            pid_raw = _to_text(_cell(row, pid_col))
+            video_url = _to_text(_cell(row, url_col))
+            endcard = _to_text(_cell(row, endcard_col)) if endcard_col is not None else ""
+
+            # 需求：链接为空时直接忽略，不作为失败项
+            if not video_url:
+                continue
 
-        error = _validate_row(pid_raw=pid_raw, video_url=video_url)
-        if error:
-            failures.append(ParseFailure(index=index, pid_raw=pid_raw, error=error))
-        else:
-            rows.append(
-                InputRow(
-                    index=index,
-                    pid_raw=pid_raw,
-                    pid_sanitized=sanitize_pid(pid_raw),
-                    video_url=video_url,
-                )
-            )
-        index += 1
+            yield _checked_row(index, pid_raw, video_url, endcard)
+            index += 1
+    except Exception as exc:  # noqa: BLE001
+        yield ParseFailure(index=index, pid_raw="", error=f"Excel 解析失败: {exc}")
+    finally:
+        workbook.close()
 
-    return rows, failures
 
+def _cell(row: tuple[object, ...], position: int) -> object:
+    return row[position] if position < len(row) else None
 
-def _parse_csv_rows(csv_bytes: bytes) -> tuple[list[InputRow], list[ParseFailure]]:
-    rows: list[InputRow] = []
-    failures: list[ParseFailure] = []
 
-    content = _decode_csv(csv_bytes)
-    table = list(csv.reader(StringIO(content)))
-    if not table:
-        return rows, failures
+def _iter_csv_rows(csv_bytes: bytes) -> Iterator[InputRow | ParseFailure]:
+    reader = csv.reader(_open_csv_text(csv_bytes))
+    header = next(reader, None)
+    if header is None:
+        return
 
-    normalized_headers = [col.strip().lower() for col in table[0]]
+    normalized_headers = [col.strip().lower() for col in header]
     has_required_headers = REQUIRED_COLUMNS.issubset(set(normalized_headers))
 
     if not has_required_headers:
         index = 0
-        for raw in table[1:]:
+        for raw in reader:
             if not any(cell.strip() for cell in raw):
                 continue
             pid_raw = raw[0].strip() if raw else ""
-            failures.append(
-                ParseFailure(
-                    index=index,
-                    pid_raw=pid_raw,
-                    error="CSV 缺少必需表头: pid,video_url",
-                )
+            yield ParseFailure(
+                index=index,
+                pid_raw=pid_raw,
+                error="CSV 缺少必需表头: pid,video_url",
             )
             index += 1
 
-        if index == 0 and any(cell.strip() for cell in table[0]):
-            pid_raw = table[0][0].strip() if table[0] else ""
-            failures.append(
-                ParseFailure(
-                    index=0,
-                    pid_raw=pid_raw,
-                    error="CSV 缺少必需表头: pid,video_url",
-                )
+        if index == 0 and any(cell.strip() for cell in header):
+            pid_raw = header[0].strip() if header else ""
+            yield ParseFailure(
+                index=0,
+                pid_raw=pid_raw,
+                error="CSV 缺少必需表头: pid,video_url",
             )
-        return rows, failures
+        return
 
     pid_col = normalized_headers.index("pid")
     url_col = normalized_headers.index("video_url")
+    endcard_col = (
+        normalized_headers.index(ENDCARD_COLUMN) if ENDCARD_COLUMN in normalized_headers else None
+    )
 
     index = 0
-    for raw in table[1:]:
+    for raw in reader:
         if not any(cell.strip() for cell in raw):
             continue
 
         pid_raw = raw[pid_col].strip() if pid_col < len(raw) else ""
         video_url = raw[url_col].strip() if url_col < len(raw) else ""
+        endcard = (
+            raw[endcard_col].strip() if endcard_col is not None and endcard_col < len(raw) else ""
+        )
 
-        error = _validate_row(pid_raw=pid_raw, video_url=video_url)
-        if error:
-            failures.append(ParseFailure(index=index, pid_raw=pid_raw, error=error))
-        else:
-            rows.append(
-                InputRow(
-                    index=index,
-                    pid_raw=pid_raw,
-                    pid_sanitized=sanitize_pid(pid_raw),
-                    video_url=video_url,
-                )
-            )
+        yield _checked_row(index, pid_raw, video_url, endcard)
         index += 1
 
-    return rows, failures
-
 
 def _validate_row(pid_raw: str, video_url: str) -> str:
     if not pid_raw:
@@ -306,9 +307,15 @@ def _validate_row(pid_raw: str, video_url: str) -> str:
 
 
 def assign_output_filenames(rows: list[InputRow]) -> dict[int, str]:
-    assigned: dict[int, str] = {}
+    return {
+        row.index: output_filename
+        for row, output_filename in iter_output_filenames(
+            sorted(rows, key=lambda item: item.index)
+        )
+    }
 
-    for order, row in enumerate(sorted(rows, key=lambda item: item.index), start=1):
-        assigned[row.index] = f"{order}.mp4"
 
-    return assigned
+def iter_output_filenames(rows: Iterable[InputRow]) -> Iterator[tuple[InputRow, str]]:
+    # 行按输入顺序到达时逐条编号，与 assign_output_filenames 的结果一致
+    for order, row in enumerate(rows, start=1):
+        yield row, f"{order}.mp4"
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import math
+import threading
+from abc import ABC, abstractmethod
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, TypeVar
+
+from .models import Config
+
+
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = tuple[str, ...]
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} 需要标签 {self.label_names}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _format_labels(self, values: LabelValues, extra: tuple[tuple[str, str], ...] = ()) -> str:
+        pairs = [*zip(self.label_names, values), *extra]
+        if not pairs:
+            return ""
+        body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        return "{" + body + "}"
+
+    def render(self) -> list[str]:
+        header = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        return header + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> list[str]:
+        # 各类指标的样本行，不含 HELP/TYPE 头
+        ...
+
+
+M = TypeVar("M", bound=_Metric)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, label_names)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), []))
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        lines: list[str] = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, math.inf], counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else _number(bound)
+                lines.append(
+                    f"{self.name}_bucket{self._format_labels(key, (('le', le),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def counter(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: M) -> M:
+        self._metrics.append(metric)
+        return metric
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# 进程级指标，所有批次、所有会话共用
+REGISTRY = MetricsRegistry()
+
+TASKS = REGISTRY.counter("sp_tasks_total", "已完成的任务数（按状态）", ("status",))
+QUEUE_DEPTH = REGISTRY.gauge("sp_queue_depth", "已提交但尚未开始执行的任务数")
+DOWNLOAD_BYTES = REGISTRY.counter("sp_download_bytes_total", "下载写入的字节数")
+DOWNLOAD_SECONDS = REGISTRY.histogram(
+    "sp_download_duration_seconds", "单条视频下载耗时（含重试）", ("outcome",)
+)
+DOWNLOAD_RETRIES = REGISTRY.counter("sp_download_retries_total", "下载重试次数")
+DOWNLOAD_RESUMES = REGISTRY.counter("sp_download_resumes_total", "从断点继续的下载次数")
+PROBES = REGISTRY.counter(
+    "sp_probes_total", "视频元数据探测次数（native 为直接解析 MP4，ffprobe 为回退）", ("method",)
+)
+ENCODE_SECONDS = REGISTRY.histogram(
+    "sp_encode_duration_seconds", "拼接编码耗时（不含探测）", ("mode", "outcome")
+)
+ACTIVE_CHILDREN = REGISTRY.gauge(
+    "sp_active_ffmpeg_processes", "正在运行的 ffmpeg / ffprobe 子进程数", ("program",)
+)
+STARTUP_SECONDS = REGISTRY.gauge(
+    "sp_startup_seconds", "从启动器启动到各阶段完成的秒数", ("phase",)
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "sp_cache_lookups_total", "缓存查询次数（按缓存与命中情况）", ("cache", "result")
+)
+
+
+@contextmanager
+def observe_duration(histogram: Histogram, **labels: str) -> Iterator[None]:
+    # 按是否抛出异常区分 outcome 标签，取消、超时都算作 error
+    started_at = time.monotonic()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        histogram.observe(time.monotonic() - started_at, outcome=outcome, **labels)
+
+
+@contextmanager
+def track_child(cmd: list[str]) -> Iterator[None]:
+    program = Path(cmd[0]).name if cmd else "unknown"
+    ACTIVE_CHILDREN.inc(program=program)
+    try:
+        yield
+    finally:
+        ACTIVE_CHILDREN.dec(program=program)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        payload = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
+
+
+_server_lock = threading.Lock()
+_servers: dict[tuple[str, int], ThreadingHTTPServer] = {}
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    # 同一地址只启动一次；Streamlit 每次重跑脚本都会调用到这里
+    with _server_lock:
+        server = _servers.get((host, port))
+        if server is None:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="sp-metrics", daemon=True).start()
+            _servers[(host, port)] = server
+        return server
+
+
+def ensure_metrics_server(config: Config) -> ThreadingHTTPServer | None:
+    if config.metrics_port <= 0:
+        return None
+    try:
+        return start_metrics_server(config.metrics_port, config.metrics_host)
+    except OSError:
+        # 端口被其它进程占用时不影响批处理本身
+        return None
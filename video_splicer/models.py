@@ -1,20 +1,82 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Literal
 
 
-Status = Literal["SUCCESS", "FAILED"]
+Status = Literal["SUCCESS", "FAILED", "CANCELLED"]
+
+# 按输出画面短边分档的视频码率上限（bps），源视频码率虚高时不再原样照搬
+DEFAULT_BITRATE_LADDER: tuple[tuple[int, int], ...] = (
+    (480, 1_500_000),
+    (720, 3_000_000),
+    (1080, 6_000_000),
+    (1440, 10_000_000),
+    (2160, 20_000_000),
+)
+# libx264 预设，从快到慢；越慢同码率下画质越好
+X264_PRESETS = (
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+)
 
 
 @dataclass(frozen=True)
 class Config:
     endcard_path: Path
+    endcard_dir: Path | None = None
     max_video_mb: int = 50
     max_workers: int = 4
     task_timeout_sec: int = 180
     download_retries: int = 2
+    engine: str = "thread"
+    max_downloads: int = 32
+    per_host_connections: int = 4
+    bandwidth_limit_kbps: int = 0
+    spool_dir: Path | None = None
+    deliver_dir: Path | None = None
+    disk_budget_mb: int = 0
+    artifact_dir: Path | None = None
+    artifact_ttl_sec: int = 6 * 3600
+    artifact_max_mb: int = 4096
+    preflight: bool = False
+    task_order: str = "input"
+    rate_control: str = "bitrate"
+    crf: int = 23
+    x264_preset: str = "medium"
+    bitrate_ladder: tuple[tuple[int, int], ...] = DEFAULT_BITRATE_LADDER
+    max_output_long_edge: int = 0
+    max_output_height: int = 0
+    segment_threshold_sec: int = 0
+    mp4_packaging: str = "faststart"
+    metrics_port: int = 0
+    metrics_host: str = "127.0.0.1"
+    trace: bool = False
+    result_parquet: bool = False
+    # 任务统计历史库；None 表示不记录历史、不做预估
+    history_path: Path | None = None
+    # 实际生效的校准档案；未使用档案时为 None
+    profile_path: Path | None = None
+
+
+@dataclass(frozen=True)
+class VideoProbe:
+    width: int
+    height: int
+    duration_sec: float
+    has_audio: bool
+    video_bitrate: int
+    audio_bitrate: int
+    format_bitrate: int
+    frame_rate: float = 0.0
 
 
 @dataclass(frozen=True)
@@ -23,6 +85,7 @@ class InputRow:
     pid_raw: str
     pid_sanitized: str
     video_url: str
+    endcard: str = ""
 
 
 @dataclass(frozen=True)
@@ -32,6 +95,40 @@ class ParseFailure:
     error: str
 
 
+@dataclass(frozen=True)
+class ResourceUsage:
+    # ffmpeg / ffprobe 子进程的资源占用；多个子进程合并时 CPU 与耗时累加、内存取峰值
+    user_sec: float = 0.0
+    sys_sec: float = 0.0
+    max_rss_bytes: int = 0
+    wall_sec: float = 0.0
+    children: int = 0
+
+    @property
+    def cpu_sec(self) -> float:
+        return self.user_sec + self.sys_sec
+
+    def combine(self, other: ResourceUsage) -> ResourceUsage:
+        return ResourceUsage(
+            user_sec=self.user_sec + other.user_sec,
+            sys_sec=self.sys_sec + other.sys_sec,
+            max_rss_bytes=max(self.max_rss_bytes, other.max_rss_bytes),
+            wall_sec=self.wall_sec + other.wall_sec,
+            children=self.children + other.children,
+        )
+
+
+@dataclass(frozen=True)
+class TaskStats:
+    # 成功任务的输入规模与分阶段耗时，写入历史库供批次预估使用
+    source_bytes: int
+    media_duration_sec: float
+    width: int
+    height: int
+    download_sec: float
+    encode_sec: float
+
+
 @dataclass
 class TaskResult:
     index: int
@@ -41,3 +138,8 @@ class TaskResult:
     error: str
     duration_sec: float
     output_path: Path | None
+    encode_policy: str = ""
+    output_duration_sec: float = 0.0
+    usage: ResourceUsage = field(default_factory=ResourceUsage)
+    # 只在调度过程中传递给历史库，结果存储不保留
+    stats: TaskStats | None = None
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from .models import VideoProbe
+
+
+# 第一个顶层盒子必须是其中之一，否则不当作 ISO-BMFF / QuickTime 文件
+TOP_LEVEL_BOXES = {
+    b"ftyp",
+    b"styp",
+    b"moov",
+    b"mdat",
+    b"free",
+    b"skip",
+    b"wide",
+    b"pnot",
+    b"uuid",
+    b"meta",
+}
+TRACK_CONTAINERS = {b"mdia", b"minf", b"stbl"}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+@dataclass
+class _Track:
+    handler: bytes = b""
+    timescale: int = 0
+    duration: int = 0
+    width: int = 0
+    height: int = 0
+    sample_count: int = 0
+    sample_bytes: int = 0
+
+    @property
+    def duration_sec(self) -> float:
+        return self.duration / self.timescale if self.timescale else 0.0
+
+    @property
+    def bitrate(self) -> int:
+        # 与 ffprobe 对 MOV 的算法一致：样本总字节数按轨道时长折算
+        duration = self.duration_sec
+        return int(self.sample_bytes * 8 / duration) if duration > 0 else 0
+
+    @property
+    def frame_rate(self) -> float:
+        duration = self.duration_sec
+        return self.sample_count / duration if duration > 0 else 0.0
+
+
+def probe_mp4(path: Path) -> VideoProbe | None:
+    # 内存映射文件后只读 moov 里的元数据，不起子进程；
+    # 读不了时返回 None，由调用方回退到 ffprobe
+    try:
+        with path.open("rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if size < 8:
+                return None
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return probe_mp4_buffer(buffer, size)
+    except (OSError, ValueError):
+        return None
+
+
+def probe_mp4_buffer(
+    buffer: bytes | mmap.mmap, total_size: int | None = None
+) -> VideoProbe | None:
+    # buffer 可以只是文件开头的一部分（例如下载到一半），moov 完整即可；
+    # total_size 为整个文件的大小，用于计算总码率
+    try:
+        moov = None
+        for index, (kind, start, stop) in enumerate(_boxes(buffer, 0, len(buffer))):
+            if index == 0 and kind not in TOP_LEVEL_BOXES:
+                return None
+            if kind == b"moov":
+                moov = (start, stop)
+                break
+        if moov is None:
+            return None
+        return _parse_moov(buffer, moov[0], moov[1], total_size or len(buffer))
+    except (_Unsupported, struct.error):
+        return None
+
+
+def _boxes(buffer: bytes | mmap.mmap, start: int, end: int) -> Iterator[tuple[bytes, int, int]]:
+    # 逐个产出 (类型, 内容起点, 内容终点)；盒子越界说明文件不完整或已损坏
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", buffer, offset)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", buffer, offset + 8)
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise _Unsupported(kind)
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _parse_moov(
+    buffer: bytes | mmap.mmap, start: int, stop: int, file_size: int
+) -> VideoProbe | None:
+    movie_timescale = movie_duration = 0
+    tracks: list[_Track] = []
+    for kind, box_start, box_stop in _boxes(buffer, start, stop):
+        if kind == b"mvhd":
+            movie_timescale, movie_duration = _time_fields(buffer, box_start, box_stop, kind)
+        elif kind == b"trak":
+            track = _Track()
+            _parse_track(buffer, box_start, box_stop, track)
+            tracks.append(track)
+        elif kind in {b"mvex", b"cmov"}:
+            # 分片 MP4 的样本表在各个 moof 里；压缩的 moov 不解析
+            return None
+
+    video = next((track for track in tracks if track.handler == b"vide"), None)
+    if video is None or video.width <= 0 or video.height <= 0:
+        return None
+    audio = next((track for track in tracks if track.handler == b"soun"), None)
+
+    duration = movie_duration / movie_timescale if movie_timescale else 0.0
+    if duration <= 0:
+        duration = max((track.duration_sec for track in tracks), default=0.0)
+    if duration <= 0:
+        return None
+
+    return VideoProbe(
+        width=video.width,
+        height=video.height,
+        duration_sec=duration,
+        has_audio=audio is not None,
+        video_bitrate=video.bitrate,
+        audio_bitrate=audio.bitrate if audio is not None else 0,
+        format_bitrate=int(file_size * 8 / duration),
+        frame_rate=video.frame_rate,
+    )
+
+
+def _parse_track(buffer: bytes | mmap.mmap, start: int, stop: int, track: _Track) -> None:
+    for kind, box_start, box_stop in _boxes(buffer, start, stop):
+        if kind in TRACK_CONTAINERS:
+            _parse_track(buffer, box_start, box_stop, track)
+        elif kind == b"tkhd":
+            # 显示尺寸（16.16 定点数），stsd 里读不到编码尺寸时兜底
+            offset = 88 if _version(buffer, box_start, box_stop, kind) == 1 else 76
+            _require(box_start, box_stop, offset + 8, kind)
+            width, height = struct.unpack_from(">II", buffer, box_start + offset)
+            track.width = track.width or width >> 16
+            track.height = track.height or height >> 16
+        elif kind == b"mdhd":
+            track.timescale, track.duration = _time_fields(buffer, box_start, box_stop, kind)
+        elif kind == b"hdlr":
+            # QuickTime 在 minf 里还有一个数据引用用的 dhlr，只取媒体类型
+            _require(box_start, box_stop, 12, kind)
+            component, handler = struct.unpack_from(">4s4s", buffer, box_start + 4)
+            if component != b"dhlr":
+                track.handler = handler
+        elif kind == b"stsd":
+            _parse_sample_description(buffer, box_start, box_stop, track)
+        elif kind == b"stsz":
+            _require(box_start, box_stop, 12, kind)
+            sample_size, count = struct.unpack_from(">II", buffer, box_start + 4)
+            track.sample_count = count
+            if sample_size:
+                track.sample_bytes = sample_size * count
+            else:
+                if box_start + 12 + 4 * count > box_stop:
+                    raise _Unsupported(kind)
+                sizes = struct.unpack_from(f">{count}I", buffer, box_start + 12)
+                track.sample_bytes = sum(sizes)
+        elif kind == b"stz2":
+            raise _Unsupported(kind)
+
+
+def _parse_sample_description(
+    buffer: bytes | mmap.mmap, start: int, stop: int, track: _Track
+) -> None:
+    # 只看第一个样本描述；视频描述里的宽高即 ffprobe 报告的编码尺寸
+    _require(start, stop, 8, b"stsd")
+    (count,) = struct.unpack_from(">I", buffer, start + 4)
+    if count == 0 or track.handler != b"vide":
+        return
+    for _, entry_start, entry_stop in _boxes(buffer, start + 8, stop):
+        if entry_stop - entry_start >= 28:
+            # 6 字节保留 + 2 数据引用 + 16 字节预留字段之后是宽、高
+            width, height = struct.unpack_from(">HH", buffer, entry_start + 24)
+            if width and height:
+                track.width, track.height = width, height
+        return
+
+
+def _time_fields(
+    buffer: bytes | mmap.mmap, start: int, stop: int, kind: bytes
+) -> tuple[int, int]:
+    # mvhd / mdhd：版本 1 的时间字段为 64 位
+    if _version(buffer, start, stop, kind) == 1:
+        _require(start, stop, 32, kind)
+        return struct.unpack_from(">IQ", buffer, start + 20)
+    _require(start, stop, 20, kind)
+    return struct.unpack_from(">II", buffer, start + 12)
+
+
+def _version(buffer: bytes | mmap.mmap, start: int, stop: int, kind: bytes) -> int:
+    _require(start, stop, 4, kind)
+    return buffer[start]
+
+
+def _require(start: int, stop: int, length: int, kind: bytes) -> None:
+    # 盒子内容比字段短说明文件被截断或已损坏；不能越过盒子去读后面的数据
+    if stop - start < length:
+        raise _Unsupported(kind)
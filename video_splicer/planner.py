@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import sqlite3
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Callable, Sequence
+
+from .history import HistorySample, ThroughputHistory, current_host
+from .models import Config
+
+
+# 历史样本少于此数时不做预估
+MIN_SAMPLES = 5
+# 批次进行中每隔这么久在日志里更新一次预计剩余时间
+ETA_LOG_INTERVAL_SEC = 30.0
+
+
+@dataclass(frozen=True)
+class ThroughputModel:
+    # 取各项的中位数，个别异常慢的任务（重试、限速）不会拉偏预估
+    samples: int
+    download_sec: float
+    encode_sec: float
+    cpu_sec: float
+    source_bytes: float
+    download_bytes_per_sec: float
+    encode_sec_per_media_sec: float
+    cpu_sec_per_media_sec: float
+    media_sec_per_byte: float
+
+    def task_estimate(self, size_bytes: int | None) -> tuple[float, float, float]:
+        # 返回单条任务的 (下载秒数, 编码秒数, CPU 秒数)；已知大小时按大小折算
+        if not size_bytes or self.download_bytes_per_sec <= 0 or self.media_sec_per_byte <= 0:
+            return self.download_sec, self.encode_sec, self.cpu_sec
+        media_sec = size_bytes * self.media_sec_per_byte
+        return (
+            size_bytes / self.download_bytes_per_sec,
+            media_sec * self.encode_sec_per_media_sec,
+            media_sec * self.cpu_sec_per_media_sec,
+        )
+
+
+@dataclass(frozen=True)
+class BatchEstimate:
+    rows: int
+    sized_rows: int
+    wall_sec: float
+    cpu_sec: float
+    samples: int
+
+    def describe(self) -> str:
+        text = (
+            f"预计耗时约 {format_duration(self.wall_sec)}，"
+            f"CPU 约 {format_duration(self.cpu_sec)}（{self.rows} 条"
+        )
+        if self.sized_rows:
+            text += f"，其中 {self.sized_rows} 条按实际大小估算"
+        return text + f"；依据本机最近 {self.samples} 条历史）"
+
+
+def build_model(samples: Sequence[HistorySample]) -> ThroughputModel | None:
+    if len(samples) < MIN_SAMPLES:
+        return None
+
+    def median(values: list[float]) -> float:
+        return statistics.median(values) if values else 0.0
+
+    with_media = [item for item in samples if item.media_duration_sec > 0]
+    return ThroughputModel(
+        samples=len(samples),
+        download_sec=median([item.download_sec for item in samples]),
+        encode_sec=median([item.encode_sec for item in samples]),
+        cpu_sec=median([item.cpu_sec for item in samples]),
+        source_bytes=median([item.source_bytes for item in samples]),
+        download_bytes_per_sec=median(
+            [item.source_bytes / item.download_sec for item in samples if item.download_sec > 0]
+        ),
+        encode_sec_per_media_sec=median(
+            [item.encode_sec / item.media_duration_sec for item in with_media]
+        ),
+        cpu_sec_per_media_sec=median(
+            [item.cpu_sec / item.media_duration_sec for item in with_media]
+        ),
+        media_sec_per_byte=median(
+            [
+                item.media_duration_sec / item.source_bytes
+                for item in with_media
+                if item.source_bytes
+            ]
+        ),
+    )
+
+
+def load_model(config: Config) -> ThroughputModel | None:
+    # 优先参考本机同一 x264 预设的历史，不够时放宽到本机全部历史
+    if config.history_path is None:
+        return None
+    history = ThroughputHistory(config.history_path)
+    host = current_host()
+    try:
+        model = build_model(history.recent(host, preset=config.x264_preset))
+        return model or build_model(history.recent(host))
+    except (sqlite3.Error, OSError):
+        return None
+
+
+def estimate_batch(
+    model: ThroughputModel, sizes: Sequence[int | None], config: Config
+) -> BatchEstimate:
+    # 历史耗时是在当时的并发下测得的，已经包含了争用；按当前并发度摊开即为墙钟时间
+    download_sec = encode_sec = cpu_sec = longest = 0.0
+    for size in sizes:
+        download, encode, cpu = model.task_estimate(size)
+        download_sec += download
+        encode_sec += encode
+        cpu_sec += cpu
+        longest = max(longest, download + encode)
+    wall_sec = max(_spread(download_sec, encode_sec, config), longest)
+    return BatchEstimate(
+        rows=len(sizes),
+        sized_rows=sum(1 for size in sizes if size),
+        wall_sec=wall_sec,
+        cpu_sec=cpu_sec,
+        samples=model.samples,
+    )
+
+
+def _spread(download_sec: float, encode_sec: float, config: Config) -> float:
+    if config.engine == "asyncio":
+        # 下载与编码分开限流，两条流水线并行，取较慢的一条
+        return max(download_sec / config.max_downloads, encode_sec / config.max_workers)
+    # 线程引擎中每个任务在同一个工作线程里先下载后编码
+    return (download_sec + encode_sec) / config.max_workers
+
+
+class EtaTracker:
+    # 预计剩余时间：开始时完全依据历史预估，随着任务完成逐步换成实测吞吐；
+    # 实测占比 = 已执行数 / (已执行数 + 并发数)，即历史预估约相当于一轮并发的实测
+    def __init__(
+        self,
+        model: ThroughputModel | None,
+        config: Config,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.workers = max(config.max_workers, 1)
+        self.task_sec = (
+            _spread(model.download_sec, model.encode_sec, config) if model is not None else None
+        )
+        self.total: int | None = None
+        self.completed = 0
+        # 实际执行过的任务数；预检拒绝等瞬间完成的行不参与实测吞吐
+        self.worked = 0
+        self._clock = clock
+        self.started_at = clock()
+        self._logged_at: float | None = None
+
+    def observe(self, total: int | None, worked: bool = True) -> None:
+        # total 为 None 表示输入仍在读取，总数未知
+        self.completed += 1
+        self.worked += int(worked)
+        if total is not None:
+            self.total = total
+
+    def remaining_sec(self) -> float | None:
+        if self.total is None:
+            return None
+        remaining = max(self.total - self.completed, 0)
+        if remaining == 0:
+            return 0.0
+        elapsed = self._clock() - self.started_at
+        prior = remaining * self.task_sec if self.task_sec is not None else None
+        if self.worked == 0:
+            return None if prior is None else max(prior - elapsed, 0.0)
+        observed = elapsed / self.worked * remaining
+        if prior is None:
+            return observed
+        weight = self.worked / (self.worked + self.workers)
+        return weight * observed + (1 - weight) * prior
+
+    def due(self) -> bool:
+        # 到了该在日志里更新一次的时候
+        if self.total is None or self.completed >= self.total:
+            return False
+        now = self._clock()
+        if self._logged_at is not None and now - self._logged_at < ETA_LOG_INTERVAL_SEC:
+            return False
+        self._logged_at = now
+        return True
+
+    def describe(self) -> str:
+        remaining = self.remaining_sec()
+        if remaining is None:
+            return ""
+        return f"预计剩余 {format_duration(remaining)}（已完成 {self.completed}/{self.total}）"
+
+
+def format_duration(seconds: float) -> str:
+    seconds = max(int(round(seconds)), 0)
+    if seconds < 60:
+        return f"{seconds} 秒"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} 分 {seconds} 秒"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} 小时 {minutes} 分"
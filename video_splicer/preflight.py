@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import aiohttp
+
+from .cancellation import BatchCancelled, CancelToken
+from .download_governor import DownloadGovernor
+from .downloader import HeadProbe, head_probe, head_probe_async
+from .models import InputRow
+
+
+@dataclass(frozen=True)
+class PreflightOutcome:
+    index: int
+    content_length: int | None
+    error: str = ""
+
+
+def run_preflight(
+    rows: list[InputRow],
+    max_bytes: int,
+    governor: DownloadGovernor,
+    concurrency: int,
+    cancel_token: CancelToken | None = None,
+) -> dict[int, PreflightOutcome]:
+    def probe(row: InputRow) -> PreflightOutcome:
+        # 取消后不再发请求，等待主机连接槽位时被取消也一样；与异步版一致，
+        # 取消时仍在进行的探测结果作废，这些行随后由调度器标记为已取消
+        unknown = PreflightOutcome(index=row.index, content_length=None)
+        if cancel_token is not None and cancel_token.cancelled:
+            return unknown
+        try:
+            with governor.host_slot(row.video_url, cancel_token=cancel_token):
+                head = head_probe(row.video_url)
+        except BatchCancelled:
+            return unknown
+        if cancel_token is not None and cancel_token.cancelled:
+            return unknown
+        return _outcome(row.index, head, max_bytes)
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        return {item.index: item for item in executor.map(probe, rows)}
+
+
+async def run_preflight_async(
+    session: aiohttp.ClientSession,
+    rows: list[InputRow],
+    max_bytes: int,
+    governor: DownloadGovernor,
+    concurrency: int,
+    cancel_token: CancelToken | None = None,
+) -> dict[int, PreflightOutcome]:
+    sem = asyncio.Semaphore(max(concurrency, 1))
+
+    async def probe(row: InputRow) -> PreflightOutcome:
+        # 与线程版一致：取消后不再发请求，这些行随后由调度器标记为已取消
+        unknown = PreflightOutcome(index=row.index, content_length=None)
+        try:
+            async with sem, governor.host_slot_async(row.video_url):
+                if cancel_token is not None and cancel_token.cancelled:
+                    return unknown
+                head = await head_probe_async(session, row.video_url)
+                return _outcome(row.index, head, max_bytes)
+        except asyncio.CancelledError:
+            if cancel_token is None or not cancel_token.cancelled:
+                raise
+            return unknown
+
+    probes = [asyncio.create_task(probe(row)) for row in rows]
+    # 取消信号来自其他线程，回到事件循环里中断进行中的 HEAD 请求
+    loop = asyncio.get_running_loop()
+    cancel_handle = None
+    if cancel_token is not None:
+        cancel_handle = cancel_token.add_callback(
+            lambda: loop.call_soon_threadsafe(_cancel_probes, probes)
+        )
+    try:
+        outcomes = await asyncio.gather(*probes)
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_callback(cancel_handle)
+    return {item.index: item for item in outcomes}
+
+
+def _cancel_probes(probes: list[asyncio.Task]) -> None:
+    for task in probes:
+        if not task.done():
+            task.cancel()
+
+
+def _outcome(index: int, probe: HeadProbe, max_bytes: int) -> PreflightOutcome:
+    if probe.unreachable:
+        return PreflightOutcome(index=index, content_length=None, error=probe.error)
+    if probe.content_length is not None and probe.content_length > max_bytes:
+        return PreflightOutcome(
+            index=index, content_length=probe.content_length, error="源视频超过大小限制"
+        )
+    return PreflightOutcome(index=index, content_length=probe.content_length)
+
+
+def order_rows(
+    rows: list[InputRow],
+    outcomes: dict[int, PreflightOutcome],
+    order: str,
+    max_bytes: int,
+) -> list[InputRow]:
+    # 大文件先跑能缩短整批耗时，小文件先跑能缩短平均完成时间；
+    # 大小未知的按上限估计，排序稳定，同样大小保持输入顺序
+    if order not in ("largest_first", "smallest_first"):
+        return list(rows)
+
+    def expected_bytes(row: InputRow) -> int:
+        outcome = outcomes.get(row.index)
+        if outcome is None or outcome.content_length is None:
+            return max_bytes
+        return outcome.content_length
+
+    return sorted(rows, key=expected_bytes, reverse=order == "largest_first")
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import csv
+import sys
+import threading
+from pathlib import Path
+from typing import IO, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from .models import ResourceUsage, TaskResult
+
+
+RESULT_CSV_HEADER = [
+    "pid",
+    "output_filename",
+    "status",
+    "error",
+    "duration_sec",
+    "encode_policy",
+    "output_duration_sec",
+    "cpu_user_sec",
+    "cpu_sys_sec",
+    "max_rss_mb",
+    "child_wall_sec",
+]
+INITIAL_CAPACITY = 64
+CHUNK_ROWS = 4096
+
+# 字符串列存对象引用；数值列存连续数组，每行只占几个数组槽位
+_COLUMNS: dict[str, type] = {
+    "index": np.int64,
+    "pid": object,
+    "output_filename": object,
+    "status": object,
+    "error": object,
+    "duration_sec": np.float64,
+    "output_path": object,
+    "encode_policy": object,
+    "output_duration_sec": np.float64,
+    "cpu_user_sec": np.float64,
+    "cpu_sys_sec": np.float64,
+    "max_rss_bytes": np.int64,
+    "child_wall_sec": np.float64,
+    "children": np.int64,
+}
+_CSV_COLUMNS = [
+    "pid",
+    "output_filename",
+    "status",
+    "error",
+    "duration_sec",
+    "encode_policy",
+    "output_duration_sec",
+    "cpu_user_sec",
+    "cpu_sys_sec",
+    "max_rss_bytes",
+    "child_wall_sec",
+]
+
+
+class ResultStore:
+    # 按列追加保存批次结果，不为每行保留一个 TaskResult；同一行重复写入时覆盖。
+    # 扩容时换用新数组，已经交出去的 DataFrame 视图仍指向旧数组，不受影响
+    def __init__(self, capacity: int = INITIAL_CAPACITY) -> None:
+        self._lock = threading.Lock()
+        self._size = 0
+        self._positions: dict[int, int] = {}
+        self._columns = {
+            name: np.empty(max(capacity, 1), dtype=dtype) for name, dtype in _COLUMNS.items()
+        }
+
+    @classmethod
+    def from_results(cls, results: Iterable[TaskResult]) -> ResultStore:
+        store = cls()
+        for result in results:
+            store.add(result)
+        return store
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, index: object) -> bool:
+        return index in self._positions
+
+    def add(self, result: TaskResult) -> None:
+        usage = result.usage
+        values = {
+            "index": result.index,
+            "pid": result.pid,
+            "output_filename": result.output_filename,
+            # 状态和编码策略大量重复，复用同一个字符串对象
+            "status": sys.intern(result.status),
+            "error": result.error,
+            "duration_sec": result.duration_sec,
+            "output_path": result.output_path,
+            "encode_policy": sys.intern(result.encode_policy),
+            "output_duration_sec": result.output_duration_sec,
+            "cpu_user_sec": usage.user_sec,
+            "cpu_sys_sec": usage.sys_sec,
+            "max_rss_bytes": usage.max_rss_bytes,
+            "child_wall_sec": usage.wall_sec,
+            "children": usage.children,
+        }
+        with self._lock:
+            position = self._positions.get(result.index)
+            if position is None:
+                position = self._size
+                if position == len(self._columns["index"]):
+                    self._grow()
+                self._positions[result.index] = position
+                self._size += 1
+            for name, value in values.items():
+                self._columns[name][position] = value
+
+    def get(self, index: int) -> TaskResult | None:
+        with self._lock:
+            position = self._positions.get(index)
+            return None if position is None else self._row(position)
+
+    def results(self) -> list[TaskResult]:
+        return list(self.iter_results())
+
+    def iter_results(self) -> Iterator[TaskResult]:
+        # 按输入顺序分块生成，调用方不必一次持有全部结果对象
+        order = self._sorted_positions()
+        for start in range(0, len(order), CHUNK_ROWS):
+            chunk = order[start : start + CHUNK_ROWS]
+            with self._lock:
+                columns = {name: self._columns[name][chunk].tolist() for name in _COLUMNS}
+            for offset in range(len(chunk)):
+                yield _to_result({name: values[offset] for name, values in columns.items()})
+
+    def iter_outputs(self) -> Iterator[tuple[str, Path]]:
+        # 成功行的 (输出文件名, 输出路径)，按输入顺序；打包时只需要这两列
+        order = self._sorted_positions()
+        with self._lock:
+            status = self._columns["status"][order]
+            has_path = np.not_equal(self._columns["output_path"][order], None)
+            selected = order[(status == "SUCCESS") & has_path]
+            names = self._columns["output_filename"][selected].tolist()
+            paths = self._columns["output_path"][selected].tolist()
+        return zip(names, paths)
+
+    def has_success(self) -> bool:
+        with self._lock:
+            return bool(np.any(self._columns["status"][: self._size] == "SUCCESS"))
+
+    def usage_total(self) -> ResourceUsage:
+        with self._lock:
+            size = self._size
+            columns = self._columns
+            return ResourceUsage(
+                user_sec=float(columns["cpu_user_sec"][:size].sum()),
+                sys_sec=float(columns["cpu_sys_sec"][:size].sum()),
+                max_rss_bytes=int(columns["max_rss_bytes"][:size].max(initial=0)),
+                wall_sec=float(columns["child_wall_sec"][:size].sum()),
+                children=int(columns["children"][:size].sum()),
+            )
+
+    def output_duration_sec(self) -> float:
+        with self._lock:
+            return float(self._columns["output_duration_sec"][: self._size].sum())
+
+    def frame(self, columns: list[str]) -> pd.DataFrame:
+        # 界面用的只读视图：直接引用列数组的前 n 行，不复制数据，行按完成顺序排列
+        with self._lock:
+            size = self._size
+            data = {
+                name: pd.Series(self._columns[name][:size], dtype=_COLUMNS[name], copy=False)
+                for name in columns
+            }
+        return pd.DataFrame(data, copy=False)
+
+    def write_csv(self, stream: IO[str]) -> None:
+        # 按块取出排好序的列再逐行写出，不在内存里拼出整份 CSV
+        writer = csv.writer(stream)
+        writer.writerow(RESULT_CSV_HEADER)
+        order = self._sorted_positions()
+        for start in range(0, len(order), CHUNK_ROWS):
+            chunk = order[start : start + CHUNK_ROWS]
+            with self._lock:
+                columns = {name: self._columns[name][chunk].tolist() for name in _CSV_COLUMNS}
+            writer.writerows(
+                zip(
+                    columns["pid"],
+                    columns["output_filename"],
+                    columns["status"],
+                    columns["error"],
+                    [f"{value:.3f}" for value in columns["duration_sec"]],
+                    columns["encode_policy"],
+                    [f"{value:.3f}" for value in columns["output_duration_sec"]],
+                    [f"{value:.3f}" for value in columns["cpu_user_sec"]],
+                    [f"{value:.3f}" for value in columns["cpu_sys_sec"]],
+                    [f"{value / 1024 / 1024:.1f}" for value in columns["max_rss_bytes"]],
+                    [f"{value:.3f}" for value in columns["child_wall_sec"]],
+                )
+            )
+
+    def write_parquet(self, path: Path) -> None:
+        # pyarrow 为可选依赖，仅在启用 SP_RESULT_PARQUET 时需要
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        order = self._sorted_positions()
+        with self._lock:
+            columns = self._columns
+            table = pa.table(
+                {
+                    "index": columns["index"][order],
+                    "pid": pa.array(columns["pid"][order], type=pa.string()),
+                    "output_filename": pa.array(
+                        columns["output_filename"][order], type=pa.string()
+                    ),
+                    "status": pa.array(
+                        columns["status"][order], type=pa.string()
+                    ).dictionary_encode(),
+                    "error": pa.array(columns["error"][order], type=pa.string()),
+                    "duration_sec": columns["duration_sec"][order],
+                    "encode_policy": pa.array(
+                        columns["encode_policy"][order], type=pa.string()
+                    ).dictionary_encode(),
+                    "output_duration_sec": columns["output_duration_sec"][order],
+                    "cpu_user_sec": columns["cpu_user_sec"][order],
+                    "cpu_sys_sec": columns["cpu_sys_sec"][order],
+                    "max_rss_bytes": columns["max_rss_bytes"][order],
+                    "child_wall_sec": columns["child_wall_sec"][order],
+                }
+            )
+        pq.write_table(table, path)
+
+    def _sorted_positions(self) -> np.ndarray:
+        with self._lock:
+            return np.argsort(self._columns["index"][: self._size], kind="stable")
+
+    def _grow(self) -> None:
+        capacity = len(self._columns["index"]) * 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[: len(column)] = column
+            self._columns[name] = grown
+
+    def _row(self, position: int) -> TaskResult:
+        return _to_result(
+            {
+                name: column[position : position + 1].tolist()[0]
+                for name, column in self._columns.items()
+            }
+        )
+
+
+def _to_result(values: dict[str, object]) -> TaskResult:
+    return TaskResult(
+        index=values["index"],
+        pid=values["pid"],
+        output_filename=values["output_filename"],
+        status=values["status"],
+        error=values["error"],
+        duration_sec=values["duration_sec"],
+        output_path=values["output_path"],
+        encode_policy=values["encode_policy"],
+        output_duration_sec=values["output_duration_sec"],
+        usage=ResourceUsage(
+            user_sec=values["cpu_user_sec"],
+            sys_sec=values["cpu_sys_sec"],
+            max_rss_bytes=values["max_rss_bytes"],
+            wall_sec=values["child_wall_sec"],
+            children=values["children"],
+        ),
+    )
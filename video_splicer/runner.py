@@ -1,122 +1,553 @@
 from __future__ import annotations
 
-import tempfile
+import shutil
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterable, Iterator, Sized, TypeVar
 
-from .downloader import DownloadError, download_video
-from .ffmpeg_pipeline import FFmpegError, concat_with_endcard
-from .input_parser import assign_output_filenames
-from .models import Config, InputRow, TaskResult
+from .cancellation import BatchCancelled, CancelToken, raise_if_cancelled
+from .child_process import UsageCollector, collect_usage
+from .download_governor import DownloadGovernor
+from .downloader import DownloadError, download_video, head_content_length
+from .endcard_pool import EndcardError, EndcardPool, load_endcard_registry
+from .execution_service import ExecutionSession
+from .ffmpeg_pipeline import EncodePolicy, EncodeSettings, FFmpegError, encode_settings
+from .history import HistoryRecorder, open_recorder
+from .input_parser import assign_output_filenames, iter_output_filenames
+from .metrics import QUEUE_DEPTH, TASKS, ensure_metrics_server, record_cache
+from .models import Config, InputRow, ResourceUsage, TaskResult, TaskStats
+from .planner import EtaTracker, estimate_batch, load_model
+from .preflight import PreflightOutcome, order_rows, run_preflight
+from .result_store import ResultStore
+from .segment_encoder import encode_with_endcard
+from .trace import BatchTrace, activate, record_span, span
+from .spool import (
+    DiskBudget,
+    DiskBudgetExceeded,
+    Reservation,
+    create_deliver_dir,
+    create_work_dir,
+    deliver_output,
+    estimate_task_bytes,
+    file_size,
+)
 
 
 LogCallback = Callable[[str], None]
 ProgressCallback = Callable[[int, int], None]
+ResultCallback = Callable[[TaskResult], None]
 
+J = TypeVar("J")
+T = TypeVar("T")
+
+# 输入边读边处理时，已提交未完成的任务数上限为并发数的这么多倍
+SUBMIT_WINDOW_FACTOR = 2
 
-def process_batch(
-    rows: list[InputRow],
-    config: Config,
-    log_cb: LogCallback | None = None,
-    progress_cb: ProgressCallback | None = None,
-) -> list[TaskResult]:
-    if not rows:
-        return []
 
-    filename_map = assign_output_filenames(rows)
-    work_dir = Path(tempfile.mkdtemp(prefix="video_splice_"))
+@dataclass
+class _BatchContext:
+    work_dir: Path
+    download_dir: Path
+    output_dir: Path
+    deliver_dir: Path | None
+    governor: DownloadGovernor
+    budget: DiskBudget
+    endcards: EndcardPool
+    encode: EncodeSettings
+    # 编码槽位：每个任务编码时占一个，长视频分段编码时再借用空闲的槽位；
+    # 在应用里运行时换成进程级共享服务的会话，与其它会话公平分配
+    encode_slots: threading.Semaphore | ExecutionSession
+    eta: EtaTracker
+    # 成功任务的统计写入本机历史库；关闭历史时为 None
+    history: HistoryRecorder | None = None
+    # 预检阶段拿到的 Content-Length，占用磁盘预算时不必再发一次 HEAD
+    expected_bytes: dict[int, int] = field(default_factory=dict)
+
+
+def _create_batch_context(
+    config: Config,
+    session: ExecutionSession | None = None,
+    eta: EtaTracker | None = None,
+) -> _BatchContext:
+    work_dir = create_work_dir(config)
     download_dir = work_dir / "downloads"
     output_dir = work_dir / "outputs"
     download_dir.mkdir(parents=True, exist_ok=True)
     output_dir.mkdir(parents=True, exist_ok=True)
+    return _BatchContext(
+        work_dir=work_dir,
+        download_dir=download_dir,
+        output_dir=output_dir,
+        deliver_dir=create_deliver_dir(config),
+        governor=DownloadGovernor(
+            per_host_limit=config.per_host_connections,
+            bandwidth_limit_kbps=config.bandwidth_limit_kbps,
+        ),
+        budget=DiskBudget(config.disk_budget_mb * 1024 * 1024),
+        endcards=EndcardPool(
+            default_path=config.endcard_path,
+            registry=load_endcard_registry(config),
+            piece_dir=work_dir / "endcards",
+        ),
+        encode=encode_settings(config),
+        encode_slots=session or threading.BoundedSemaphore(config.max_workers),
+        eta=eta or EtaTracker(load_model(config), config),
+        history=open_recorder(config),
+    )
+
+
+def _describe_batch_context(ctx: _BatchContext) -> str:
+    parts = [f"工作目录: {ctx.work_dir}"]
+    if ctx.budget.limit_bytes > 0:
+        parts.append(f"磁盘预算: {ctx.budget.limit_bytes // (1024 * 1024)} MB")
+    if ctx.deliver_dir is not None:
+        parts.append(f"交付目录: {ctx.deliver_dir}")
+    if ctx.endcards.registry:
+        parts.append(f"可选落版 {len(ctx.endcards.registry)} 个")
+    if isinstance(ctx.encode_slots, ExecutionSession):
+        parts.append(ctx.encode_slots.describe())
+    return "，".join(parts)
+
+
+def _finish_batch_context(ctx: _BatchContext, results: ResultStore) -> None:
+    if ctx.history is not None:
+        ctx.history.flush()
+    # 下载目录只存放中间文件，批次结束（包括取消）后一律清理
+    shutil.rmtree(ctx.download_dir, ignore_errors=True)
+    # 输出已全部交付到别处、或没有任何成功输出时，整个工作目录都不再需要
+    if ctx.deliver_dir is not None or not results.has_success():
+        shutil.rmtree(ctx.work_dir, ignore_errors=True)
+
+
+def _describe_batch_usage(results: ResultStore, prepare_usage: ResourceUsage) -> str:
+    # 每输出分钟的 CPU 秒数用于估算机器规格和 SP_MAX_WORKERS
+    total = prepare_usage.combine(results.usage_total())
+    output_min = results.output_duration_sec() / 60
+    text = (
+        f"子进程资源：{total.children} 个，CPU {total.cpu_sec:.1f} 秒"
+        f"（用户 {total.user_sec:.1f} / 系统 {total.sys_sec:.1f}），"
+        f"峰值内存 {total.max_rss_bytes / 1024 / 1024:.0f} MB"
+    )
+    if output_min > 0:
+        text += f"，输出 {output_min:.1f} 分钟，每输出分钟 CPU {total.cpu_sec / output_min:.1f} 秒"
+    return text
+
+
+def _log_plan(
+    ctx: _BatchContext, rows: list[InputRow], config: Config, log_cb: LogCallback | None
+) -> None:
+    # 批次开始前按本机历史估算整批耗时；历史不足时不估算
+    model = load_model(config)
+    if model is None or not rows:
+        return
+    sizes = [ctx.expected_bytes.get(row.index) for row in rows]
+    _log(log_cb, f"批次预估：{estimate_batch(model, sizes, config).describe()}")
+
+
+def _track_result(
+    ctx: _BatchContext, result: TaskResult, feed: _RowFeed, log_cb: LogCallback | None
+) -> None:
+    # 成功任务的统计写入历史；每隔一段时间在日志里更新预计剩余时间
+    if ctx.history is not None:
+        ctx.history.add(result)
+    ctx.eta.observe(feed.total if feed.complete else None, worked=result.duration_sec > 0)
+    if ctx.eta.due():
+        eta_text = ctx.eta.describe()
+        if eta_text:
+            _log(log_cb, eta_text)
+
+
+def _describe_history(ctx: _BatchContext) -> str:
+    if ctx.history is None:
+        return ""
+    if ctx.history.error:
+        return f"任务统计未能写入历史库: {ctx.history.error}"
+    return f"已记录 {ctx.history.recorded} 条任务统计到 {ctx.history.history.path}"
+
+
+def process_batch(
+    rows: Iterable[InputRow],
+    config: Config,
+    log_cb: LogCallback | None = None,
+    progress_cb: ProgressCallback | None = None,
+    result_cb: ResultCallback | None = None,
+    cancel_token: CancelToken | None = None,
+    tracer: BatchTrace | None = None,
+    session: ExecutionSession | None = None,
+    eta: EtaTracker | None = None,
+    store: ResultStore | None = None,
+) -> ResultStore:
+    # 结果写入调用方传入的存储（未传入时新建一个）并原样返回，需要对象时再按需生成
+    results = store if store is not None else ResultStore()
+    if isinstance(rows, list) and not rows:
+        return results
+
+    with activate(tracer, lane="batch"):
+        _run_batch(
+            rows,
+            config,
+            log_cb,
+            progress_cb,
+            result_cb,
+            cancel_token,
+            tracer,
+            session,
+            eta,
+            results,
+        )
+    return results
+
+
+def _run_batch(
+    rows: Iterable[InputRow],
+    config: Config,
+    log_cb: LogCallback | None,
+    progress_cb: ProgressCallback | None,
+    result_cb: ResultCallback | None,
+    cancel_token: CancelToken | None,
+    tracer: BatchTrace | None,
+    session: ExecutionSession | None,
+    eta: EtaTracker | None,
+    results: ResultStore,
+) -> None:
+    ensure_metrics_server(config)
+    if _preflight_enabled(config):
+        # 预检和按大小排序需要完整的行列表，先读完全部输入
+        rows = list(rows)
+    feed = _RowFeed(rows)
+    ctx = _create_batch_context(config, session, eta)
+    # 出错时也要清理工作目录、写入历史，中间文件不能留在 spool 上
+    try:
+        _log(log_cb, f"批次开始，{feed.describe()}，{_describe_batch_context(ctx)}")
+        prepare_usage = UsageCollector()
+        prepared_endcards: set[str] = set()
+
+        completed_count = 0
+
+        jobs: Iterable[tuple[InputRow, str]] = iter_output_filenames(feed)
+        if _preflight_enabled(config):
+            filename_map = assign_output_filenames(rows)
+            with span("preflight", "batch", rows=len(rows)):
+                outcomes = run_preflight(
+                    rows,
+                    max_bytes=config.max_video_mb * 1024 * 1024,
+                    governor=ctx.governor,
+                    concurrency=config.max_downloads,
+                    cancel_token=cancel_token,
+                )
+            queued_rows, rejected = _apply_preflight(
+                rows, outcomes, filename_map, config, ctx, log_cb
+            )
+            for result in rejected:
+                results.add(result)
+                completed_count += 1
+                _track_result(ctx, result, feed, log_cb)
+                _report_result(result, completed_count, feed.total, log_cb, progress_cb, result_cb)
+            jobs = [(row, filename_map[row.index]) for row in queued_rows]
+            _log_plan(ctx, queued_rows, config, log_cb)
+        elif isinstance(rows, list):
+            _log_plan(ctx, rows, config, log_cb)
+
+        with ThreadPoolExecutor(
+            max_workers=config.max_workers, thread_name_prefix="sp-worker"
+        ) as executor:
+
+            def submit(job: tuple[InputRow, str]) -> Future[TaskResult]:
+                row, output_filename = job
+                if session is not None:
+                    session.expect(1)
+                if cancel_token is not None and cancel_token.cancelled:
+                    # 取消之后才读到的行不再提交给线程池，直接标记为已取消
+                    cancelled: Future[TaskResult] = Future()
+                    cancelled.set_result(
+                        TaskResult(
+                            index=row.index,
+                            pid=row.pid_raw,
+                            output_filename=output_filename,
+                            status="CANCELLED",
+                            error="已取消",
+                            duration_sec=0.0,
+                            output_path=ctx.output_dir / output_filename,
+                        )
+                    )
+                    return cancelled
+                if row.endcard not in prepared_endcards:
+                    # 每个落版在第一次用到时探测一次，之后的任务共用结果
+                    prepared_endcards.add(row.endcard)
+                    with span("endcard_prepare", "batch"), collect_usage(prepare_usage):
+                        ctx.endcards.prepare([row.endcard], cancel_token=cancel_token)
+                QUEUE_DEPTH.inc()
+                return executor.submit(
+                    _process_queued,
+                    row=row,
+                    output_filename=output_filename,
+                    config=config,
+                    ctx=ctx,
+                    cancel_token=cancel_token,
+                    tracer=tracer,
+                    queued_at=time.perf_counter(),
+                )
+
+            window = None if feed.sized else config.max_workers * SUBMIT_WINDOW_FACTOR
+            for (row, output_filename), future in _submit_windowed(jobs, submit, window):
+                try:
+                    result = future.result()
+                except Exception as exc:  # noqa: BLE001
+                    result = TaskResult(
+                        index=row.index,
+                        pid=row.pid_raw,
+                        output_filename=output_filename,
+                        status="FAILED",
+                        error=f"内部错误: {exc}",
+                        duration_sec=0.0,
+                        output_path=ctx.output_dir / output_filename,
+                    )
+
+                if session is not None:
+                    session.task_done()
+                results.add(result)
+                completed_count += 1
+                _track_result(ctx, result, feed, log_cb)
+                _report_result(result, completed_count, feed.total, log_cb, progress_cb, result_cb)
+    finally:
+        _finish_batch_context(ctx, results)
+    _log(log_cb, _describe_batch_usage(results, prepare_usage.total))
+    if ctx.history is not None:
+        _log(log_cb, _describe_history(ctx))
+    if cancel_token is not None and cancel_token.cancelled:
+        _log(log_cb, "批次已取消")
+    else:
+        _log(log_cb, "批次处理完成")
+
+
+class _RowFeed:
+    # 按输入顺序逐条取行；输入是生成器时边解析边处理，读完之前总数未知
+    def __init__(self, rows: Iterable[InputRow]) -> None:
+        self.sized = isinstance(rows, Sized)
+        self._known_total = len(rows) if isinstance(rows, Sized) else 0
+        self._rows = iter(rows)
+        self.pulled = 0
+        self.exhausted = False
+
+    @property
+    def total(self) -> int:
+        return self._known_total if self.sized else self.pulled
+
+    @property
+    def complete(self) -> bool:
+        # 总数已经确定：输入本身有长度，或者已经读完
+        return self.sized or self.exhausted
+
+    def describe(self) -> str:
+        return f"共 {self._known_total} 条" if self.sized else "边读取输入边处理"
+
+    def __iter__(self) -> Iterator[InputRow]:
+        return self
+
+    def __next__(self) -> InputRow:
+        try:
+            row = next(self._rows)
+        except StopIteration:
+            self.exhausted = True
+            raise
+        self.pulled += 1
+        return row
+
+
+def _submit_windowed(
+    jobs: Iterable[J],
+    submit: Callable[[J], Future[T]],
+    limit: int | None,
+) -> Iterator[tuple[J, Future[T]]]:
+    # 最多保持 limit 个已提交未完成的任务，读取输入与处理同步推进，
+    # 内存占用不随输入规模增长；limit 为 None 时一次性全部提交
+    pending: dict[Future[T], J] = {}
+    source = iter(jobs)
+    exhausted = False
+    while True:
+        while not exhausted and (limit is None or len(pending) < limit):
+            job = next(source, None)
+            if job is None:
+                exhausted = True
+            else:
+                pending[submit(job)] = job
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
 
-    _log(log_cb, f"批次开始，共 {len(rows)} 条，工作目录: {work_dir}")
-
-    results_by_index: dict[int, TaskResult] = {}
-    completed_count = 0
-
-    with ThreadPoolExecutor(max_workers=config.max_workers) as executor:
-        futures = {
-            executor.submit(
-                _process_single,
-                row=row,
-                output_filename=filename_map[row.index],
-                config=config,
-                download_dir=download_dir,
-                output_dir=output_dir,
-            ): row
-            for row in rows
-        }
-
-        for future in as_completed(futures):
-            row = futures[future]
-            try:
-                result = future.result()
-            except Exception as exc:  # noqa: BLE001
-                output_filename = filename_map[row.index]
-                result = TaskResult(
+
+def _preflight_enabled(config: Config) -> bool:
+    # 按大小排序依赖预检拿到的 Content-Length
+    return config.preflight or config.task_order != "input"
+
+
+def _apply_preflight(
+    rows: list[InputRow],
+    outcomes: dict[int, PreflightOutcome],
+    filename_map: dict[int, str],
+    config: Config,
+    ctx: _BatchContext,
+    log_cb: LogCallback | None,
+) -> tuple[list[InputRow], list[TaskResult]]:
+    rejected: list[TaskResult] = []
+    passed: list[InputRow] = []
+    for row in rows:
+        outcome = outcomes.get(row.index)
+        if outcome is not None and outcome.error:
+            rejected.append(
+                TaskResult(
                     index=row.index,
                     pid=row.pid_raw,
-                    output_filename=output_filename,
+                    output_filename=filename_map[row.index],
                     status="FAILED",
-                    error=f"内部错误: {exc}",
+                    error=outcome.error,
                     duration_sec=0.0,
-                    output_path=output_dir / output_filename,
+                    output_path=None,
                 )
+            )
+            continue
+        passed.append(row)
+        if outcome is not None and outcome.content_length is not None:
+            ctx.expected_bytes[row.index] = outcome.content_length
 
-            results_by_index[result.index] = result
-            completed_count += 1
+    known = sum(1 for row in passed if row.index in ctx.expected_bytes)
+    _log(
+        log_cb,
+        f"预检完成：{len(rejected)} 条不可用，{known}/{len(passed)} 条已知大小，"
+        f"执行顺序: {config.task_order}",
+    )
+    max_bytes = config.max_video_mb * 1024 * 1024
+    return order_rows(passed, outcomes, config.task_order, max_bytes), rejected
 
-            if result.status == "SUCCESS":
-                _log(
-                    log_cb,
-                    f"[{completed_count}/{len(rows)}] pid={result.pid} 成功 -> {result.output_filename}",
-                )
-            else:
-                _log(
-                    log_cb,
-                    f"[{completed_count}/{len(rows)}] pid={result.pid} 失败 -> {result.error}",
-                )
 
-            if progress_cb:
-                progress_cb(completed_count, len(rows))
+def _report_result(
+    result: TaskResult,
+    completed_count: int,
+    total: int,
+    log_cb: LogCallback | None,
+    progress_cb: ProgressCallback | None,
+    result_cb: ResultCallback | None,
+) -> None:
+    TASKS.inc(status=result.status)
+    if result.status == "SUCCESS":
+        _log(
+            log_cb,
+            f"[{completed_count}/{total}] pid={result.pid} 成功 -> {result.output_filename}",
+        )
+    elif result.status == "CANCELLED":
+        _log(log_cb, f"[{completed_count}/{total}] pid={result.pid} 已取消")
+    else:
+        _log(log_cb, f"[{completed_count}/{total}] pid={result.pid} 失败 -> {result.error}")
+
+    if result_cb:
+        result_cb(result)
+    if progress_cb:
+        progress_cb(completed_count, total)
+
 
-    ordered_results = sorted(results_by_index.values(), key=lambda item: item.index)
-    _log(log_cb, "批次处理完成")
-    return ordered_results
+def _process_queued(
+    row: InputRow,
+    output_filename: str,
+    config: Config,
+    ctx: _BatchContext,
+    cancel_token: CancelToken | None = None,
+    tracer: BatchTrace | None = None,
+    queued_at: float | None = None,
+) -> TaskResult:
+    # 线程池取到任务即离开队列
+    QUEUE_DEPTH.dec()
+    with activate(tracer):
+        if queued_at is not None:
+            record_span("queue_wait", "queue", queued_at, index=row.index)
+        with span("task", "task", index=row.index, pid=row.pid_raw) as task_args:
+            with collect_usage() as usage:
+                result = _process_single(row, output_filename, config, ctx, cancel_token)
+            result.usage = usage.total
+            task_args["status"] = result.status
+            task_args["cpu_sec"] = round(result.usage.cpu_sec, 3)
+        return result
 
 
 def _process_single(
     row: InputRow,
     output_filename: str,
     config: Config,
-    download_dir: Path,
-    output_dir: Path,
+    ctx: _BatchContext,
+    cancel_token: CancelToken | None = None,
 ) -> TaskResult:
+    output_path = ctx.output_dir / output_filename
+    download_path = ctx.download_dir / f"{row.index}.mp4"
+    max_bytes = config.max_video_mb * 1024 * 1024
+    reservation: Reservation | None = None
+    succeeded = False
+    delivered = False
     started_at = time.monotonic()
-    output_path = output_dir / output_filename
-    download_path = download_dir / f"{row.index}.mp4"
 
     try:
+        # 取消后仍在队列里的任务直接标记为已取消，不再发起任何请求
+        raise_if_cancelled(cancel_token)
+        endcard = ctx.endcards.get(row.endcard)
+        if ctx.budget.limit_bytes > 0:
+            # 先按 Content-Length（未知时按大小上限）占用磁盘预算，放不下就排队等待
+            record_cache("preflight_size", row.index in ctx.expected_bytes)
+            expected_bytes = (
+                ctx.expected_bytes.get(row.index)
+                or head_content_length(row.video_url)
+                or max_bytes
+            )
+            reservation = ctx.budget.reserve(
+                estimate_task_bytes(min(expected_bytes, max_bytes), endcard.size_bytes),
+                cancel_token=cancel_token,
+            )
+            started_at = time.monotonic()
+
         _assert_remaining(started_at, config.task_timeout_sec)
+        download_started = time.monotonic()
         download_video(
             video_url=row.video_url,
             destination=download_path,
-            max_bytes=config.max_video_mb * 1024 * 1024,
+            max_bytes=max_bytes,
             retries=config.download_retries,
             total_timeout_sec=_remaining_seconds(started_at, config.task_timeout_sec),
+            governor=ctx.governor,
+            cancel_token=cancel_token,
         )
+        download_sec = time.monotonic() - download_started
+        source_bytes = file_size(download_path)
+        if reservation is not None:
+            reservation.resize(estimate_task_bytes(source_bytes, endcard.size_bytes))
 
-        _assert_remaining(started_at, config.task_timeout_sec)
-        concat_with_endcard(
-            source_video=download_path,
-            endcard_video=config.endcard_path,
-            output_video=output_path,
-            timeout_sec=_remaining_seconds(started_at, config.task_timeout_sec),
-        )
+        # 编码槽位跨会话共享，排队等待槽位的时间不计入任务超时：
+        # 剩余时间按下载用时扣除，拿到槽位之后才开始消耗
+        encode_budget_sec = _remaining_seconds(started_at, config.task_timeout_sec)
+        if encode_budget_sec <= 0:
+            raise TimeoutError("任务超时")
+        with ctx.encode_slots:
+            encode_started = time.monotonic()
+            policy = encode_with_endcard(
+                source_video=download_path,
+                endcard_video=endcard.path,
+                output_video=output_path,
+                timeout_sec=encode_budget_sec,
+                cancel_token=cancel_token,
+                settings=ctx.encode,
+                encode_slots=ctx.encode_slots,
+                endcard_probe=endcard.probe,
+                endcard_cache=ctx.endcards.piece,
+            )
+            encode_sec = time.monotonic() - encode_started
+        download_path.unlink(missing_ok=True)
 
+        if ctx.deliver_dir is not None:
+            output_path = deliver_output(output_path, ctx.deliver_dir)
+            delivered = True
+
+        succeeded = True
         return TaskResult(
             index=row.index,
             pid=row.pid_raw,
@@ -125,6 +556,19 @@ def _process_single(
             error="",
             duration_sec=time.monotonic() - started_at,
             output_path=output_path,
+            encode_policy=policy.describe(),
+            output_duration_sec=policy.output_duration_sec,
+            stats=_task_stats(policy, source_bytes, download_sec, encode_sec),
+        )
+    except BatchCancelled:
+        return TaskResult(
+            index=row.index,
+            pid=row.pid_raw,
+            output_filename=output_filename,
+            status="CANCELLED",
+            error="已取消",
+            duration_sec=time.monotonic() - started_at,
+            output_path=output_path,
         )
     except TimeoutError:
         return TaskResult(
@@ -136,7 +580,7 @@ def _process_single(
             duration_sec=time.monotonic() - started_at,
             output_path=output_path,
         )
-    except (DownloadError, FFmpegError) as exc:
+    except (DownloadError, FFmpegError, DiskBudgetExceeded, EndcardError) as exc:
         return TaskResult(
             index=row.index,
             pid=row.pid_raw,
@@ -159,6 +603,31 @@ def _process_single(
     finally:
         if download_path.exists():
             download_path.unlink(missing_ok=True)
+        if not succeeded:
+            output_path.unlink(missing_ok=True)
+        if reservation is not None:
+            _settle_reservation(reservation, output_path, kept_on_spool=succeeded and not delivered)
+
+
+def _task_stats(
+    policy: EncodePolicy, source_bytes: int, download_sec: float, encode_sec: float
+) -> TaskStats:
+    return TaskStats(
+        source_bytes=source_bytes,
+        media_duration_sec=policy.source_duration_sec,
+        width=policy.output_width,
+        height=policy.output_height,
+        download_sec=download_sec,
+        encode_sec=encode_sec,
+    )
+
+
+def _settle_reservation(reservation: Reservation, output_path: Path, kept_on_spool: bool) -> None:
+    # 成功但仍留在缓存目录的输出按真实大小继续占用预算，其余情况立即归还
+    if kept_on_spool:
+        reservation.settle(file_size(output_path))
+    else:
+        reservation.release()
 
 
 def _remaining_seconds(started_at: float, total_timeout_sec: int) -> float:
@@ -0,0 +1,456 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable
+
+from .cancellation import BatchCancelled, CancelToken
+from .child_process import run_child
+from .execution_service import AsyncSessionSlots, ExecutionSession
+from .ffmpeg_pipeline import (
+    EncodePolicy,
+    EncodeSettings,
+    FFmpegError,
+    VideoProbe,
+    _audio_graph,
+    _endcard_video_filter,
+    _ffmpeg_error_message,
+    _preset_args,
+    _source_video_filter,
+    _video_rate_args,
+    concat_with_endcard,
+    concat_with_endcard_async,
+    movflags_args,
+    output_size,
+    probe_video,
+    probe_video_async,
+    select_encode_policy,
+    verify_output,
+)
+from .metrics import ENCODE_SECONDS, observe_duration
+from .trace import propagate, span
+
+
+# 每段至少这么长，分得太碎时进程启动和关键帧开销会抵消并行收益
+MIN_SEGMENT_SEC = 10.0
+# 所有分段统一时间基，concat demuxer 直接拷贝拼接时时间戳不会错位
+PIECE_TIMESCALE = "90000"
+
+# (缓存键, 构建函数) -> 片段路径；由批次级的落版池提供，跨任务复用编码好的落版片段
+EndcardCache = Callable[[str, Callable[[Path], None]], Path]
+
+
+def plan_segment_workers(source_probe: VideoProbe, settings: EncodeSettings) -> int:
+    if settings.segment_threshold_sec <= 0:
+        return 1
+    if source_probe.duration_sec < settings.segment_threshold_sec:
+        return 1
+    return max(1, int(source_probe.duration_sec // MIN_SEGMENT_SEC))
+
+
+def encode_with_endcard(
+    source_video: Path,
+    endcard_video: Path,
+    output_video: Path,
+    timeout_sec: float,
+    cancel_token: CancelToken | None = None,
+    settings: EncodeSettings | None = None,
+    encode_slots: threading.Semaphore | ExecutionSession | None = None,
+    endcard_probe: VideoProbe | None = None,
+    endcard_cache: EndcardCache | None = None,
+) -> EncodePolicy:
+    # 调用方已持有一个编码槽位；长视频再借用空闲槽位分段并行编码，借不到就单进程编码
+    settings = settings or EncodeSettings()
+    if settings.segment_threshold_sec <= 0 or encode_slots is None:
+        return concat_with_endcard(
+            source_video,
+            endcard_video,
+            output_video,
+            timeout_sec,
+            cancel_token,
+            settings,
+            endcard_probe=endcard_probe,
+        )
+
+    started_at = time.monotonic()
+    source_probe = probe_video(source_video, cancel_token=cancel_token)
+    extras = 0
+    while extras < plan_segment_workers(source_probe, settings) - 1:
+        if not encode_slots.acquire(blocking=False):
+            break
+        extras += 1
+    try:
+        remaining = timeout_sec - (time.monotonic() - started_at)
+        if extras == 0:
+            return concat_with_endcard(
+                source_video,
+                endcard_video,
+                output_video,
+                remaining,
+                cancel_token,
+                settings,
+                source_probe=source_probe,
+                endcard_probe=endcard_probe,
+            )
+        return concat_segmented(
+            source_video=source_video,
+            endcard_video=endcard_video,
+            output_video=output_video,
+            source_probe=source_probe,
+            endcard_probe=endcard_probe or probe_video(endcard_video, cancel_token=cancel_token),
+            settings=settings,
+            workers=extras + 1,
+            timeout_sec=remaining,
+            cancel_token=cancel_token,
+            endcard_cache=endcard_cache,
+        )
+    finally:
+        for _ in range(extras):
+            encode_slots.release()
+
+
+async def encode_with_endcard_async(
+    source_video: Path,
+    endcard_video: Path,
+    output_video: Path,
+    timeout_sec: float,
+    settings: EncodeSettings | None = None,
+    encode_slots: asyncio.Semaphore | AsyncSessionSlots | None = None,
+    endcard_probe: VideoProbe | None = None,
+    endcard_cache: EndcardCache | None = None,
+) -> EncodePolicy:
+    settings = settings or EncodeSettings()
+    if settings.segment_threshold_sec <= 0 or encode_slots is None:
+        return await concat_with_endcard_async(
+            source_video,
+            endcard_video,
+            output_video,
+            timeout_sec,
+            settings,
+            endcard_probe=endcard_probe,
+        )
+
+    started_at = time.monotonic()
+    source_probe = await probe_video_async(source_video)
+    extras = 0
+    while extras < plan_segment_workers(source_probe, settings) - 1:
+        if not await _try_borrow(encode_slots):
+            break
+        extras += 1
+    try:
+        remaining = timeout_sec - (time.monotonic() - started_at)
+        if extras == 0:
+            return await concat_with_endcard_async(
+                source_video,
+                endcard_video,
+                output_video,
+                remaining,
+                settings,
+                source_probe=source_probe,
+                endcard_probe=endcard_probe,
+            )
+        endcard_probe = endcard_probe or await probe_video_async(endcard_video)
+        # 分段编码在线程里跑；任务被取消时通过取消信号终止全部 ffmpeg 子进程
+        token = CancelToken()
+        try:
+            return await asyncio.to_thread(
+                concat_segmented,
+                source_video=source_video,
+                endcard_video=endcard_video,
+                output_video=output_video,
+                source_probe=source_probe,
+                endcard_probe=endcard_probe,
+                settings=settings,
+                workers=extras + 1,
+                timeout_sec=remaining,
+                cancel_token=token,
+                endcard_cache=endcard_cache,
+            )
+        except asyncio.CancelledError:
+            token.cancel()
+            raise
+    finally:
+        for _ in range(extras):
+            encode_slots.release()
+
+
+async def _try_borrow(encode_slots: asyncio.Semaphore | AsyncSessionSlots) -> bool:
+    # 借用槽位不能等待：已持有一个槽位再阻塞等待，多个任务同时这样做会耗尽共享槽位而死锁
+    if isinstance(encode_slots, AsyncSessionSlots):
+        return encode_slots.try_acquire()
+    if encode_slots.locked():
+        return False
+    # asyncio.Semaphore 未锁定时 acquire 立即返回，检查与获取之间不会让出事件循环
+    return await encode_slots.acquire()
+
+
+def concat_segmented(
+    source_video: Path,
+    endcard_video: Path,
+    output_video: Path,
+    source_probe: VideoProbe,
+    endcard_probe: VideoProbe,
+    settings: EncodeSettings,
+    workers: int,
+    timeout_sec: float,
+    cancel_token: CancelToken | None = None,
+    endcard_cache: EndcardCache | None = None,
+) -> EncodePolicy:
+    # 源视频按关键帧无损切段，各段与落版用同一编码参数并行编码（仅视频），
+    # 音频整条单独编码，最后用 concat demuxer 直接拷贝拼接，不再二次编码
+    if timeout_sec <= 0:
+        raise TimeoutError("任务超时")
+    deadline = time.monotonic() + timeout_sec
+    width, height = output_size(source_probe.width, source_probe.height, settings)
+    policy = select_encode_policy(source_probe, settings, width, height)
+
+    piece_dir = Path(tempfile.mkdtemp(prefix=f".{output_video.stem}-seg-", dir=output_video.parent))
+    # 任一分段失败时只终止本任务的其它分段，不影响整个批次
+    local_token = CancelToken()
+    parent_handle = cancel_token.add_callback(local_token.cancel) if cancel_token else None
+    try:
+        with observe_duration(ENCODE_SECONDS, mode="segmented"):
+            segment_sec = max(source_probe.duration_sec / workers, MIN_SEGMENT_SEC)
+            _run_step(_split_command(source_video, piece_dir, segment_sec), deadline, local_token)
+            pieces = sorted(piece_dir.glob("src_*.mp4"))
+            if not pieces:
+                raise FFmpegError("源视频分段失败")
+
+            encoded = [piece.with_name(f"enc_{piece.name}") for piece in pieces]
+            audio_path = piece_dir / "audio.m4a"
+            source_filter = _source_video_filter(source_probe, width, height)
+            endcard_filter = _endcard_video_filter(width, height)
+            if source_probe.frame_rate > 0:
+                endcard_filter += f",fps={source_probe.frame_rate:.6f}"
+
+            def encode_endcard(target: Path) -> None:
+                _run_step(
+                    _encode_piece_command(endcard_video, target, endcard_filter, policy),
+                    deadline,
+                    local_token,
+                )
+
+            def build_endcard_piece() -> Path:
+                if endcard_cache is None:
+                    target = piece_dir / "endcard.mp4"
+                    encode_endcard(target)
+                    return target
+                key = _piece_key(endcard_video, endcard_filter, policy)
+                return endcard_cache(key, encode_endcard)
+
+            tasks: list[Callable[[], object]] = [
+                _step(
+                    _encode_piece_command(piece, target, source_filter, policy),
+                    deadline,
+                    local_token,
+                )
+                for piece, target in zip(pieces, encoded)
+            ]
+            tasks.append(
+                _step(
+                    _audio_command(
+                        source_video, endcard_video, audio_path, source_probe, endcard_probe, policy
+                    ),
+                    deadline,
+                    local_token,
+                )
+            )
+            tasks.append(build_endcard_piece)
+            endcard_piece = _run_parallel(tasks, workers, local_token)[-1]
+
+            concat_list = piece_dir / "concat.txt"
+            concat_list.write_text(
+                "".join(f"file '{_quote(path)}'\n" for path in [*encoded, endcard_piece]),
+                encoding="utf-8",
+            )
+            _run_step(
+                _join_command(concat_list, audio_path, output_video, policy.packaging),
+                deadline,
+                local_token,
+            )
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_callback(parent_handle)
+        shutil.rmtree(piece_dir, ignore_errors=True)
+    policy = replace(
+        policy,
+        segments=len(pieces),
+        output_duration_sec=source_probe.duration_sec + endcard_probe.duration_sec,
+    )
+    if policy.packaging == "fragmented":
+        verify_output(output_video, policy, cancel_token=cancel_token)
+    return policy
+
+
+def _run_parallel(
+    tasks: list[Callable[[], object]], workers: int, token: CancelToken
+) -> list[object]:
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sp-segment") as executor:
+        futures = [executor.submit(propagate(task)) for task in tasks]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        errors = [future.exception() for future in done if future.exception() is not None]
+        if errors:
+            token.cancel()
+            # 优先报告真正的失败原因，而不是被连带取消的分段
+            raise next((exc for exc in errors if not isinstance(exc, BatchCancelled)), errors[0])
+        return [future.result() for future in futures]
+
+
+def _step(cmd: list[str], deadline: float, token: CancelToken) -> Callable[[], None]:
+    return lambda: _run_step(cmd, deadline, token)
+
+
+def _piece_key(endcard_video: Path, video_filter: str, policy: EncodePolicy) -> str:
+    # 同一落版、同样的缩放和编码参数才能复用同一个片段
+    raw = "|".join(
+        [
+            str(endcard_video.resolve()),
+            video_filter,
+            *_preset_args(policy),
+            *_video_rate_args(policy),
+        ]
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _run_step(cmd: list[str], deadline: float, token: CancelToken) -> None:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("ffmpeg 处理超时")
+    with span("ffmpeg", "encode", mode="segmented", output=Path(cmd[-1]).name):
+        try:
+            completed = run_child(cmd, timeout_sec=remaining, cancel_token=token)
+        except subprocess.TimeoutExpired as exc:
+            raise TimeoutError("ffmpeg 处理超时") from exc
+        if completed.returncode != 0:
+            raise FFmpegError(_ffmpeg_error_message(completed.stderr))
+
+
+def _split_command(source_video: Path, piece_dir: Path, segment_sec: float) -> list[str]:
+    return [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        str(source_video),
+        "-map",
+        "0:v:0",
+        "-c",
+        "copy",
+        "-f",
+        "segment",
+        "-segment_time",
+        f"{segment_sec:.3f}",
+        "-reset_timestamps",
+        "1",
+        str(piece_dir / "src_%04d.mp4"),
+    ]
+
+
+def _encode_piece_command(
+    source: Path, target: Path, video_filter: str, policy: EncodePolicy
+) -> list[str]:
+    return [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        str(source),
+        "-map",
+        "0:v:0",
+        "-vf",
+        video_filter,
+        "-c:v",
+        "libx264",
+        *_preset_args(policy),
+        *_video_rate_args(policy),
+        "-pix_fmt",
+        "yuv420p",
+        "-an",
+        "-video_track_timescale",
+        PIECE_TIMESCALE,
+        str(target),
+    ]
+
+
+def _audio_command(
+    source_video: Path,
+    endcard_video: Path,
+    target: Path,
+    source_probe: VideoProbe,
+    endcard_probe: VideoProbe,
+    policy: EncodePolicy,
+) -> list[str]:
+    extra_inputs, filter_parts = _audio_graph(source_probe, endcard_probe)
+    # 两段音频都补齐/截断到各自视频时长，拼接点与视频分段对齐
+    for label, duration in (("a0", source_probe.duration_sec), ("a1", endcard_probe.duration_sec)):
+        if duration > 0:
+            filter_parts.append(f"[{label}]apad,atrim=0:{duration:.3f}[{label}p]")
+        else:
+            filter_parts.append(f"[{label}]anull[{label}p]")
+    filter_parts.append("[a0p][a1p]concat=n=2:v=0:a=1[a]")
+    return [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        str(source_video),
+        "-i",
+        str(endcard_video),
+        *extra_inputs,
+        "-filter_complex",
+        ";".join(filter_parts),
+        "-map",
+        "[a]",
+        "-c:a",
+        "aac",
+        "-b:a",
+        str(policy.audio_bitrate),
+        str(target),
+    ]
+
+
+def _join_command(
+    concat_list: Path, audio_path: Path, output_video: Path, packaging: str = "faststart"
+) -> list[str]:
+    return [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        str(concat_list),
+        "-i",
+        str(audio_path),
+        "-map",
+        "0:v",
+        "-map",
+        "1:a",
+        "-c",
+        "copy",
+        *movflags_args(packaging),
+        str(output_video),
+    ]
+
+
+def _quote(path: Path) -> str:
+    return str(path.resolve()).replace("'", "'\\''")
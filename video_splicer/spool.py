@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from .cancellation import CancelToken, raise_if_cancelled
+from .models import Config
+
+
+# 预估输出体积 ≈ 源视频 × 系数 + 落版体积；实际编码完成后按真实大小修正
+OUTPUT_SIZE_FACTOR = 1.2
+
+
+class DiskBudgetExceeded(RuntimeError):
+    pass
+
+
+class DiskBudget:
+    def __init__(self, limit_bytes: int = 0) -> None:
+        self.limit_bytes = limit_bytes
+        self._used = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def used_bytes(self) -> int:
+        with self._cond:
+            return self._used
+
+    def reserve(self, nbytes: int, cancel_token: CancelToken | None = None) -> Reservation:
+        nbytes = self._clamp(nbytes)
+        with self._cond:
+            while not self._fits(nbytes):
+                self._raise_if_stuck()
+                raise_if_cancelled(cancel_token)
+                self._cond.wait(0.5)
+            self._take(nbytes)
+        return Reservation(self, nbytes)
+
+    async def reserve_async(self, nbytes: int) -> Reservation:
+        nbytes = self._clamp(nbytes)
+        while True:
+            with self._cond:
+                if self._fits(nbytes):
+                    self._take(nbytes)
+                    return Reservation(self, nbytes)
+                self._raise_if_stuck()
+            await asyncio.sleep(0.2)
+
+    def _clamp(self, nbytes: int) -> int:
+        # 单个任务超过整体预算时按整体预算占用，保证它至少能独占运行
+        if self.limit_bytes <= 0:
+            return max(nbytes, 0)
+        return min(max(nbytes, 0), self.limit_bytes)
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.limit_bytes <= 0 or self._used + nbytes <= self.limit_bytes
+
+    def _raise_if_stuck(self) -> None:
+        # 没有进行中的任务可释放空间时，预算只会被已完成输出占满，继续等待会死锁
+        if self._in_flight == 0:
+            raise DiskBudgetExceeded("磁盘预算不足：已完成的输出占满了缓存目录")
+
+    def _take(self, nbytes: int) -> None:
+        self._used += nbytes
+        self._in_flight += 1
+
+    def _update(self, delta: int, finished: bool) -> None:
+        with self._cond:
+            self._used = max(self._used + delta, 0)
+            if finished:
+                self._in_flight -= 1
+            self._cond.notify_all()
+
+
+class Reservation:
+    def __init__(self, budget: DiskBudget, nbytes: int) -> None:
+        self._budget = budget
+        self.nbytes = nbytes
+        self._in_flight = True
+
+    def resize(self, nbytes: int) -> None:
+        # 用真实大小修正预估值；不阻塞，允许短暂超出预算
+        self._budget._update(nbytes - self.nbytes, finished=False)
+        self.nbytes = nbytes
+
+    def settle(self, nbytes: int) -> None:
+        # 任务结束但输出仍留在缓存目录：保留占用，不再计入进行中
+        if not self._in_flight:
+            self.resize(nbytes)
+            return
+        self._in_flight = False
+        self._budget._update(nbytes - self.nbytes, finished=True)
+        self.nbytes = nbytes
+
+    def release(self) -> None:
+        self._budget._update(-self.nbytes, finished=self._in_flight)
+        self._in_flight = False
+        self.nbytes = 0
+
+
+def estimate_task_bytes(source_bytes: int, endcard_bytes: int) -> int:
+    return source_bytes + predict_output_bytes(source_bytes, endcard_bytes)
+
+
+def predict_output_bytes(source_bytes: int, endcard_bytes: int) -> int:
+    return int(source_bytes * OUTPUT_SIZE_FACTOR) + endcard_bytes
+
+
+def create_work_dir(config: Config) -> Path:
+    spool_root = config.spool_dir
+    if spool_root is not None:
+        spool_root.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix="video_splice_", dir=spool_root))
+
+
+def create_deliver_dir(config: Config) -> Path | None:
+    if config.deliver_dir is None:
+        return None
+    config.deliver_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return Path(tempfile.mkdtemp(prefix=f"batch-{timestamp}-", dir=config.deliver_dir))
+
+
+def deliver_output(output_path: Path, deliver_dir: Path) -> Path:
+    destination = deliver_dir / output_path.name
+    shutil.move(str(output_path), str(destination))
+    return destination
+
+
+def file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
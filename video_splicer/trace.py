@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, TypeVar
+
+
+T = TypeVar("T")
+
+TRACE_FILE_NAME = "trace.json"
+
+
+class BatchTrace:
+    # 记录一个批次内各阶段的耗时区间，导出为 Chrome trace-event 格式，
+    # 可直接拖进 chrome://tracing 或 ui.perfetto.dev 查看
+    def __init__(self) -> None:
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._events: list[dict[str, Any]] = []
+        self._lanes: dict[str, int] = {}
+
+    def now(self) -> float:
+        return time.perf_counter()
+
+    def add_span(
+        self,
+        name: str,
+        category: str,
+        started_at: float,
+        ended_at: float,
+        lane: str | None = None,
+        args: dict[str, Any] | None = None,
+    ) -> None:
+        thread_name = threading.current_thread().name
+        lane = lane or thread_name
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((started_at - self._origin) * 1_000_000, 1),
+            "dur": round(max(ended_at - started_at, 0.0) * 1_000_000, 1),
+            "pid": self._pid,
+            "args": {"thread": thread_name, "worker": lane, **(args or {})},
+        }
+        with self._lock:
+            event["tid"] = self._lanes.setdefault(lane, len(self._lanes) + 1)
+            self._events.append(event)
+
+    def span_count(self) -> int:
+        with self._lock:
+            return len(self._events)
+
+    def to_json(self) -> bytes:
+        with self._lock:
+            events = list(self._events)
+            lanes = dict(self._lanes)
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self._pid,
+                "tid": tid,
+                "args": {"name": lane},
+            }
+            for lane, tid in lanes.items()
+        ]
+        payload = {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+        return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+# 当前线程 / asyncio 任务所属的批次记录与泳道；未启用时所有埋点都是空操作
+_active: contextvars.ContextVar[tuple[BatchTrace, str | None] | None] = contextvars.ContextVar(
+    "sp_batch_trace", default=None
+)
+
+
+@contextmanager
+def activate(trace: BatchTrace | None, lane: str | None = None) -> Iterator[None]:
+    if trace is None:
+        yield
+        return
+    reset = _active.set((trace, lane))
+    try:
+        yield
+    finally:
+        _active.reset(reset)
+
+
+def bind_lane(lane: str) -> None:
+    # asyncio 任务各自持有一份上下文副本，在任务内设置泳道不会影响其它任务
+    scope = _active.get()
+    if scope is not None:
+        _active.set((scope[0], lane))
+
+
+@contextmanager
+def span(name: str, category: str, **args: Any) -> Iterator[dict[str, Any]]:
+    scope = _active.get()
+    extra: dict[str, Any] = dict(args)
+    if scope is None:
+        yield extra
+        return
+    trace, lane = scope
+    started_at = trace.now()
+    try:
+        yield extra
+    except BaseException as exc:
+        extra.setdefault("error", type(exc).__name__)
+        raise
+    finally:
+        trace.add_span(name, category, started_at, trace.now(), lane=lane, args=extra)
+
+
+def record_span(name: str, category: str, started_at: float, **args: Any) -> None:
+    scope = _active.get()
+    if scope is not None:
+        trace, lane = scope
+        trace.add_span(name, category, started_at, trace.now(), lane=lane, args=args)
+
+
+def propagate(fn: Callable[[], T]) -> Callable[[], T]:
+    # 线程池不会继承上下文；交给子线程的任务带上当前上下文的副本
+    # （批次记录、资源汇总等），时间线泳道则按子线程区分
+    context = contextvars.copy_context()
+
+    def run() -> T:
+        return context.run(_run_in_thread_lane, fn)
+
+    return run
+
+
+def _run_in_thread_lane(fn: Callable[[], T]) -> T:
+    scope = _active.get()
+    if scope is not None:
+        _active.set((scope[0], None))
+    return fn()
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable
+
+
+DEFAULT_FLUSH_INTERVAL_SEC = 0.25
+DEFAULT_MAX_LOG_LINES = 500
+
+
+@dataclass(frozen=True)
+class UiDelta:
+    new_lines: list[str] = field(default_factory=list)
+    progress: tuple[int, int] | None = None
+
+
+def _timestamp() -> str:
+    return datetime.now().strftime("%H:%M:%S")
+
+
+class UiEventBus:
+    def __init__(
+        self,
+        flush_interval_sec: float = DEFAULT_FLUSH_INTERVAL_SEC,
+        max_lines: int = DEFAULT_MAX_LOG_LINES,
+        clock: Callable[[], float] = time.monotonic,
+        timestamp: Callable[[], str] = _timestamp,
+    ) -> None:
+        self.flush_interval_sec = flush_interval_sec
+        self._clock = clock
+        self._timestamp = timestamp
+        self._lock = threading.Lock()
+        # 日志只保留最近 max_lines 行，长批次不会无限增长
+        self._lines: deque[str] = deque(maxlen=max_lines)
+        self._pending: deque[str] = deque(maxlen=max_lines)
+        self._progress: tuple[int, int] | None = None
+        self._progress_dirty = False
+        self._last_flush_at: float | None = None
+
+    def log(self, message: str) -> None:
+        line = f"[{self._timestamp()}] {message}"
+        with self._lock:
+            self._lines.append(line)
+            self._pending.append(line)
+
+    def progress(self, done: int, total: int) -> None:
+        with self._lock:
+            if self._progress != (done, total):
+                self._progress = (done, total)
+                self._progress_dirty = True
+
+    def poll(self, force: bool = False) -> UiDelta | None:
+        # 到达刷新间隔（或强制刷新）且有变化时，返回自上次刷新以来的增量
+        with self._lock:
+            now = self._clock()
+            if not force and self._last_flush_at is not None:
+                if now - self._last_flush_at < self.flush_interval_sec:
+                    return None
+            if not self._pending and not self._progress_dirty:
+                return None
+            delta = UiDelta(
+                new_lines=list(self._pending),
+                progress=self._progress if self._progress_dirty else None,
+            )
+            self._pending.clear()
+            self._progress_dirty = False
+            self._last_flush_at = now
+            return delta
+
+    def lines(self, last: int | None = None) -> list[str]:
+        with self._lock:
+            if last is None or last >= len(self._lines):
+                return list(self._lines)
+            return list(self._lines)[-last:]
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import importlib
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from .child_process import run_child
+from .config import load_config, validate_runtime
+from .endcard_pool import warm_endcards
+from .metrics import STARTUP_SECONDS
+from .models import Config
+
+
+# 启动器写入的启动时刻（Unix 时间戳），用于计算各阶段的启动耗时
+LAUNCH_ENV = "SP_LAUNCH_STARTED_AT"
+# 应用首次渲染要加载的依赖：Streamlit 起服务时只加载了服务端，页面元素 API 仍是冷的；
+# 本包各模块（连带 pandas / pyarrow / openpyxl / aiohttp）在导入本模块时已一并加载
+WARM_MODULES = ("streamlit", "streamlit.elements.arrow", "streamlit.dataframe_util")
+# 首次执行打包进来的二进制时系统要做签名与安全扫描，提前各执行一次
+WARM_PROGRAMS = ("ffmpeg", "ffprobe")
+WARM_TIMEOUT_SEC = 60
+PHASE_LABELS = {"server_ready": "服务就绪", "first_render": "首屏", "warmup": "预热完成"}
+
+
+@dataclass
+class Warmup:
+    # 各步骤耗时（秒）
+    steps: dict[str, float] = field(default_factory=dict)
+    runtime_errors: list[str] = field(default_factory=list)
+    endcards: int = 0
+    error: str = ""
+    done: threading.Event = field(default_factory=threading.Event)
+
+    def describe(self) -> str:
+        parts = [f"{name} {seconds:.2f}s" for name, seconds in self.steps.items()]
+        parts.append(f"落版 {self.endcards} 个")
+        if self.runtime_errors:
+            parts.append("前置检查未通过: " + "；".join(self.runtime_errors))
+        if self.error:
+            parts.append(f"预热中断: {self.error}")
+        return "后台预热：" + "，".join(parts)
+
+
+_warmup_lock = threading.Lock()
+_warmup: Warmup | None = None
+_startup_lock = threading.Lock()
+_startup: dict[str, float] = {}
+
+
+def start_warmup(config: Config | None = None) -> Warmup:
+    # 每个进程只预热一次；启动器在 Streamlit 起服务的同时调用，应用首次渲染时再调用也无妨
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = Warmup()
+            threading.Thread(
+                target=_run, args=(_warmup, config), name="sp-warmup", daemon=True
+            ).start()
+        return _warmup
+
+
+def get_warmup() -> Warmup | None:
+    with _warmup_lock:
+        return _warmup
+
+
+def record_startup(phase: str, elapsed_sec: float | None = None) -> float | None:
+    # 每个阶段只记第一次；不是经由启动器启动时没有起点，不记录
+    if elapsed_sec is None:
+        elapsed_sec = launch_elapsed_sec()
+        if elapsed_sec is None:
+            return None
+    with _startup_lock:
+        if phase in _startup:
+            return _startup[phase]
+        _startup[phase] = elapsed_sec
+    STARTUP_SECONDS.set(round(elapsed_sec, 3), phase=phase)
+    return elapsed_sec
+
+
+def launch_elapsed_sec() -> float | None:
+    raw = os.environ.get(LAUNCH_ENV)
+    if not raw:
+        return None
+    try:
+        return max(time.time() - float(raw), 0.0)
+    except ValueError:
+        return None
+
+
+def format_startup() -> str:
+    with _startup_lock:
+        phases = dict(_startup)
+    parts = [
+        f"{label} {phases[phase]:.2f} 秒" for phase, label in PHASE_LABELS.items() if phase in phases
+    ]
+    return "启动耗时：" + "，".join(parts) if parts else ""
+
+
+def _run(warmup: Warmup, config: Config | None) -> None:
+    # 预热失败不影响应用本身，相应的问题会在批次里照常暴露
+    try:
+        config = config or load_config()
+        with _step(warmup, "imports"):
+            for name in WARM_MODULES:
+                try:
+                    importlib.import_module(name)
+                except ImportError:
+                    continue
+        with _step(warmup, "runtime_checks"):
+            warmup.runtime_errors = validate_runtime(config)
+            for program in WARM_PROGRAMS:
+                if shutil.which(program) is not None:
+                    run_child([program, "-version"], timeout_sec=WARM_TIMEOUT_SEC)
+        with _step(warmup, "endcards"):
+            warmup.endcards = warm_endcards(config)
+    except Exception as exc:  # noqa: BLE001
+        warmup.error = str(exc)
+    finally:
+        warmup.done.set()
+        record_startup("warmup")
+
+
+@contextmanager
+def _step(warmup: Warmup, name: str) -> Iterator[None]:
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        warmup.steps[name] = round(time.perf_counter() - started_at, 3)
@@ -47,6 +47,7 @@ pkg_metadata = _safe_copy_metadata(
     'altair',
     'pandas',
     'requests',
+    'aiohttp',
     'rich',
     'importlib_metadata',
     'click',
@@ -74,16 +75,39 @@ hiddenimports = streamlit_hiddenimports + [
     # 项目模块（app.py 的 import 在 exec 时解析，PyInstaller 分析不到）
     'video_splicer',
     'video_splicer.artifact',
+    'video_splicer.artifact_store',
+    'video_splicer.async_runner',
+    'video_splicer.batch_job',
+    'video_splicer.calibration',
+    'video_splicer.cancellation',
+    'video_splicer.cdn_simulator',
+    'video_splicer.child_process',
     'video_splicer.config',
+    'video_splicer.download_bench',
+    'video_splicer.download_governor',
     'video_splicer.downloader',
+    'video_splicer.endcard_pool',
+    'video_splicer.execution_service',
     'video_splicer.ffmpeg_pipeline',
+    'video_splicer.history',
     'video_splicer.input_parser',
+    'video_splicer.metrics',
     'video_splicer.models',
+    'video_splicer.mp4_probe',
+    'video_splicer.planner',
+    'video_splicer.preflight',
+    'video_splicer.result_store',
     'video_splicer.runner',
+    'video_splicer.segment_encoder',
+    'video_splicer.spool',
+    'video_splicer.trace',
+    'video_splicer.ui_events',
+    'video_splicer.warmup',
     # 第三方库
     'pandas',
     'openpyxl',
     'requests',
+    'aiohttp',
     'altair',
     'click',
     'tornado',